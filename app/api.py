@@ -0,0 +1,281 @@
+import hashlib
+from datetime import date, timedelta
+
+from flask import Blueprint, abort, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import func
+
+from .extensions import db
+from .loading import DOCTOR_DETAILS, DOCTOR_JOINED_USER, planned
+from .messages import message_history
+from .models import Appointment, Availability, DoctorProfile, Message, MessageArchive, User
+from .patient import build_slots
+from .replicas import read_only
+from .reviews import review_page
+from .rollups import doctor_analytics, watermark
+from .waitlist import holds_version
+
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+MAX_PER_PAGE = 100
+
+
+def make_etag(*parts):
+    return hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def cached_json(etag, build):
+    """Return 304 if the client already has `etag`, otherwise serialize build().
+
+    The ETag is computed from cheap version columns before anything is
+    loaded, so an unchanged resource costs one aggregate query and no body.
+    """
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Clients must revalidate, but may keep the body
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response
+
+
+def doctor_summary(doctor):
+    return {
+        "id": doctor.id,
+        "name": doctor.user.name,
+        "specialization": doctor.specialization,
+        "experience": doctor.experience,
+        "fees": doctor.fees,
+        "city": doctor.clinic_city,
+        "profile_pic": doctor.profile_pic,
+    }
+
+
+def appointment_summary(appt):
+    return {
+        "id": appt.id,
+        "doctor_id": appt.doctor_id,
+        "patient_id": appt.patient_id,
+        "date": appt.date,
+        "time": appt.time,
+        "status": appt.status,
+        "consultation_type": appt.consultation_type,
+    }
+
+
+@api.route("/doctors")
+@read_only
+def doctors():
+    search = request.args.get("search")
+    page = request.args.get("page", 1, type=int)
+    per_page = min(request.args.get("per_page", 20, type=int), MAX_PER_PAGE)
+
+    query = DoctorProfile.query.join(DoctorProfile.user).options(*planned(DOCTOR_JOINED_USER))
+    if search:
+        query = query.filter(
+            (DoctorProfile.specialization.ilike(f"%{search}%")) |
+            (User.name.ilike(f"%{search}%"))
+        )
+
+    total, last_update, last_id = query.with_entities(
+        func.count(DoctorProfile.id), func.max(DoctorProfile.updated_at), func.max(DoctorProfile.id)
+    ).one()
+    etag = make_etag("doctors", search, page, per_page, total, last_update, last_id)
+
+    def build():
+        doctors = query.order_by(DoctorProfile.id).offset((page - 1) * per_page).limit(per_page).all()
+        return {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "doctors": [doctor_summary(d) for d in doctors],
+        }
+
+    return cached_json(etag, build)
+
+
+@api.route("/doctors/<int:id>")
+@read_only
+def doctor_detail(id):
+    updated_at = db.session.query(DoctorProfile.updated_at).filter_by(id=id).first()
+    if updated_at is None:
+        abort(404)
+    etag = make_etag("doctor", id, updated_at[0])
+
+    def build():
+        doctor = DoctorProfile.query.options(*DOCTOR_DETAILS).filter_by(id=id).one()
+        data = doctor_summary(doctor)
+        data.update({
+            "secondary_specialization": doctor.secondary_specialization,
+            "about": doctor.about,
+            "medical_degree": doctor.medical_degree,
+            "medical_school": doctor.medical_school,
+            "board_certifications": doctor.board_certifications,
+            "areas_of_expertise": doctor.areas_of_expertise,
+            "clinic": {
+                "name": doctor.clinic_name,
+                "address": doctor.clinic_address,
+                "city": doctor.clinic_city,
+                "state": doctor.clinic_state,
+                "country": doctor.clinic_country,
+                "zip_code": doctor.clinic_zip_code,
+            },
+        })
+        return data
+
+    return cached_json(etag, build)
+
+
+@api.route("/doctors/<int:id>/slots")
+@read_only
+def doctor_slots(id):
+    if db.session.query(DoctorProfile.id).filter_by(id=id).first() is None:
+        abort(404)
+
+    # Slots depend on the availability rows, the doctor's appointments, open waitlist offers and today's date
+    avail_count, avail_last = db.session.query(
+        func.count(Availability.id), func.max(Availability.id)
+    ).filter(Availability.doctor_id == id).one()
+    appt_count, appt_versions = db.session.query(
+        func.count(Appointment.id), func.sum(Appointment.version)
+    ).filter(Appointment.doctor_id == id).one()
+    etag = make_etag(
+        "slots", id, date.today(), avail_count, avail_last, appt_count, appt_versions, *holds_version(id)
+    )
+
+    def build():
+        return {"doctor_id": id, "days": build_slots(id)}
+
+    return cached_json(etag, build)
+
+
+@api.route("/doctors/<int:id>/reviews")
+@read_only
+def doctor_reviews(id):
+    """Newest-first pages of a doctor's reviews; follow `next_before` for older ones."""
+    totals = db.session.query(DoctorProfile.review_count, DoctorProfile.rating_sum).filter_by(id=id).first()
+    if totals is None:
+        abort(404)
+    before = request.args.get("before", type=int)
+    # A new review bumps the doctor's count
+    etag = make_etag("reviews", id, before, *totals)
+
+    def build():
+        reviews, next_before = review_page(id, before)
+        review_count, rating_sum = totals
+        return {
+            "doctor_id": id,
+            "review_count": review_count or 0,
+            "average_rating": round(rating_sum / review_count, 1) if review_count else None,
+            "reviews": [dict(review, created_at=review["created_at"].isoformat()) for review in reviews],
+            "next_before": next_before,
+        }
+
+    return cached_json(etag, build)
+
+
+@api.route("/appointments")
+@read_only
+def appointments():
+    if not current_user.is_authenticated:
+        abort(401)
+
+    if current_user.role == "doctor":
+        condition = Appointment.doctor_id == current_user.doctor_profile.id
+    else:
+        condition = Appointment.patient_id == current_user.patient_profile.id
+
+    status = request.args.get("status")
+    query = Appointment.query.filter(condition)
+    if status:
+        query = query.filter(Appointment.status == status)
+
+    count, versions, last_id = query.with_entities(
+        func.count(Appointment.id), func.sum(Appointment.version), func.max(Appointment.id)
+    ).one()
+    etag = make_etag("appointments", current_user.id, status, count, versions, last_id)
+
+    def build():
+        appts = query.order_by(Appointment.date, Appointment.time).all()
+        return {"appointments": [appointment_summary(a) for a in appts]}
+
+    return cached_json(etag, build)
+
+
+@api.route("/appointments/<int:id>/messages")
+@read_only
+def appointment_messages(id):
+    if not current_user.is_authenticated:
+        abort(401)
+    appt = Appointment.query.get_or_404(id)
+    if current_user.role == "doctor":
+        allowed = appt.doctor_id == current_user.doctor_profile.id
+    else:
+        allowed = appt.patient_id == current_user.patient_profile.id
+    if not allowed:
+        abort(404)
+
+    # New messages add rows and archiving adds a segment, so counts and max ids identify the history
+    hot_count, hot_last = db.session.query(
+        func.count(Message.id), func.max(Message.id)
+    ).filter(Message.appointment_id == id).one()
+    archive_count, archive_last = db.session.query(
+        func.count(MessageArchive.id), func.max(MessageArchive.id)
+    ).filter(MessageArchive.appointment_id == id).one()
+    etag = make_etag("messages", id, hot_count, hot_last, archive_count, archive_last)
+
+    def build():
+        return {"appointment_id": id, "messages": [
+            {
+                "id": m.id,
+                "sender_id": m.sender_id,
+                "content": m.content,
+                "timestamp": m.timestamp.isoformat(),
+            }
+            for m in message_history(id)
+        ]}
+
+    return cached_json(etag, build)
+
+
+@api.route("/analytics")
+@read_only
+def analytics():
+    """The signed-in doctor's bookings, revenue, cancellation rate and rating over a date range.
+
+    Served from the daily rollups, so any range costs two indexed range
+    scans; figures are current as of the rollup watermark ("as_of").
+    """
+    if not current_user.is_authenticated:
+        abort(401)
+    if current_user.role != "doctor":
+        abort(403)
+
+    try:
+        end = date.fromisoformat(request.args.get("to") or str(date.today()))
+        start = date.fromisoformat(request.args.get("from") or str(end - timedelta(days=29)))
+    except ValueError:
+        abort(400)
+    by = request.args.get("by", "day")
+    if by not in ("day", "week", "month") or start > end:
+        abort(400)
+
+    doctor_id = current_user.doctor_profile.id
+    as_of = watermark()
+    etag = make_etag("analytics", doctor_id, start, end, by, as_of)
+
+    def build():
+        data = {
+            "doctor_id": doctor_id,
+            "from": str(start),
+            "to": str(end),
+            "by": by,
+            "as_of": as_of.isoformat() if as_of else None,
+        }
+        data.update(doctor_analytics(doctor_id, start, end, by))
+        return data
+
+    return cached_json(etag, build)
@@ -0,0 +1,115 @@
+import os
+
+from flask import Blueprint, current_app, has_app_context, jsonify
+from sqlalchemy import event
+
+from .cache import TaggedCache, make_backend
+from .metrics import operator_only
+from .replicas import RoutingSession, primary_reads
+
+
+cache_stats = Blueprint("cache_stats", __name__)
+
+
+def model_tags(obj):
+    """Cache tags made stale when `obj` is inserted, updated or deleted."""
+    from .models import Appointment, Availability, DoctorProfile, Review, User
+
+    if isinstance(obj, DoctorProfile):
+        return {f"doctor:{obj.id}", "doctor-directory"}
+    if isinstance(obj, User):
+        # Doctor names are part of the directory
+        return {f"user:{obj.id}", "doctor-directory"} if obj.role == "doctor" else {f"user:{obj.id}"}
+    if isinstance(obj, Availability):
+        return {f"doctor:{obj.doctor_id}:availability"}
+    if isinstance(obj, Appointment):
+        return {f"doctor:{obj.doctor_id}:appointments", f"patient:{obj.patient_id}:appointments"}
+    if isinstance(obj, Review):
+        return {f"doctor:{obj.doctor_id}:reviews"}
+    return set()
+
+
+def cached(key, build, tags=()):
+    """Return the cached value of `key`, calling build() on a miss.
+
+        total = cached("doctor-count", DoctorProfile.query.count, tags=["doctor-directory"])
+
+    Values must be picklable plain data (not ORM objects) when the
+    filesystem backend is used.
+    """
+    cache = current_app.extensions.get("app_cache")
+    if cache is None:
+        return build()
+
+    def build_on_primary():
+        # Entries are stored under the current tag tokens, so they must not be
+        # built from a lagging replica that has not seen the commits behind them
+        with primary_reads():
+            return build()
+
+    return cache.get_or_set(key, build_on_primary, tags)
+
+
+def invalidate(*tags):
+    cache = current_app.extensions.get("app_cache")
+    if cache is not None and tags:
+        cache.invalidate(*tags)
+
+
+def invalidate_on_commit(*tags):
+    """Invalidate `tags` when the current transaction commits.
+
+    For writes the flush hooks cannot see, such as bulk `query.delete()`.
+    """
+    from .extensions import db
+    db.session.info.setdefault("cache_tags", set()).update(tags)
+
+
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault("cache_tags", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags |= model_tags(obj)
+
+
+def _invalidate_committed(session):
+    tags = session.info.pop("cache_tags", None)
+    if tags and has_app_context():
+        invalidate(*sorted(tags))
+
+
+def _discard_tags(session):
+    session.info.pop("cache_tags", None)
+
+
+# Tags are gathered per flush but only invalidated once the commit succeeds
+event.listen(RoutingSession, "after_flush", _collect_tags)
+event.listen(RoutingSession, "after_commit", _invalidate_committed)
+event.listen(RoutingSession, "after_rollback", _discard_tags)
+
+
+@cache_stats.route("/cache/stats")
+@operator_only
+def stats():
+    return jsonify({
+        name: current_app.extensions[name].stats()
+        for name in ("app_cache", "fragment_cache")
+        if name in current_app.extensions
+    })
+
+
+def init_app_cache(app):
+    directory = app.config.get("APP_CACHE_DIR") or os.path.join(app.instance_path, "app-cache")
+    backend = make_backend(
+        app.config["APP_CACHE_BACKEND"],
+        max_entries=app.config["APP_CACHE_SIZE"],
+        directory=directory,
+        ttl=app.config["APP_CACHE_TTL"],
+    )
+    tag_backend = None
+    if app.config["APP_CACHE_BACKEND"] != "filesystem":
+        # Values stay per worker, but tag tokens are shared by every worker on the host,
+        # so a commit in one worker invalidates the others' entries too
+        tag_backend = make_backend("filesystem", app.config["APP_CACHE_SIZE"], directory.rstrip(os.sep) + "-tags")
+    app.extensions["app_cache"] = TaggedCache(backend, tag_backend)
+    app.register_blueprint(cache_stats)
+    return app.extensions["app_cache"]
@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+
+# Files that go through the build; everything else is served by the plain static route
+ASSET_FILES = ("style.css", "script.js")
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+
+assets = Blueprint("assets", __name__, url_prefix="/assets")
+
+
+def dist_dir():
+    return os.path.join(current_app.static_folder, DIST_DIR)
+
+
+def load_manifest():
+    """Map of source name -> fingerprinted name, re-read whenever the manifest file changes.
+
+    A missing or empty manifest is never kept, so workers started before
+    `flask assets build` pick up the build without a restart.
+    """
+    path = os.path.join(dist_dir(), MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    loaded = current_app.extensions.get("asset_manifest")
+    if loaded is not None and loaded[0] == mtime:
+        return loaded[1]
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        # Missing, or caught mid-write by a build
+        return {}
+    if manifest:
+        current_app.extensions["asset_manifest"] = (mtime, manifest)
+    return manifest
+
+
+def asset_url(filename):
+    """Drop-in for url_for('static', filename=...) that prefers the built, fingerprinted copy."""
+    hashed = load_manifest().get(filename)
+    if hashed:
+        return url_for("assets.serve", filename=hashed)
+    return url_for("static", filename=filename)
+
+
+@assets.route("/<path:filename>")
+def serve(filename):
+    directory = dist_dir()
+    accepted = request.accept_encodings
+    encoding = None
+    for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if accepted[candidate] and os.path.exists(os.path.join(directory, filename + suffix)):
+            encoding = candidate
+            break
+
+    if encoding:
+        response = send_from_directory(
+            directory,
+            filename + (".br" if encoding == "br" else ".gz"),
+            mimetype=_mimetype(filename),
+        )
+        response.content_encoding = encoding
+    else:
+        response = send_from_directory(directory, filename)
+
+    # The name changes whenever the content does, so the file can be cached forever
+    response.vary.add("Accept-Encoding")
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+
+def _mimetype(filename):
+    if filename.endswith(".css"):
+        return "text/css"
+    if filename.endswith(".js"):
+        return "text/javascript"
+    return None
+
+
+def build_assets(static_folder):
+    """Write fingerprinted, precompressed copies of ASSET_FILES into static/dist."""
+    import brotli
+
+    directory = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+
+    for name in ASSET_FILES:
+        with open(os.path.join(static_folder, name), "rb") as f:
+            content = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+        with open(os.path.join(directory, hashed), "wb") as f:
+            f.write(content)
+        with open(os.path.join(directory, hashed + ".gz"), "wb") as f:
+            # mtime=0 keeps the output byte-identical between builds
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        with open(os.path.join(directory, hashed + ".br"), "wb") as f:
+            f.write(brotli.compress(content, quality=11))
+
+        manifest[name] = hashed
+
+    # Replaced atomically: running workers re-read it as soon as it changes
+    with open(os.path.join(directory, MANIFEST + ".tmp"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(os.path.join(directory, MANIFEST + ".tmp"), os.path.join(directory, MANIFEST))
+
+    # Remove builds of older content
+    keep = set(manifest.values())
+    for existing in os.listdir(directory):
+        base = existing[:-3] if existing.endswith((".gz", ".br")) else existing
+        if existing != MANIFEST and base not in keep:
+            os.remove(os.path.join(directory, existing))
+
+    return manifest
+
+
+def css_selectors(css):
+    """Yield (selector, class/id names) for every style rule, including those nested in @media."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    prelude = []
+    for char in css:
+        if char == "{":
+            text = "".join(prelude).strip()
+            prelude = []
+            # At-rule preludes (@media, @keyframes) and keyframe steps are not selectors
+            if text.startswith("@") or re.match(r"^(from|to|[\d.%\s,]+)$", text):
+                continue
+            for selector in text.split(","):
+                selector = selector.strip()
+                names = re.findall(r"[.#](-?[A-Za-z_][\w-]*)", re.sub(r"\[[^\]]*\]|\([^)]*\)", "", selector))
+                if names:
+                    yield selector, names
+        elif char in "};":
+            prelude = []
+        else:
+            prelude.append(char)
+
+
+def unused_selectors(static_folder, template_folder):
+    """Selectors whose class or id names never appear in the templates or script.js."""
+    sources = []
+    for root, _dirs, files in os.walk(template_folder):
+        for name in files:
+            if name.endswith(".html"):
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    sources.append(f.read())
+    with open(os.path.join(static_folder, "script.js"), encoding="utf-8") as f:
+        sources.append(f.read())
+    tokens = set(re.findall(r"[A-Za-z_][\w-]*", "\n".join(sources)))
+
+    with open(os.path.join(static_folder, "style.css"), encoding="utf-8") as f:
+        css = f.read()
+    return [selector for selector, names in css_selectors(css) if not all(n in tokens for n in names)]
+
+
+@click.group("assets")
+def assets_cli():
+    """Build and audit static assets."""
+
+
+@assets_cli.command("build")
+@with_appcontext
+def build_command():
+    """Fingerprint and precompress the CSS/JS bundles."""
+    manifest = build_assets(current_app.static_folder)
+    for name, hashed in manifest.items():
+        size = os.path.getsize(os.path.join(dist_dir(), hashed))
+        gz = os.path.getsize(os.path.join(dist_dir(), hashed + ".gz"))
+        br = os.path.getsize(os.path.join(dist_dir(), hashed + ".br"))
+        click.echo(f"{name} -> {hashed}  {size} B, gzip {gz} B, brotli {br} B")
+
+
+@assets_cli.command("unused-css")
+@with_appcontext
+def unused_css_command():
+    """List selectors in style.css that no template or script references."""
+    unused = unused_selectors(current_app.static_folder, os.path.join(current_app.root_path, "templates"))
+    for selector in unused:
+        click.echo(selector)
+    click.echo(f"{len(unused)} unused selectors", err=True)
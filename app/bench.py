@@ -0,0 +1,209 @@
+import gc
+import json
+import statistics
+import time
+import tracemalloc
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from .extensions import db
+from .models import Appointment, DoctorProfile, Message, PatientProfile, User
+from .seed import SEED_PASSWORD
+
+
+# A scenario fails the comparison when its p95 grows by more than this fraction of the baseline
+DEFAULT_TOLERANCE = 0.2
+
+
+class QueryCounter:
+    """Counts statements on every engine while active, including those outside a request."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(Engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, "before_cursor_execute", self._count)
+
+
+def pick_fixtures():
+    """The busiest doctor and a chat-heavy appointment of theirs; the seed skews load to low ids."""
+    doctor_id = db.session.query(func.min(DoctorProfile.id)).join(User, DoctorProfile.user_id == User.id).filter(
+        User.email.like("doctor%@seed.test")
+    ).scalar() or db.session.query(func.min(DoctorProfile.id)).scalar()
+    appt = db.session.query(Appointment).join(Message, Message.appointment_id == Appointment.id).filter(
+        Appointment.doctor_id == doctor_id
+    ).order_by(Appointment.id).first()
+    if doctor_id is None or appt is None:
+        raise click.ClickException("No doctor with chat history found; run `flask seed` first.")
+    doctor_email = db.session.query(User.email).join(DoctorProfile, DoctorProfile.user_id == User.id).filter(
+        DoctorProfile.id == doctor_id
+    ).scalar()
+    patient_email = db.session.query(User.email).join(PatientProfile, PatientProfile.user_id == User.id).filter(
+        PatientProfile.id == appt.patient_id
+    ).scalar()
+    return {"doctor_id": doctor_id, "appointment_id": appt.id, "doctor_email": doctor_email, "patient_email": patient_email}
+
+
+def scenarios(fixtures):
+    """(name, role, action) for each hot route; action(client, socket) performs one request."""
+    doctor_id, appointment_id = fixtures["doctor_id"], fixtures["appointment_id"]
+
+    def get(url):
+        def action(client, socket):
+            response = client.get(url)
+            assert response.status_code == 200, f"{url} returned {response.status_code}"
+        return action
+
+    def send_message(client, socket):
+        socket.emit("send_message", {
+            "appointment_id": appointment_id,
+            "sender_id": socket.sender_id,
+            "content": "Benchmark message",
+        })
+        socket.get_received()
+
+    return [
+        ("patient.find_doctor", "patient", get("/patient/find-doctor")),
+        ("patient.find_doctor search", "patient", get("/patient/find-doctor?search=Cardio")),
+        ("patient.doctor_preview", "patient", get(f"/patient/doctor/{doctor_id}")),
+        ("patient.consultation", "patient", get(f"/patient/consultation/{appointment_id}")),
+        ("doctor.dashboard", "doctor", get("/doctor/dashboard")),
+        ("doctor.consultation", "doctor", get(f"/doctor/consultation/{appointment_id}")),
+        ("socket send_message", "patient", send_message),
+    ]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_scenario(app, action, client, socket, iterations, warmup):
+    def call():
+        # Requests reuse an already pushed app context, and with it g (and so the
+        # logged-in user) and the db session; give each one its own, as in production
+        with app.app_context():
+            action(client, socket)
+
+    for _ in range(warmup):
+        call()
+
+    timings, queries = [], []
+    for _ in range(iterations):
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count)
+
+    # Memory is measured in a separate pass; tracemalloc would skew the timings
+    gc.collect()
+    tracemalloc.start()
+    call()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+        "mean_ms": round(statistics.mean(timings), 2),
+        "queries": max(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(iterations=50, warmup=5, only=None):
+    from . import socketio
+
+    app = current_app._get_current_object()
+    fixtures = pick_fixtures()
+    clients = {}
+    for role in ("patient", "doctor"):
+        client = app.test_client()
+        email = fixtures[f"{role}_email"]
+        with app.app_context():
+            response = client.post("/login", data={"email": email, "password": SEED_PASSWORD})
+            if response.status_code != 302:
+                raise click.ClickException(f"Could not log in as {email}")
+            socket = socketio.test_client(app, flask_test_client=client)
+            socket.emit("join", {"appointment_id": fixtures["appointment_id"]})
+        socket.sender_id = db.session.query(User.id).filter_by(email=email).scalar()
+        clients[role] = (client, socket)
+
+    results = {}
+    for name, role, action in scenarios(fixtures):
+        if only and name not in only:
+            continue
+        results[name] = run_scenario(app, action, *clients[role], iterations, warmup)
+    for _client, socket in clients.values():
+        socket.disconnect()
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regression messages for scenarios slower, chattier or hungrier than the baseline."""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if result["queries"] > base["queries"]:
+            problems.append(f"{name}: {result['queries']} queries vs baseline {base['queries']}")
+        if result["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            problems.append(f"{name}: peak {result['peak_kib']}KiB vs baseline {base['peak_kib']}KiB")
+    return problems
+
+
+@click.command("bench")
+@click.option("--iterations", type=int, default=50, show_default=True)
+@click.option("--warmup", type=int, default=5, show_default=True)
+@click.option("--only", multiple=True, help="Scenario name to run; repeatable.")
+@click.option("--save", type=click.Path(dir_okay=False), help="Write the results here as the new baseline.")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Compare against a saved baseline.")
+@click.option("--tolerance", type=float, default=DEFAULT_TOLERANCE, show_default=True)
+@with_appcontext
+def bench_command(iterations, warmup, only, save, baseline, tolerance):
+    """Time the hot routes and socket events in-process against the local database.
+
+    Seed the database first with `flask seed`. Exits non-zero when a
+    scenario regresses against --baseline.
+    """
+    results = run_benchmarks(iterations, warmup, set(only))
+
+    click.echo(f"{'scenario':32} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'peak':>10}")
+    for name, r in results.items():
+        click.echo(
+            f"{name:32} {r['p50_ms']:>7.2f}ms {r['p95_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms "
+            f"{r['queries']:>8} {r['peak_kib']:>7.1f}KiB"
+        )
+
+    if save:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        click.echo(f"Saved baseline to {save}")
+
+    if baseline:
+        with open(baseline) as f:
+            problems = compare(results, json.load(f), tolerance)
+        for problem in problems:
+            click.echo(f"REGRESSION {problem}")
+        if problems:
+            raise SystemExit(1)
+        click.echo("No regressions against the baseline.")
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-process cache holding at most `max_entries` values, each for up to `ttl` seconds."""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+        }
+
+
+class FileSystemCache:
+    """Cache shared by every worker on the host, one pickle file per key.
+
+    Holds about `max_entries` files: every tenth of that many writes, the
+    least recently used files beyond the limit are removed (reads refresh a
+    file's mtime). Counters are per process.
+    """
+
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # Write then rename so readers in other processes never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= max(1, self.max_entries // 10)
+            if due:
+                self._writes = 0
+        if due:
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError:
+                pass
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        # Down to 90% of the limit, so the next write does not prune again
+        entries.sort()
+        removed = 0
+        for _mtime, path in entries[:excess + self.max_entries // 10]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.evictions += removed
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": sum(1 for name in os.listdir(self.directory) if not name.startswith(".tmp-")),
+        }
+
+
+def make_backend(kind, max_entries=1024, directory=None, ttl=None):
+    if kind == "filesystem":
+        return FileSystemCache(directory, max_entries)
+    return LRUCache(max_entries, ttl)
+
+
+class TaggedCache:
+    """Values stored under tags, e.g. `doctor:3`, that can be invalidated as a group.
+
+    Each tag has a random token, kept in `tag_backend` (the value backend by
+    default); entries remember the tokens they were built with and are stale
+    once any token changes. A tag whose token was evicted gets a fresh one,
+    so eviction can only cause misses, never stale hits. With per-process
+    values, a tag backend shared by the processes makes an invalidation in
+    one of them reach all.
+    """
+
+    def __init__(self, backend, tag_backend=None):
+        self.backend = backend
+        self.tag_backend = tag_backend or backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _tokens(self, tags):
+        tokens = []
+        for tag in tags:
+            token = self.tag_backend.get("tag:" + tag)
+            if token is None:
+                token = os.urandom(8).hex()
+                self.tag_backend.set("tag:" + tag, token)
+            tokens.append(token)
+        return tuple(tokens)
+
+    def get_or_set(self, key, build, tags=()):
+        tokens = self._tokens(tags)
+        entry = self.backend.get("value:" + key)
+        if entry is not None and entry[0] == tokens:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = build()
+        self.backend.set("value:" + key, (tokens, value))
+        return value
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.tag_backend.set("tag:" + tag, os.urandom(8).hex())
+        self.invalidations += len(tags)
+
+    def clear(self):
+        self.backend.clear()
+        if self.tag_backend is not self.backend:
+            self.tag_backend.clear()
+
+    def stats(self):
+        # Backend hit/miss counts include tag lookups; report the value lookups instead
+        backend = self.backend.stats()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": backend["evictions"],
+            "invalidations": self.invalidations,
+            "size": backend["size"],
+        }
@@ -1,27 +1,36 @@
 from flask import Blueprint, render_template, request, redirect, abort, current_app, flash, url_for
 from flask_login import login_required, current_user
-from .models import Appointment, Availability, PatientProfile, User, Message
+from flask_mail import Message as MailMessage
+from .models import Appointment, Availability, DoctorPatient, DoctorProfile, PatientProfile, User
+from .appcache import invalidate_on_commit
 from .extensions import db, mail
-from datetime import date
-import os
-from werkzeug.utils import secure_filename
+from .loading import APPOINTMENT_WITH_PATIENT, DOCTOR_DETAILS, PATIENT_RECORD, planned
+from .messages import message_history
+from .metrics import timed_call
+from .registry import is_patient_of
+from .replicas import read_only
+from .uploads import save_image, save_licence
+from datetime import date, datetime
 
 doctor = Blueprint("doctor", __name__, url_prefix="/doctor")
 
+PATIENTS_PER_PAGE = 20
+
 
 @doctor.route("/dashboard")
+@read_only
 @login_required
 def dashboard():
 
     doctor_id = current_user.doctor_profile.id
 
     # All appointments
-    appointments = Appointment.query.filter_by(
+    appointments = Appointment.query.options(*planned(APPOINTMENT_WITH_PATIENT)).filter_by(
         doctor_id=doctor_id
     ).order_by(Appointment.date).all()
 
     # Today appointments
-    today_appointments = Appointment.query.filter_by(
+    today_appointments = Appointment.query.options(*planned(APPOINTMENT_WITH_PATIENT)).filter_by(
         doctor_id=doctor_id,
         date=date.today()
     ).all()
@@ -49,6 +58,7 @@ def dashboard():
 
 
 @doctor.route("/appointments")
+@read_only
 @login_required
 def appointments():
 
@@ -60,7 +70,7 @@ def appointments():
     consultation_type_filter = request.args.get("consultation_type")
     search = request.args.get("search")
 
-    query = Appointment.query.filter(
+    query = Appointment.query.options(*planned(APPOINTMENT_WITH_PATIENT)).filter(
         Appointment.doctor_id == doctor_id
     )
 
@@ -130,11 +140,12 @@ def accept_appointment(id):
 
     # Send email to patient
     patient = appt.patient.user
-    msg = Message('Appointment Accepted',
-                  sender='your-email@gmail.com',
-                  recipients=[patient.email])
+    msg = MailMessage('Appointment Accepted',
+                      sender='your-email@gmail.com',
+                      recipients=[patient.email])
     msg.body = f'Your appointment with Dr. {appt.doctor.user.name} on {appt.date} at {appt.time} has been accepted. Please proceed to payment.'
-    mail.send(msg)
+    with timed_call("mail", "send"):
+        mail.send(msg)
 
     return redirect("/doctor/appointments")
 
@@ -169,6 +180,7 @@ def availability():
             doctor_id=doctor_id,
             type="weekly"
         ).delete()
+        invalidate_on_commit(f"doctor:{doctor_id}:availability")
 
         for day in ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]:
             if request.form.get(f"{day}_enabled"):
@@ -286,76 +298,92 @@ def profile():
         profile.awards_recognitions = request.form.get('awards_and_recognition') or None
         profile.research_publications = request.form.get('research___publications') or None
         profile.professional_memberships = request.form.get('professional_membership') or None
+        # Bump explicitly: name/email live on User, but cached doctor fragments key on this
+        profile.updated_at = datetime.utcnow()
         
         # Handle file upload
-        print(f"Doctor profile file: {request.files.get('doctor_profile')}")
-        print(f"Licence file: {request.files.get('upload_medical_licence')}")
-        upload_dir = os.path.join(current_app.static_folder, 'uploads')
-        print(f"Upload dir: {upload_dir}")
         if 'upload_medical_licence' in request.files:
             file = request.files['upload_medical_licence']
             if file and file.filename:
-                filename = f"{current_user.id}_{secure_filename(file.filename)}"
-                os.makedirs(upload_dir, exist_ok=True)
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                profile.licence_file = filename
+                filename = save_licence(file)
+                if filename:
+                    profile.licence_file = filename
+                else:
+                    flash("Medical licence must be a PDF, PNG or JPEG file.", "error")
         
         if 'doctor_profile' in request.files:
             file = request.files['doctor_profile']
             if file and file.filename:
-                filename = f"{current_user.id}_{secure_filename(file.filename)}"
-                os.makedirs(upload_dir, exist_ok=True)
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                profile.profile_pic = filename
-                print(f"Saved profile_pic: {profile.profile_pic}")
+                filename = save_image(file)
+                if filename:
+                    profile.profile_pic = filename
+                    current_app.logger.debug("Saved profile_pic: %s", profile.profile_pic)
+                else:
+                    flash("Profile picture must be an image.", "error")
         
         db.session.commit()
         return redirect("/doctor/profile")
+
+    # Load the deferred credential/expertise groups in one query instead of one per group
+    DoctorProfile.query.options(*DOCTOR_DETAILS).filter_by(id=current_user.doctor_profile.id).one()
     return render_template("doctor/profile.html")
 
 
+@doctor.route("/patients")
+@read_only
+@login_required
+def patients():
+    """My patients: everyone with an appointment with this doctor, most recent visit first."""
+    doctor_id = current_user.doctor_profile.id
+    search = request.args.get("search", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    query = db.session.query(DoctorPatient, User.name, PatientProfile.profile_pic).join(
+        PatientProfile, DoctorPatient.patient_id == PatientProfile.id
+    ).join(User, PatientProfile.user_id == User.id).filter(DoctorPatient.doctor_id == doctor_id)
+    if search:
+        query = query.filter(User.name.ilike(f"%{search}%"))
+    total = query.count()
+    rows = query.order_by(DoctorPatient.last_visit.desc(), DoctorPatient.patient_id.desc()).offset(
+        (page - 1) * PATIENTS_PER_PAGE
+    ).limit(PATIENTS_PER_PAGE).all()
+
+    return render_template(
+        "doctor/patients.html",
+        rows=rows,
+        search=search,
+        page=page,
+        pages=max((total + PATIENTS_PER_PAGE - 1) // PATIENTS_PER_PAGE, 1),
+        total=total,
+    )
+
+
 @doctor.route("/patient/<int:patient_id>")
+@read_only
 @login_required
 def patient_preview(patient_id):
-    patient_profile = PatientProfile.query.get_or_404(patient_id)
-    # Ensure the doctor can only view their own patients
-    # Check if there's an appointment between this doctor and patient
-    appointment = Appointment.query.filter_by(
-        doctor_id=current_user.doctor_profile.id,
-        patient_id=patient_id
-    ).first()
-    if not appointment:
-        abort(403)  # Forbidden
+    # Doctors can only view their own patients
+    if not is_patient_of(current_user.doctor_profile.id, patient_id):
+        abort(403)
+    patient_profile = PatientProfile.query.options(*PATIENT_RECORD).filter_by(id=patient_id).first_or_404()
     return render_template("doctor/patient_preview.html", patient=patient_profile)
 
 
+def recent_consultations(doctor_id):
+    """Each patient's latest non-cancelled appointment with this doctor, most recent first."""
+    return Appointment.query.options(*planned(APPOINTMENT_WITH_PATIENT)).join(
+        DoctorPatient, DoctorPatient.last_appointment_id == Appointment.id
+    ).filter(
+        DoctorPatient.doctor_id == doctor_id, DoctorPatient.visit_count > 0
+    ).order_by(DoctorPatient.last_visit.desc(), Appointment.time.desc()).all()
+
+
 @doctor.route("/consultations")
+@read_only
 @login_required
 def consultations():
-    doctor_id = current_user.doctor_profile.id
-    
-    # Get unique patients with their most recent appointment
-    from sqlalchemy import func
-    subquery = db.session.query(
-        Appointment.patient_id,
-        func.max(Appointment.date).label('max_date')
-    ).filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.status != 'cancelled'
-    ).group_by(Appointment.patient_id).subquery()
-    
-    all_appointments = Appointment.query.join(
-        subquery,
-        db.and_(
-            Appointment.patient_id == subquery.c.patient_id,
-            Appointment.date == subquery.c.max_date
-        )
-    ).filter(
-        Appointment.doctor_id == doctor_id
-    ).order_by(Appointment.date.desc(), Appointment.time.desc()).all()
-    
+    all_appointments = recent_consultations(current_user.doctor_profile.id)
+
     # Find the most recent appointment for the main chat
     appointment = all_appointments[0] if all_appointments else None
     
@@ -363,6 +391,7 @@ def consultations():
 
 
 @doctor.route("/consultation/<int:appointment_id>")
+@read_only
 @login_required
 def consultation(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
@@ -370,26 +399,8 @@ def consultation(appointment_id):
     if appointment.doctor_id != current_user.doctor_profile.id:
         abort(403)
     
-    # Get unique patients with their most recent appointment
-    from sqlalchemy import func
-    subquery = db.session.query(
-        Appointment.patient_id,
-        func.max(Appointment.date).label('max_date')
-    ).filter(
-        Appointment.doctor_id == current_user.doctor_profile.id,
-        Appointment.status != 'cancelled'
-    ).group_by(Appointment.patient_id).subquery()
-    
-    all_appointments = Appointment.query.join(
-        subquery,
-        db.and_(
-            Appointment.patient_id == subquery.c.patient_id,
-            Appointment.date == subquery.c.max_date
-        )
-    ).filter(
-        Appointment.doctor_id == current_user.doctor_profile.id
-    ).order_by(Appointment.date.desc(), Appointment.time.desc()).all()
+    all_appointments = recent_consultations(current_user.doctor_profile.id)
     
-    messages = Message.query.filter_by(appointment_id=appointment_id).order_by(Message.timestamp).all()
+    messages = message_history(appointment_id)
     
     return render_template("doctor/consultation.html", appointment=appointment, all_appointments=all_appointments, messages=messages)
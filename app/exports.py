@@ -0,0 +1,438 @@
+import csv
+import heapq
+import hmac
+import io
+import json
+import sys
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+import click
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import select, tuple_
+
+from .extensions import db
+from .messages import segment_rows
+from .models import Appointment, Message, MessageArchive, Review
+from .replicas import read_only
+
+
+exports = Blueprint("exports", __name__, url_prefix="/admin/export")
+
+# Appointments per batch of a messages export; each has a handful of messages
+APPOINTMENTS_PER_MESSAGE_BATCH = 500
+# Uncompressed bytes of archived segments read per query
+SEGMENT_PAGE_BYTES = 8 * 1024 * 1024
+
+
+class ExportError(ValueError):
+    pass
+
+
+# (name, type) per column; the first column is the resume key for `after_id`
+# (for messages, the second is the resume key for `after_message_id`)
+APPOINTMENT_COLUMNS = [
+    ("id", "int"), ("doctor_id", "int"), ("patient_id", "int"), ("status", "str"), ("date", "str"),
+    ("time", "str"), ("consultation_type", "str"), ("created_at", "datetime"), ("updated_at", "datetime"),
+]
+MESSAGE_COLUMNS = [
+    ("appointment_id", "int"), ("id", "int"), ("sender_id", "int"), ("timestamp", "datetime"), ("content", "str"),
+]
+REVIEW_COLUMNS = [
+    ("id", "int"), ("doctor_id", "int"), ("patient_id", "int"), ("rating", "int"), ("comment", "str"),
+    ("created_at", "datetime"),
+]
+
+
+def parse_filters(doctor_id=None, start=None, end=None, status=None):
+    """Validated filters; dates accept date objects or YYYY-MM-DD strings."""
+    try:
+        start = date.fromisoformat(start) if isinstance(start, str) and start else start or None
+        end = date.fromisoformat(end) if isinstance(end, str) and end else end or None
+    except ValueError:
+        raise ExportError("Dates must be YYYY-MM-DD")
+    if start and end and start > end:
+        raise ExportError("'from' is after 'to'")
+    return {"doctor_id": doctor_id, "start": start, "end": end, "status": status or None}
+
+
+def _appointment_filters(query, filters):
+    if filters["doctor_id"]:
+        query = query.where(Appointment.doctor_id == filters["doctor_id"])
+    if filters["start"]:
+        query = query.where(Appointment.date >= str(filters["start"]))
+    if filters["end"]:
+        query = query.where(Appointment.date <= str(filters["end"]))
+    if filters["status"]:
+        query = query.where(Appointment.status == filters["status"])
+    return query
+
+
+def keyset_batches(query, key, after_id, limit, batch_size):
+    """Batches of `query` ordered by `key`, each fetched with `key > last seen`.
+
+    Every batch is a short indexed range read, so memory stays flat, no
+    cursor is held open between batches, and any position can be resumed.
+    """
+    query = query.order_by(key)
+    sent = 0
+    while limit is None or sent < limit:
+        size = batch_size if limit is None else min(batch_size, limit - sent)
+        rows = db.session.execute(query.where(key > after_id).limit(size)).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < size:
+            return
+        sent += len(rows)
+        after_id = rows[-1][0]
+
+
+def appointment_batches(filters, after_id, limit, batch_size):
+    query = _appointment_filters(select(
+        Appointment.id, Appointment.doctor_id, Appointment.patient_id, Appointment.status, Appointment.date,
+        Appointment.time, Appointment.consultation_type, Appointment.created_at, Appointment.updated_at,
+    ), filters)
+    return keyset_batches(query, Appointment.id, after_id, limit, batch_size)
+
+
+def _hot_messages(appointment_ids, after, page_size):
+    """Hot messages of `appointment_ids` after the (appointment_id, id) pair `after`, paged in SQL."""
+    query = select(
+        Message.appointment_id, Message.id, Message.sender_id, Message.timestamp, Message.content,
+    ).where(Message.appointment_id.in_(appointment_ids)).order_by(Message.appointment_id, Message.id)
+    while True:
+        page = db.session.execute(
+            query.where(tuple_(Message.appointment_id, Message.id) > after).limit(page_size)
+        ).all()
+        yield from page
+        if len(page) < page_size:
+            return
+        after = (page[-1][0], page[-1][1])
+
+
+def _archived_messages(appointment_ids, after):
+    """Archived messages of `appointment_ids` after `after`, decoded one segment at a time.
+
+    Segments are fetched in pages of up to SEGMENT_PAGE_BYTES (a bigger one
+    on its own). An appointment's segments hold consecutive runs of its
+    messages, so in segment order the rows come out ordered by (appointment_id, id).
+    """
+    order = (MessageArchive.appointment_id, MessageArchive.id)
+    segments = db.session.execute(
+        select(MessageArchive.id, MessageArchive.raw_bytes)
+        .where(MessageArchive.appointment_id.in_(appointment_ids)).order_by(*order)
+    ).all()
+    pages, size = [[]], 0
+    for segment_id, raw_bytes in segments:
+        if pages[-1] and size + (raw_bytes or 0) > SEGMENT_PAGE_BYTES:
+            pages.append([])
+            size = 0
+        pages[-1].append(segment_id)
+        size += raw_bytes or 0
+    for page in pages:
+        if not page:
+            continue
+        query = select(MessageArchive.appointment_id, MessageArchive.data).where(MessageArchive.id.in_(page))
+        for appointment_id, data in db.session.execute(query.order_by(*order)):
+            for id, sender_id, content, timestamp in sorted(segment_rows(data)):
+                if (appointment_id, id) > after:
+                    yield (appointment_id, id, sender_id, timestamp, content)
+
+
+def message_batches(filters, after_id, limit, batch_size, after_message_id=None):
+    """Messages of the matching appointments, archived segments included.
+
+    Filters apply to the appointment. Rows are ordered by (appointment_id, id)
+    and that pair is the resume key: `after_message_id` continues inside
+    appointment `after_id` instead of after it. Hot rows are paged and
+    segments read one by one, so memory stays flat however busy an
+    appointment is.
+    """
+    appointments = _appointment_filters(select(Appointment.id), filters)
+    start = after_id if after_message_id is None else after_id - 1
+    after = (after_id, after_message_id or 0)
+    sent, batch = 0, []
+    for ids in keyset_batches(appointments, Appointment.id, start, None, APPOINTMENTS_PER_MESSAGE_BATCH):
+        ids = [row[0] for row in ids]
+        rows = heapq.merge(
+            _archived_messages(ids, after), _hot_messages(ids, after, batch_size),
+            key=lambda row: (row[0], row[1]),
+        )
+        for row in rows:
+            batch.append(row)
+            if limit is not None and sent + len(batch) >= limit:
+                yield batch
+                return
+            if len(batch) == batch_size:
+                yield batch
+                sent, batch = sent + len(batch), []
+    if batch:
+        yield batch
+
+
+def review_batches(filters, after_id, limit, batch_size):
+    if filters["status"]:
+        raise ExportError("Reviews have no status")
+    query = select(Review.id, Review.doctor_id, Review.patient_id, Review.rating, Review.comment, Review.created_at)
+    if filters["doctor_id"]:
+        query = query.where(Review.doctor_id == filters["doctor_id"])
+    if filters["start"]:
+        query = query.where(Review.created_at >= datetime.combine(filters["start"], datetime.min.time()))
+    if filters["end"]:
+        day_after = filters["end"] + timedelta(days=1)
+        query = query.where(Review.created_at < datetime.combine(day_after, datetime.min.time()))
+    return keyset_batches(query, Review.id, after_id, limit, batch_size)
+
+
+DATASETS = {
+    "appointments": (APPOINTMENT_COLUMNS, appointment_batches),
+    "messages": (MESSAGE_COLUMNS, message_batches),
+    "reviews": (REVIEW_COLUMNS, review_batches),
+}
+
+
+def _formatter(columns):
+    """Row -> list with datetime columns as ISO 8601 strings; other values pass through."""
+    stamps = [i for i, (_name, kind) in enumerate(columns) if kind == "datetime"]
+
+    def format_row(row):
+        row = list(row)
+        for i in stamps:
+            if row[i] is not None:
+                row[i] = row[i].isoformat()
+        return row
+    return format_row
+
+
+class CsvWriter:
+    mimetype = "text/csv"
+
+    def __init__(self, columns):
+        self.names = [name for name, _type in columns]
+        self.format_row = _formatter(columns)
+
+    def start(self):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(self.names)
+        return buffer.getvalue().encode()
+
+    def write(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(map(self.format_row, rows))
+        return buffer.getvalue().encode()
+
+    def finish(self):
+        return b""
+
+
+class NdjsonWriter:
+    mimetype = "application/x-ndjson"
+
+    def __init__(self, columns):
+        self.names = [name for name, _type in columns]
+        self.format_row = _formatter(columns)
+
+    def start(self):
+        return b""
+
+    def write(self, rows):
+        return "".join(
+            json.dumps(dict(zip(self.names, self.format_row(row))), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+
+    def finish(self):
+        return b""
+
+
+class _Sink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.chunks, self.position, self.closed = [], 0, False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+class ParquetWriter:
+    """One row group per batch, streamed as written; needs the optional pyarrow package."""
+
+    mimetype = "application/vnd.apache.parquet"
+
+    def __init__(self, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+        types = {"int": pa.int64(), "str": pa.string(), "datetime": pa.timestamp("us")}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.sink = _Sink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression="zstd")
+
+    def start(self):
+        return self.sink.drain()
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+        return self.sink.drain()
+
+    def finish(self):
+        self.writer.close()
+        return self.sink.drain()
+
+
+WRITERS = {"csv": CsvWriter, "ndjson": NdjsonWriter, "parquet": ParquetWriter}
+
+
+def export_stream(dataset, filters, fmt="csv", compress=False, after_id=0, limit=None, progress=None,
+                  after_message_id=None):
+    """Yield the encoded export one batch at a time, optionally gzipped on the fly.
+
+    `progress`, if given, is a dict updated with "rows" and "last_key" (the
+    value to pass as `after_id` to continue after what was sent) and, for
+    messages, "last_message_id" (the `after_message_id` to pass with it).
+    """
+    columns, batches = DATASETS[dataset]
+    writer = WRITERS[fmt](columns)
+    # Built before the first yield, so invalid filters raise before any output
+    resume = {"after_message_id": after_message_id} if dataset == "messages" else {}
+    batches = batches(filters, after_id, limit, current_app.config["EXPORT_BATCH_SIZE"], **resume)
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    progress = progress if progress is not None else {}
+    progress.update(rows=0, last_key=after_id)
+    if dataset == "messages":
+        progress["last_message_id"] = after_message_id
+
+    def encode(data):
+        return gzip.compress(data) if gzip else data
+
+    yield encode(writer.start())
+    for batch in batches:
+        if not batch:
+            continue
+        data = encode(writer.write(batch))
+        progress["rows"] += len(batch)
+        progress["last_key"] = batch[-1][0]
+        if dataset == "messages":
+            progress["last_message_id"] = batch[-1][1]
+        if data:
+            yield data
+    yield encode(writer.finish()) + (gzip.flush() if gzip else b"")
+
+
+def _authorized():
+    token = current_app.config.get("EXPORT_TOKEN")
+    if not token:
+        # Exports are off until a token is configured
+        abort(404)
+    header = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(header, f"Bearer {token}"):
+        abort(401)
+
+
+@exports.route("/<dataset>")
+@read_only
+def export(dataset):
+    """Stream a dataset as a download: ?format=csv|ndjson|parquet&gzip=1&doctor_id=&from=&to=&status=
+    &after_id=&after_message_id=&limit=. Interrupted downloads resume with after_id set to the first
+    column of the last complete row received (and, for messages, after_message_id to the second).
+    """
+    _authorized()
+    if dataset not in DATASETS:
+        abort(404)
+    fmt = request.args.get("format", "csv")
+    if fmt not in WRITERS:
+        abort(400)
+    compress = request.args.get("gzip") in ("1", "true")
+    try:
+        filters = parse_filters(
+            request.args.get("doctor_id", type=int), request.args.get("from"),
+            request.args.get("to"), request.args.get("status"),
+        )
+        stream = export_stream(
+            dataset, filters, fmt, compress,
+            after_id=request.args.get("after_id", 0, type=int), limit=request.args.get("limit", type=int),
+            after_message_id=request.args.get("after_message_id", type=int),
+        )
+        # Run up to the first yield so bad arguments fail before the 200 is sent
+        first = next(stream)
+    except ExportError as e:
+        return {"error": str(e)}, 400
+
+    def generate():
+        yield first
+        yield from stream
+
+    filename = f"{dataset}-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/gzip" if compress else WRITERS[fmt].mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            # Let proxies pass chunks through instead of buffering the whole export
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@click.command("export")
+@click.argument("dataset", type=click.Choice(sorted(DATASETS)))
+@click.option("--format", "fmt", type=click.Choice(sorted(WRITERS)), default="csv", show_default=True)
+@click.option("--gzip", "compress", is_flag=True, help="Compress the output on the fly.")
+@click.option("--doctor-id", type=int)
+@click.option("--from", "start", help="YYYY-MM-DD; appointment date (review date for reviews).")
+@click.option("--to", "end", help="YYYY-MM-DD, inclusive.")
+@click.option("--status", help="Appointment status.")
+@click.option("--after-id", type=int, default=0, help="Resume after this key (first column of the last row).")
+@click.option("--after-message-id", type=int, help="Messages only: resume inside --after-id after this message.")
+@click.option("--limit", type=int, help="Stop after this many rows.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, allow_dash=True), default="-", show_default=True)
+@with_appcontext
+def export_command(dataset, fmt, compress, doctor_id, start, end, status, after_id, after_message_id, limit, output):
+    """Stream appointments, messages or reviews to a file or stdout."""
+    progress = {}
+    started = time.perf_counter()
+    try:
+        filters = parse_filters(doctor_id, start, end, status)
+        out = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            for chunk in export_stream(dataset, filters, fmt, compress, after_id, limit, progress, after_message_id):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    except ExportError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+    resume = f"--after-id {progress['last_key']}"
+    if progress.get("last_message_id") is not None:
+        resume += f" --after-message-id {progress['last_message_id']}"
+    click.echo(
+        f"Exported {progress['rows']} {dataset} rows in {elapsed:.1f}s "
+        f"({progress['rows'] / max(elapsed, 1e-9):,.0f} rows/s); resume with {resume}",
+        err=True,
+    )
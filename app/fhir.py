@@ -0,0 +1,383 @@
+import json
+import re
+import sys
+import time
+import uuid
+import zlib
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import click
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from .exports import _authorized, keyset_batches
+from .extensions import db
+from .loading import PATIENT_RECORD
+from .messages import read_segment
+from .models import Appointment, DoctorProfile, Message, MessageArchive, PatientProfile, User
+from .replicas import read_only
+
+
+# FHIR R4 resources built from our models. Bundles are written piece by piece:
+# appointments and messages are read in keyset batches and serialized as they
+# arrive, so a patient's history never has to fit in memory.
+
+fhir = Blueprint("fhir", __name__, url_prefix="/admin/export")
+
+BATCH_SIZE = 500
+
+ENCOUNTER_STATUS = {
+    "pending": "planned",
+    "accepted": "planned",
+    "paid": "planned",
+    "completed": "finished",
+    "cancelled": "cancelled",
+    "canceled": "cancelled",
+}
+CONDITION_CLINICAL = "http://terminology.hl7.org/CodeSystem/condition-clinical"
+ACT_CODE = "http://terminology.hl7.org/CodeSystem/v3-ActCode"
+ROLE_CODE = "http://terminology.hl7.org/CodeSystem/v3-RoleCode"
+LOINC = "http://loinc.org"
+
+
+@lru_cache(maxsize=4096)
+def full_url(resource_type, id):
+    """Stable urn:uuid for a resource, so references resolve inside the bundle and across exports."""
+    return f"urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, f'ehealthcare/{resource_type}/{id}')}"
+
+
+def reference(resource_type, id, display=None):
+    ref = {"reference": full_url(resource_type, id)}
+    if display:
+        ref["display"] = display
+    return ref
+
+
+def items(text):
+    """Entries of a free-text field: one per line, comma or semicolon; "none"/"n/a" mean nothing."""
+    if not text:
+        return []
+    values = [value.strip() for value in re.split(r"[\n,;]+", text)]
+    return [value for value in values if value and value.lower() not in ("none", "nil", "n/a", "na", "-")]
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value).isoformat() if value else None
+    except ValueError:
+        return None
+
+
+def _instant(day, clock):
+    """ISO dateTime from an appointment's date and "HH:MM" time strings, or just the date.
+
+    FHIR wants an offset whenever a time is given; appointment times are
+    the clinic's wall clock (CLINIC_TIMEZONE, else the server's zone).
+    """
+    try:
+        start = datetime.fromisoformat(f"{day}T{clock}") if clock else None
+    except ValueError:
+        start = None
+    if start is None:
+        return _date(day)
+    zone = current_app.config["CLINIC_TIMEZONE"]
+    return (start.replace(tzinfo=ZoneInfo(zone)) if zone else start.astimezone()).isoformat()
+
+
+def _utc(moment):
+    """ISO dateTime for a naive UTC timestamp (as stored by `datetime.utcnow`)."""
+    return moment.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z") if moment else None
+
+
+def _drop_empty(resource):
+    return {key: value for key, value in resource.items() if value not in (None, "", [], {})}
+
+
+def patient_resource(profile, user):
+    gender = (profile.gender or "").lower()
+    address = _drop_empty({
+        "text": profile.address,
+        "city": profile.city,
+        "state": profile.state,
+        "country": profile.country,
+        "postalCode": profile.zip_code,
+    })
+    contact = _drop_empty({
+        "relationship": [{"text": "Emergency contact"}],
+        "name": {"text": profile.emergency_contact_name} if profile.emergency_contact_name else None,
+        "telecom": [{"system": "phone", "value": profile.emergency_contact_phone}]
+        if profile.emergency_contact_phone else None,
+    })
+    return _drop_empty({
+        "resourceType": "Patient",
+        "id": str(profile.id),
+        "name": [{"text": user.name}],
+        "gender": gender if gender in ("male", "female", "other") else "unknown",
+        "birthDate": _date(profile.date_of_birth),
+        "telecom": [t for t in (
+            {"system": "phone", "value": profile.phone} if profile.phone else None,
+            {"system": "email", "value": user.email} if user.email else None,
+        ) if t],
+        "address": [address] if address else None,
+        "contact": [contact] if len(contact) > 1 else None,
+    })
+
+
+def record_resources(profile):
+    """The free-text medical and insurance fields as FHIR resources, one per listed item."""
+    patient = reference("Patient", profile.id)
+    pid = profile.id
+
+    for n, text in enumerate(items(profile.allergies)):
+        yield {"resourceType": "AllergyIntolerance", "id": f"{pid}-allergy-{n}", "patient": patient,
+               "code": {"text": text}}
+    for n, text in enumerate(items(profile.medications)):
+        yield {"resourceType": "MedicationStatement", "id": f"{pid}-medication-{n}", "status": "unknown",
+               "subject": patient, "medicationCodeableConcept": {"text": text}}
+    for status, field in (("active", profile.conditions), ("resolved", profile.previous_conditions)):
+        for n, text in enumerate(items(field)):
+            yield {"resourceType": "Condition", "id": f"{pid}-condition-{status}-{n}", "subject": patient,
+                   "clinicalStatus": {"coding": [{"system": CONDITION_CLINICAL, "code": status}]},
+                   "code": {"text": text}}
+    for n, text in enumerate(items(profile.surgeries)):
+        yield {"resourceType": "Procedure", "id": f"{pid}-surgery-{n}", "status": "completed", "subject": patient,
+               "code": {"text": text}}
+    for n, text in enumerate(items(profile.immunizations)):
+        yield {"resourceType": "Immunization", "id": f"{pid}-immunization-{n}", "status": "completed",
+               "patient": patient, "vaccineCode": {"text": text}, "occurrenceString": "unknown"}
+    for code, display, field in (
+        ("FTH", "father", profile.father_history),
+        ("MTH", "mother", profile.mother_history),
+        ("FAMMEMB", "family member", profile.family_history),
+    ):
+        conditions = [{"code": {"text": text}} for text in items(field)]
+        if conditions:
+            yield {"resourceType": "FamilyMemberHistory", "id": f"{pid}-family-{code.lower()}",
+                   "status": "completed", "patient": patient,
+                   "relationship": {"coding": [{"system": ROLE_CODE, "code": code, "display": display}]},
+                   "condition": conditions}
+    if profile.blood_group:
+        yield {"resourceType": "Observation", "id": f"{pid}-blood-group", "status": "final", "subject": patient,
+               "code": {"coding": [{"system": LOINC, "code": "882-1", "display": "ABO and Rh group"}]},
+               "valueString": profile.blood_group}
+    if profile.insurance_provider or profile.policy_number:
+        yield _drop_empty({
+            "resourceType": "Coverage", "id": f"{pid}-coverage", "status": "active", "beneficiary": patient,
+            "subscriberId": profile.policy_number,
+            "payor": [{"display": profile.insurance_provider or "Unknown"}],
+            "type": {"text": profile.coverage_type} if profile.coverage_type else None,
+            "class": [{"type": {"text": "group"}, "value": profile.group_number}] if profile.group_number else None,
+        })
+
+
+def encounter_resource(appt, patient_id, doctor_name):
+    start = _instant(appt.date, appt.time)
+    return _drop_empty({
+        "resourceType": "Encounter",
+        "id": str(appt.id),
+        "status": ENCOUNTER_STATUS.get(appt.status, "unknown"),
+        "class": {"system": ACT_CODE, "code": "VR", "display": "virtual"},
+        "type": [{"text": appt.consultation_type}] if appt.consultation_type else None,
+        "subject": reference("Patient", patient_id),
+        "participant": [{"individual": reference("Practitioner", appt.doctor_id, doctor_name)}],
+        "period": {"start": start} if start else None,
+    })
+
+
+def communication_resource(message, appointment_id, patient_id, patient_user_id, doctor_id):
+    if message.sender_id == patient_user_id:
+        sender, recipient = reference("Patient", patient_id), reference("Practitioner", doctor_id)
+    else:
+        sender, recipient = reference("Practitioner", doctor_id), reference("Patient", patient_id)
+    return _drop_empty({
+        "resourceType": "Communication",
+        "id": str(message.id),
+        "status": "completed",
+        "subject": reference("Patient", patient_id),
+        "encounter": reference("Encounter", appointment_id),
+        "sent": _utc(message.timestamp),
+        "sender": sender,
+        "recipient": [recipient],
+        "payload": [{"contentString": message.content or ""}],
+    })
+
+
+def practitioner_resource(doctor, name):
+    return _drop_empty({
+        "resourceType": "Practitioner",
+        "id": str(doctor.id),
+        "name": [{"text": name}],
+        "telecom": [{"system": "phone", "value": doctor.phone}] if doctor.phone else None,
+        "qualification": [{"code": {"text": doctor.specialization}}] if doctor.specialization else None,
+    })
+
+
+def appointment_messages(appointment_id, segment_ids=()):
+    """Messages of one appointment oldest first: archived segments one at a time, then hot rows in batches."""
+    for segment_id in segment_ids:
+        segment = db.session.get(MessageArchive, segment_id)
+        messages = read_segment(segment)
+        # Segments can be large; do not keep them in the identity map
+        db.session.expunge(segment)
+        yield from messages
+    query = select(Message.id, Message.sender_id, Message.timestamp, Message.content).where(
+        Message.appointment_id == appointment_id
+    )
+    for batch in keyset_batches(query, Message.id, 0, None, BATCH_SIZE):
+        yield from batch
+
+
+def patient_resources(patient_id):
+    """Every resource of a patient's record, produced incrementally; None if there is no such patient."""
+    profile = PatientProfile.query.options(*PATIENT_RECORD).filter_by(id=patient_id).first()
+    if profile is None:
+        return None
+    user = db.session.get(User, profile.user_id)
+
+    def generate():
+        yield patient_resource(profile, user)
+        yield from record_resources(profile)
+
+        doctors, names = {}, {}
+        appointments = select(
+            Appointment.id, Appointment.doctor_id, Appointment.status, Appointment.date, Appointment.time,
+            Appointment.consultation_type,
+        ).where(Appointment.patient_id == patient_id)
+        for batch in keyset_batches(appointments, Appointment.id, 0, None, BATCH_SIZE):
+            missing = {appt.doctor_id for appt in batch} - set(doctors)
+            if missing:
+                for doctor, name in db.session.query(DoctorProfile, User.name).join(
+                    User, DoctorProfile.user_id == User.id
+                ).filter(DoctorProfile.id.in_(missing)):
+                    doctors[doctor.id] = practitioner_resource(doctor, name)
+                    names[doctor.id] = name
+            segments = {}
+            for segment_id, appointment_id in db.session.execute(
+                select(MessageArchive.id, MessageArchive.appointment_id)
+                .where(MessageArchive.appointment_id.in_([appt.id for appt in batch]))
+                .order_by(MessageArchive.id)
+            ):
+                segments.setdefault(appointment_id, []).append(segment_id)
+            for appt in batch:
+                yield encounter_resource(appt, patient_id, names.get(appt.doctor_id))
+                for message in appointment_messages(appt.id, segments.get(appt.id, ())):
+                    yield communication_resource(message, appt.id, patient_id, profile.user_id, appt.doctor_id)
+        yield from doctors.values()
+
+    return generate()
+
+
+def bundle_chunks(patient_id):
+    """A patient's record as a FHIR collection Bundle, yielded as JSON text a few resources at a time.
+
+    The output is a single line, so bundles can be concatenated as NDJSON.
+    Returns None if there is no such patient.
+    """
+    resources = patient_resources(patient_id)
+    if resources is None:
+        return None
+
+    def generate():
+        yield json.dumps({
+            "resourceType": "Bundle",
+            "id": str(uuid.uuid4()),
+            "type": "collection",
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        }, separators=(",", ":"))[:-1] + ',"entry":['
+        pending, first = [], True
+        for resource in resources:
+            pending.append(json.dumps(
+                {"fullUrl": full_url(resource["resourceType"], resource["id"]), "resource": resource},
+                separators=(",", ":"), ensure_ascii=False,
+            ))
+            if len(pending) >= BATCH_SIZE:
+                yield ("" if first else ",") + ",".join(pending)
+                pending, first = [], False
+        if pending:
+            yield ("" if first else ",") + ",".join(pending)
+        yield "]}"
+
+    return generate()
+
+
+def bulk_chunks(patient_ids=None, after_id=0, limit=None):
+    """NDJSON, one Bundle per line, for the given patients or all of them in id order.
+
+    To resume, pass the id of the last complete line's Patient as `after_id`.
+    """
+    if patient_ids:
+        ids = sorted(set(patient_ids))
+        batches = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+    else:
+        batches = (
+            [row[0] for row in batch] for batch in
+            keyset_batches(select(PatientProfile.id), PatientProfile.id, after_id, limit, BATCH_SIZE)
+        )
+    for batch in batches:
+        for patient_id in batch:
+            chunks = bundle_chunks(patient_id)
+            if chunks is None:
+                continue
+            yield from chunks
+            yield "\n"
+            # Profiles, users and doctors loaded for this patient are not needed again
+            db.session.expunge_all()
+
+
+@fhir.route("/fhir")
+@read_only
+def bulk_export():
+    """Stream patients' records as NDJSON FHIR Bundles: ?patient_id=(repeatable)&after_id=&limit=&gzip=1."""
+    _authorized()
+    chunks = bulk_chunks(
+        request.args.getlist("patient_id", type=int),
+        request.args.get("after_id", 0, type=int),
+        request.args.get("limit", type=int),
+    )
+    compress = request.args.get("gzip") in ("1", "true")
+
+    def generate():
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        # Pieces are small; send roughly 64 KB at a time
+        buffer, size = [], 0
+        for chunk in chunks:
+            data = chunk.encode()
+            buffer.append(data)
+            size += len(data)
+            if size >= 65536:
+                data = b"".join(buffer)
+                yield gzip.compress(data) if gzip else data
+                buffer, size = [], 0
+        data = b"".join(buffer)
+        yield (gzip.compress(data) + gzip.flush()) if gzip else data
+
+    filename = f"patients-{time.strftime('%Y%m%d-%H%M%S')}.ndjson" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/gzip" if compress else "application/fhir+ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
+
+
+@click.command("fhir-export")
+@click.option("--patient-id", "patient_ids", type=int, multiple=True, help="Patient profile id; repeatable. Default: all.")
+@click.option("--after-id", type=int, default=0, help="With no --patient-id, start after this patient id.")
+@click.option("--limit", type=int, help="With no --patient-id, stop after this many patients.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, allow_dash=True), default="-", show_default=True)
+@with_appcontext
+def fhir_export_command(patient_ids, after_id, limit, output):
+    """Write patients' records as FHIR R4 Bundles, one per line (NDJSON)."""
+    started = time.perf_counter()
+    out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    bundles = 0
+    try:
+        for chunk in bulk_chunks(patient_ids, after_id, limit):
+            out.write(chunk)
+            bundles += chunk == "\n"
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    click.echo(f"Exported {bundles} patient bundles in {time.perf_counter() - started:.1f}s.", err=True)
@@ -0,0 +1,52 @@
+import os
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from .cache import make_backend
+
+
+class FragmentCacheExtension(Extension):
+    """Adds a `{% cache key, ... %}...{% endcache %}` block to templates.
+
+    The rendered body is stored under the joined key parts, so keys must
+    include everything the body depends on, e.g.:
+
+        {% cache "doctor-card", doctor.id, doctor.updated_at %} ... {% endcache %}
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(key_parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key_parts, caller):
+        backend = current_app.extensions.get("fragment_cache")
+        if backend is None:
+            return caller()
+        key = "fragment:" + ":".join(str(part) for part in key_parts)
+        html = backend.get(key)
+        if html is None:
+            html = str(caller())
+            backend.set(key, html)
+        return Markup(html)
+
+
+def init_fragment_cache(app):
+    backend = make_backend(
+        app.config["FRAGMENT_CACHE_BACKEND"],
+        max_entries=app.config["FRAGMENT_CACHE_SIZE"],
+        directory=app.config.get("FRAGMENT_CACHE_DIR") or os.path.join(app.instance_path, "fragment-cache"),
+    )
+    app.extensions["fragment_cache"] = backend
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    return backend
@@ -0,0 +1,28 @@
+import os
+
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+
+from .extensions import db
+
+
+health = Blueprint("health", __name__)
+
+
+def draining():
+    drain_file = current_app.config.get("DRAIN_FILE")
+    return bool(drain_file) and os.path.exists(drain_file)
+
+
+@health.route("/healthz")
+def healthz():
+    """Load balancer check: 503 while draining or when the database is unreachable."""
+    if draining():
+        return jsonify(status="draining"), 503
+    try:
+        db.session.execute(text("SELECT 1"))
+    except Exception as e:
+        current_app.logger.warning("Health check failed: %s", e)
+        return jsonify(status="database unavailable"), 503
+    return jsonify(status="ok")
+
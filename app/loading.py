@@ -0,0 +1,34 @@
+from flask import current_app
+from sqlalchemy.orm import contains_eager, joinedload, raiseload, undefer_group
+
+from .models import Appointment, DoctorProfile, PatientProfile
+
+
+# Query option bundles: what each kind of list view is about to touch
+
+# Doctor cards: the doctor's name lives on User
+DOCTOR_WITH_USER = (joinedload(DoctorProfile.user),)
+# For queries that already join DoctorProfile.user (e.g. to search by name)
+DOCTOR_JOINED_USER = (contains_eager(DoctorProfile.user),)
+
+# Patient-side appointment lists show the doctor's name and picture
+APPOINTMENT_WITH_DOCTOR = (joinedload(Appointment.doctor).joinedload(DoctorProfile.user),)
+
+# Doctor-side appointment lists show the patient's name and picture
+APPOINTMENT_WITH_PATIENT = (joinedload(Appointment.patient).joinedload(PatientProfile.user),)
+
+# Full records for the profile and preview pages: every deferred column group in one query
+PATIENT_RECORD = (undefer_group("address"), undefer_group("medical"), undefer_group("insurance"))
+DOCTOR_DETAILS = (undefer_group("credentials"), undefer_group("expertise"))
+
+
+def planned(*bundles):
+    """Query options for a hot view.
+
+    With STRICT_LOADING on, any relationship of the queried rows that the
+    bundles did not plan for raises instead of issuing a query per row.
+    """
+    options = [option for bundle in bundles for option in bundle]
+    if current_app.config.get("STRICT_LOADING"):
+        options.append(raiseload("*"))
+    return options
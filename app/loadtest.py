@@ -0,0 +1,297 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.serving import make_server
+
+from .bench import percentile
+from .extensions import db, mail
+from .models import Appointment, DoctorProfile, PatientProfile, User
+from .payments import StubGateway
+from .seed import SEED_PASSWORD, SPECIALIZATIONS
+
+
+ORDER_ID = re.compile(r'"order_id":\s*"([^"]+)"')
+
+
+class LoadStats:
+    """Latencies and failures per step, shared by every simulated user."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.flows = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, step, elapsed, ok=True):
+        with self._lock:
+            self.latencies[step].append(elapsed * 1000)
+            if not ok:
+                self.errors[step] += 1
+
+    def flow_done(self, outcome):
+        with self._lock:
+            self.flows[outcome] += 1
+
+    def report(self, duration):
+        lines = [f"{'step':28} {'count':>7} {'errors':>7} {'rps':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+        for step, samples in sorted(self.latencies.items()):
+            lines.append(
+                f"{step:28} {len(samples):>7} {self.errors[step]:>7} {len(samples) / duration:>7.1f} "
+                f"{percentile(samples, 50):>7.1f}ms {percentile(samples, 95):>7.1f}ms "
+                f"{percentile(samples, 99):>7.1f}ms {max(samples):>7.1f}ms"
+            )
+        total = sum(len(s) for s in self.latencies.values())
+        lines.append(f"Requests: {total} in {duration:.1f}s ({total / duration:.1f}/s)")
+        lines.append("Flows: " + ", ".join(f"{k}={v}" for k, v in sorted(self.flows.items())))
+        return "\n".join(lines)
+
+
+class Browser:
+    """One simulated user's cookie jar, timing every request into `stats`."""
+
+    def __init__(self, base_url, stats):
+        import requests
+        self.base_url = base_url
+        self.stats = stats
+        self.http = requests.Session()
+
+    def request(self, step, method, path, expect=200, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, allow_redirects=False, timeout=30, **kwargs)
+        except Exception:
+            self.stats.record(step, time.perf_counter() - start, ok=False)
+            return None
+        ok = response.status_code == expect
+        self.stats.record(step, time.perf_counter() - start, ok=ok)
+        return response if ok else None
+
+    def login(self, email):
+        return self.request("login", "POST", "/login", expect=302, data={"email": email, "password": SEED_PASSWORD})
+
+    @property
+    def cookie_header(self):
+        return "; ".join(f"{c.name}={c.value}" for c in self.http.cookies)
+
+
+class Accounts:
+    """Seeded accounts to draw users from, with one logged-in browser per doctor."""
+
+    def __init__(self, base_url, stats, sample_size):
+        self.base_url = base_url
+        self.stats = stats
+        self.patients = [row.email for row in db.session.query(User.email).join(
+            PatientProfile, PatientProfile.user_id == User.id
+        ).filter(User.email.like("%@seed.test")).limit(sample_size)]
+        self.doctors = dict(db.session.query(DoctorProfile.id, User.email).join(
+            User, DoctorProfile.user_id == User.id
+        ).filter(User.email.like("%@seed.test")).limit(sample_size).all())
+        self.chats = db.session.query(Appointment.id, Appointment.doctor_id, Appointment.patient_id).filter(
+            Appointment.status == "accepted", Appointment.doctor_id.in_(list(self.doctors))
+        ).limit(sample_size).all()
+        self.patient_emails = dict(db.session.query(PatientProfile.id, User.email).join(
+            User, PatientProfile.user_id == User.id
+        ).filter(PatientProfile.id.in_([c.patient_id for c in self.chats])).all())
+        # Chat messages carry the sender's user id
+        self.user_ids = dict(db.session.query(User.email, User.id).filter(
+            User.email.in_(list(self.patient_emails.values()) + list(self.doctors.values()))
+        ).all())
+        if not self.patients or not self.doctors:
+            raise click.ClickException("No seeded accounts found; run `flask seed` first.")
+        self._doctor_browsers = {}
+        self._lock = threading.Lock()
+
+    def doctor_browser(self, doctor_id):
+        with self._lock:
+            browser = self._doctor_browsers.get(doctor_id)
+            if browser is None:
+                browser = Browser(self.base_url, self.stats)
+                browser.login(self.doctors[doctor_id])
+                self._doctor_browsers[doctor_id] = browser
+            return browser
+
+
+def booking_flow(accounts, gateway, stats):
+    """search -> doctor_preview -> book -> doctor accepts -> payment -> payment success."""
+    patient = Browser(accounts.base_url, stats)
+    if patient.login(random.choice(accounts.patients)) is None:
+        return stats.flow_done("booking:login-failed")
+
+    patient.request("find_doctor", "GET", "/patient/find-doctor", params={"search": random.choice(SPECIALIZATIONS)})
+    doctor_id = random.choice(list(accounts.doctors))
+    patient.request("doctor_preview", "GET", f"/patient/doctor/{doctor_id}")
+    slots = patient.request("doctor_slots api", "GET", f"/api/v1/doctors/{doctor_id}/slots")
+    free = [
+        (day["date"], slot["time"])
+        for day in (slots.json()["days"].values() if slots is not None else [])
+        for slot in day["slots"] if not slot["is_booked"]
+    ]
+    if not free:
+        return stats.flow_done("booking:no-free-slot")
+
+    date, slot_time = random.choice(free)
+    if patient.request("book", "POST", f"/patient/book/{doctor_id}", expect=302,
+                       data={"date": date, "time": slot_time}) is None:
+        return stats.flow_done("booking:book-failed")
+    pending = patient.request("appointments api", "GET", "/api/v1/appointments", params={"status": "pending"})
+    mine = [a for a in (pending.json()["appointments"] if pending is not None else [])
+            if a["doctor_id"] == doctor_id and a["date"] == date and a["time"] == slot_time]
+    if not mine:
+        return stats.flow_done("booking:lost")
+    appointment_id = max(a["id"] for a in mine)
+
+    accounts.doctor_browser(doctor_id).request(
+        "accept_appointment", "GET", f"/doctor/appointment/accept/{appointment_id}", expect=302
+    )
+    page = patient.request("payment", "GET", f"/patient/payment/{appointment_id}")
+    if page is None:
+        # Another patient got the slot first and the doctor's accept cancelled this one
+        return stats.flow_done("booking:slot-conflict")
+    order_id = ORDER_ID.search(page.text).group(1)
+    payment_id = "pay_stub_" + format(random.getrandbits(48), "x")
+    patient.request("payment_success", "POST", f"/patient/payment/success/{appointment_id}", expect=302, json={
+        "razorpay_order_id": order_id,
+        "razorpay_payment_id": payment_id,
+        "razorpay_signature": gateway.sign(order_id, payment_id),
+    })
+    stats.flow_done("booking:paid")
+
+
+def chat_flow(accounts, stats, messages, think_time, transport="polling"):
+    """Doctor and patient join an appointment room and alternate `messages` messages.
+
+    Latency is measured from one side's send_message to the other side's receive_message.
+    """
+    import socketio
+
+    appointment_id, doctor_id, patient_id = random.choice(accounts.chats)
+    patient = Browser(accounts.base_url, stats)
+    if patient.login(accounts.patient_emails[patient_id]) is None:
+        return stats.flow_done("chat:login-failed")
+    doctor = accounts.doctor_browser(doctor_id)
+
+    # token -> (side expected to receive it, send time); the sender gets its own echo too
+    sent = {}
+    arrived = {}
+    events = [threading.Event(), threading.Event()]
+    clients = []
+
+    def listener(side):
+        def on_message(data):
+            token = data.get("content")
+            if token in sent and sent[token][0] == side:
+                arrived[token] = time.perf_counter()
+                events[side].set()
+        return on_message
+
+    try:
+        for side, browser in enumerate((patient, doctor)):
+            client = socketio.Client(reconnection=False)
+            client.on("receive_message", listener(side))
+            start = time.perf_counter()
+            try:
+                client.connect(accounts.base_url, headers={"Cookie": browser.cookie_header}, transports=[transport])
+            except Exception:
+                stats.record("socket connect", time.perf_counter() - start, ok=False)
+                return stats.flow_done("chat:connect-failed")
+            stats.record("socket connect", time.perf_counter() - start)
+            client.emit("join", {"appointment_id": appointment_id})
+            clients.append(client)
+
+        sender_ids = [accounts.user_ids[accounts.patient_emails[patient_id]], accounts.user_ids[accounts.doctors[doctor_id]]]
+        for n in range(messages):
+            side, peer = n % 2, 1 - n % 2
+            token = f"load-{appointment_id}-{n}-{random.getrandbits(32):x}"
+            events[peer].clear()
+            sent[token] = (peer, time.perf_counter())
+            clients[side].emit("send_message", {
+                "appointment_id": appointment_id, "sender_id": sender_ids[side], "content": token,
+            })
+            ok = events[peer].wait(10)
+            stats.record("send_message -> receive", arrived.get(token, time.perf_counter()) - sent[token][1], ok=ok)
+            time.sleep(random.expovariate(1 / think_time) if think_time else 0)
+    finally:
+        for client in clients:
+            client.disconnect()
+    stats.flow_done("chat:done")
+
+
+def start_local_server(app, port):
+    """Serve the app with stubbed mail and payments on a background thread."""
+    app.config["MAIL_SUPPRESS_SEND"] = True
+    app.config["PAYMENT_GATEWAY"] = "stub"
+    mail.init_app(app)
+    # Per-request access logs would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # Not socketio.run: it ends in app.run(), which Flask ignores under the `flask` command.
+    # Binding here, before the thread starts, means the port is listening once this returns.
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def run_load(base_url, scenarios, rate, duration, concurrency, chat_messages, think_time, sample_size,
+             transport="polling", echo=print):
+    """Start flows as a Poisson process of `rate` arrivals per second for `duration` seconds."""
+    stats = LoadStats()
+    accounts = Accounts(base_url, stats, sample_size)
+    gateway = StubGateway(current_app.config["RAZORPAY_KEY_SECRET"])
+    if "chat" in scenarios and not accounts.chats:
+        raise click.ClickException("No accepted appointments among the seeded doctors to chat in.")
+
+    flows = {
+        "booking": lambda: booking_flow(accounts, gateway, stats),
+        "chat": lambda: chat_flow(accounts, stats, chat_messages, think_time, transport),
+    }
+
+    def run_flow(name):
+        try:
+            flows[name]()
+        except Exception as e:
+            stats.flow_done(f"{name}:error:{type(e).__name__}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_arrival = started
+        while next_arrival - started < duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run_flow, random.choice(scenarios))
+            next_arrival += random.expovariate(rate)
+        echo(f"Arrivals done after {time.perf_counter() - started:.1f}s; waiting for running flows...")
+    return stats, time.perf_counter() - started
+
+
+@click.command("loadtest")
+@click.option("--scenario", "scenarios", multiple=True, type=click.Choice(["booking", "chat"]),
+              default=["booking", "chat"], show_default=True, help="Repeatable; arrivals pick one at random.")
+@click.option("--rate", type=float, default=5.0, show_default=True, help="New simulated users per second.")
+@click.option("--duration", type=float, default=60.0, show_default=True, help="Seconds to keep arriving.")
+@click.option("--concurrency", type=int, default=500, show_default=True, help="Most users active at once.")
+@click.option("--chat-messages", type=int, default=10, show_default=True)
+@click.option("--think-time", type=float, default=1.0, show_default=True, help="Mean seconds between chat messages.")
+@click.option("--sample-size", type=int, default=2000, show_default=True, help="Seeded accounts to draw users from.")
+@click.option("--transport", type=click.Choice(["polling", "websocket"]), default="polling", show_default=True,
+              help="Socket.IO transport; websocket needs the websocket-client package.")
+@click.option("--url", help="Target a running instance instead of starting one (it must use the stub gateway).")
+@click.option("--port", type=int, default=5055, show_default=True)
+@with_appcontext
+def loadtest_command(scenarios, rate, duration, concurrency, chat_messages, think_time, sample_size, transport, url, port):
+    """Drive booking and chat flows against a local instance and report throughput and tail latency.
+
+    Without --url the app is served in-process with MAIL_SUPPRESS_SEND and
+    PAYMENT_GATEWAY='stub'. Seed the database first with `flask seed`.
+    """
+    base_url = url.rstrip("/") if url else start_local_server(current_app._get_current_object(), port)
+    stats, elapsed = run_load(base_url, list(scenarios), rate, duration, concurrency,
+                              chat_messages, think_time, sample_size, transport, echo=click.echo)
+    click.echo(stats.report(elapsed))
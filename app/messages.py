@@ -0,0 +1,125 @@
+import json
+import zlib
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from .extensions import db
+from .models import Appointment, Message, MessageArchive
+
+
+def message_history(appointment_id):
+    """Every message of an appointment in timestamp order, archived segments included.
+
+    Archived messages come back as transient Message objects, so templates
+    and serializers do not need to know where a message was stored.
+    """
+    messages = []
+    segments = MessageArchive.query.filter_by(appointment_id=appointment_id).order_by(MessageArchive.id).all()
+    for segment in segments:
+        messages.extend(read_segment(segment))
+    messages.extend(
+        Message.query.filter_by(appointment_id=appointment_id).order_by(Message.timestamp).all()
+    )
+    if segments:
+        messages.sort(key=lambda m: m.timestamp)
+    return messages
+
+
+def segment_rows(data):
+    """(id, sender_id, content, timestamp) of every message in a segment's compressed `data`."""
+    return [
+        (id, sender_id, content, datetime.fromisoformat(timestamp))
+        for id, sender_id, content, timestamp in json.loads(zlib.decompress(data))
+    ]
+
+
+def read_segment(segment):
+    return [
+        Message(id=id, appointment_id=segment.appointment_id, sender_id=sender_id, content=content, timestamp=timestamp)
+        for id, sender_id, content, timestamp in segment_rows(segment.data)
+    ]
+
+
+def archive_appointment(appointment_id):
+    """Move an appointment's hot messages into a new compressed segment; returns the count moved."""
+    messages = Message.query.filter_by(appointment_id=appointment_id).order_by(Message.timestamp).all()
+    if not messages:
+        return 0
+    raw = json.dumps(
+        [[m.id, m.sender_id, m.content, m.timestamp.isoformat()] for m in messages],
+        separators=(",", ":"),
+    ).encode()
+    db.session.add(MessageArchive(
+        appointment_id=appointment_id,
+        message_count=len(messages),
+        first_timestamp=messages[0].timestamp,
+        last_timestamp=messages[-1].timestamp,
+        raw_bytes=len(raw),
+        data=zlib.compress(raw, 9),
+    ))
+    Message.query.filter(Message.id.in_([m.id for m in messages])).delete(synchronize_session=False)
+    db.session.commit()
+    return len(messages)
+
+
+def archivable_appointments(retention_days, limit):
+    """Completed appointments older than the retention window that still have hot messages."""
+    cutoff = str(date.today() - timedelta(days=retention_days))
+    return [
+        row[0] for row in db.session.query(Appointment.id).filter(
+            Appointment.status == "completed",
+            Appointment.date < cutoff,
+            db.session.query(Message.id).filter(Message.appointment_id == Appointment.id).exists(),
+        ).order_by(Appointment.id).limit(limit)
+    ]
+
+
+def archive_messages(retention_days=None, batch_size=100, max_batches=None):
+    """Archive old consultations in batches, committing per appointment. Returns (appointments, messages)."""
+    if retention_days is None:
+        retention_days = current_app.config["MESSAGE_RETENTION_DAYS"]
+    appointments = moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = archivable_appointments(retention_days, batch_size)
+        if not ids:
+            break
+        for appointment_id in ids:
+            moved += archive_appointment(appointment_id)
+            appointments += 1
+        batches += 1
+    return appointments, moved
+
+
+messages_cli = click.Group("messages", help="Consultation message storage.")
+
+
+@messages_cli.command("archive")
+@click.option("--days", type=int, default=None, help="Retention window; defaults to MESSAGE_RETENTION_DAYS.")
+@click.option("--batch-size", type=int, default=100, show_default=True)
+@click.option("--max-batches", type=int, default=None, help="Stop after this many batches.")
+@with_appcontext
+def archive_command(days, batch_size, max_batches):
+    """Compact messages of old completed appointments into archive segments."""
+    appointments, moved = archive_messages(days, batch_size, max_batches)
+    click.echo(f"Archived {moved} messages from {appointments} appointments.")
+
+
+@messages_cli.command("stats")
+@with_appcontext
+def stats_command():
+    """Show hot-table and archive sizes."""
+    hot = db.session.query(func.count(Message.id)).scalar()
+    segments, archived, raw, stored = db.session.query(
+        func.count(MessageArchive.id),
+        func.coalesce(func.sum(MessageArchive.message_count), 0),
+        func.coalesce(func.sum(MessageArchive.raw_bytes), 0),
+        func.coalesce(func.sum(func.length(MessageArchive.data)), 0),
+    ).one()
+    click.echo(f"Hot messages:      {hot}")
+    click.echo(f"Archived messages: {archived} in {segments} segments")
+    if raw:
+        click.echo(f"Archive size:      {stored} bytes compressed from {raw} ({stored / raw:.0%})")
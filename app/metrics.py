@@ -0,0 +1,246 @@
+import functools
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, abort, current_app, g, request
+from sqlalchemy.pool import QueuePool
+
+
+metrics = Blueprint("metrics", __name__)
+
+# Seconds; covers cached fragments (~1ms) up to pathological pages
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def operator_only(view):
+    """Serve an operational endpoint only to requests sending "Authorization: Bearer <METRICS_TOKEN>".
+
+    The client address is no proof: behind a reverse proxy on the same host,
+    every request arrives from the loopback interface.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get("METRICS_TOKEN")
+        if not token:
+            # Off until a token is configured
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and three additions under a lock."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        names = self.labels + ("le",)
+        for label_values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, label_values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}"
+
+
+class Gauge:
+    """Values read at scrape time from `collect()`, which returns [(label values, value), ...].
+
+    kind="counter" exposes a monotonic count kept elsewhere, such as cache stats().
+    """
+
+    def __init__(self, name, help, labels, collect, kind="gauge"):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for label_values, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by endpoint, method and status.",
+    ("endpoint", "method", "status"),
+)
+SOCKET_LATENCY = Histogram(
+    "socketio_event_duration_seconds", "SocketIO handler latency; _count is the event total.", ("event",),
+)
+SOCKET_ERRORS = Counter("socketio_event_errors_total", "SocketIO handlers that raised.", ("event",))
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.", ("pool",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+EXTERNAL_LATENCY = Histogram(
+    "external_call_duration_seconds", "Latency of mail and payment gateway calls.", ("service", "operation", "outcome"),
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (SQLALCHEMY_ENGINE_OPTIONS poolclass)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            # Name pools per bind with the "pool_logging_name" engine option
+            POOL_WAIT.observe(time.perf_counter() - start, self._orig_logging_name or "default")
+
+
+@contextmanager
+def timed_call(service, operation):
+    """Record the latency of a call to an outside service, e.g. `with timed_call("mail", "send"):`."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - start, service, operation, outcome)
+
+
+def timed_event(name):
+    """Record latency and failures of a SocketIO handler; apply below @socketio.on."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                SOCKET_ERRORS.inc(name)
+                raise
+            finally:
+                SOCKET_LATENCY.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start, request.endpoint or "unmatched", request.method, response.status_code
+        )
+    return response
+
+
+def _pool_stats():
+    from .extensions import db
+
+    stats = []
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            stats.append((key or "default", pool))
+    return stats
+
+
+def _collect_pool(attribute):
+    def collect():
+        return [((name,), getattr(pool, attribute)()) for name, pool in _pool_stats()]
+    return collect
+
+
+def _collect_cache(field):
+    def collect():
+        values = []
+        for name in ("app_cache", "fragment_cache"):
+            cache = current_app.extensions.get(name)
+            if cache is not None:
+                stats = cache.stats()
+                if field == "hit_ratio":
+                    lookups = stats["hits"] + stats["misses"]
+                    values.append(((name,), round(stats["hits"] / lookups, 4) if lookups else 0))
+                else:
+                    values.append(((name,), stats[field]))
+        return values
+    return collect
+
+
+SCRAPE_GAUGES = [
+    Gauge("db_pool_size", "Configured pool size.", ("pool",), _collect_pool("size")),
+    Gauge("db_pool_checked_out", "Connections currently checked out.", ("pool",), _collect_pool("checkedout")),
+    Gauge("db_pool_overflow", "Connections open beyond the pool size.", ("pool",), _collect_pool("overflow")),
+    Gauge("cache_hits_total", "Cache hits.", ("cache",), _collect_cache("hits"), kind="counter"),
+    Gauge("cache_misses_total", "Cache misses.", ("cache",), _collect_cache("misses"), kind="counter"),
+    Gauge("cache_evictions_total", "Cache evictions.", ("cache",), _collect_cache("evictions"), kind="counter"),
+    Gauge("cache_hit_ratio", "Hits / lookups since start.", ("cache",), _collect_cache("hit_ratio")),
+]
+
+REGISTRY = [REQUEST_LATENCY, SOCKET_LATENCY, SOCKET_ERRORS, POOL_WAIT, EXTERNAL_LATENCY] + SCRAPE_GAUGES
+
+
+@metrics.route("/metrics")
+@operator_only
+def metrics_view():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.register_blueprint(metrics)
@@ -11,11 +11,14 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(255))
     role = db.Column(db.String(20))    # "patient" or "doctor"
     # Use back_populates to avoid duplicate/conflicting backrefs
-    doctor_profile = db.relationship("DoctorProfile", back_populates="user", uselist=False)
-    patient_profile = db.relationship("PatientProfile", back_populates="user", uselist=False)
+    # Loaded once per request through current_user, so a plain lazy select is cheapest
+    doctor_profile = db.relationship("DoctorProfile", back_populates="user", uselist=False, lazy="select")
+    patient_profile = db.relationship("PatientProfile", back_populates="user", uselist=False, lazy="select")
 
 
 ### Patient Profile ###
+# Address, medical and insurance columns are deferred groups: listings never load
+# them, and the profile/preview views undefer them via app.loading.PATIENT_RECORD.
 class PatientProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     # Personal
@@ -28,32 +31,35 @@ class PatientProfile(db.Model):
     emergency_contact_phone = db.Column(db.String(20))
     # Contact
     phone = db.Column(db.String(20))
-    address = db.Column(db.Text)
-    city = db.Column(db.String(50))
-    state = db.Column(db.String(50))
-    country = db.Column(db.String(50))
-    zip_code = db.Column(db.String(20))
+    address = db.deferred(db.Column(db.Text), group="address")
+    city = db.deferred(db.Column(db.String(50)), group="address")
+    state = db.deferred(db.Column(db.String(50)), group="address")
+    country = db.deferred(db.Column(db.String(50)), group="address")
+    zip_code = db.deferred(db.Column(db.String(20)), group="address")
     # Medical
-    allergies = db.Column(db.Text)
-    conditions = db.Column(db.Text)
-    medications = db.Column(db.Text)
-    previous_conditions = db.Column(db.Text)
-    surgeries = db.Column(db.Text)
-    family_history = db.Column(db.Text)
-    father_history = db.Column(db.Text)
-    mother_history = db.Column(db.Text)
-    immunizations = db.Column(db.Text)
+    allergies = db.deferred(db.Column(db.Text), group="medical")
+    conditions = db.deferred(db.Column(db.Text), group="medical")
+    medications = db.deferred(db.Column(db.Text), group="medical")
+    previous_conditions = db.deferred(db.Column(db.Text), group="medical")
+    surgeries = db.deferred(db.Column(db.Text), group="medical")
+    family_history = db.deferred(db.Column(db.Text), group="medical")
+    father_history = db.deferred(db.Column(db.Text), group="medical")
+    mother_history = db.deferred(db.Column(db.Text), group="medical")
+    immunizations = db.deferred(db.Column(db.Text), group="medical")
     # Insurance
-    insurance_provider = db.Column(db.String(100))
-    policy_number = db.Column(db.String(50))
-    group_number = db.Column(db.String(50))
-    coverage_type = db.Column(db.String(50))
+    insurance_provider = db.deferred(db.Column(db.String(100)), group="insurance")
+    policy_number = db.deferred(db.Column(db.String(50)), group="insurance")
+    group_number = db.deferred(db.Column(db.String(50)), group="insurance")
+    coverage_type = db.deferred(db.Column(db.String(50)), group="insurance")
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    user = db.relationship("User", back_populates="patient_profile", uselist=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    # Many-to-one: usually an identity-map hit; list views join it via app.loading
+    user = db.relationship("User", back_populates="patient_profile", uselist=False, lazy="select")
 
 
 ### Doctor Profile ###
+# Credential and expertise columns are deferred groups, undeferred on the profile,
+# preview and detail views via app.loading.DOCTOR_DETAILS.
 class DoctorProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     specialization = db.Column(db.String(120))
@@ -65,14 +71,14 @@ class DoctorProfile(db.Model):
     phone = db.Column(db.String(20))
     date_of_birth = db.Column(db.String(20))
     gender = db.Column(db.String(10))
-    medical_licence_no = db.Column(db.String(50))
+    medical_licence_no = db.deferred(db.Column(db.String(50)), group="credentials")
     profile_pic = db.Column(db.String(255))  # File path for uploaded profile picture
     # Qualification and Credentials
-    medical_degree = db.Column(db.String(120))
-    medical_school = db.Column(db.String(120))
-    graduation_year = db.Column(db.Integer)
-    board_certifications = db.Column(db.Text)
-    licence_file = db.Column(db.String(255))  # File path for uploaded licence
+    medical_degree = db.deferred(db.Column(db.String(120)), group="credentials")
+    medical_school = db.deferred(db.Column(db.String(120)), group="credentials")
+    graduation_year = db.deferred(db.Column(db.Integer), group="credentials")
+    board_certifications = db.deferred(db.Column(db.Text), group="credentials")
+    licence_file = db.deferred(db.Column(db.String(255)), group="credentials")  # File path for uploaded licence
     # Clinic/Hospital Information
     clinic_name = db.Column(db.String(120))
     clinic_address = db.Column(db.Text)
@@ -81,17 +87,25 @@ class DoctorProfile(db.Model):
     clinic_country = db.Column(db.String(50))
     clinic_zip_code = db.Column(db.String(20))
     # Additional Information
-    areas_of_expertise = db.Column(db.Text)
-    awards_recognitions = db.Column(db.Text)
-    research_publications = db.Column(db.Text)
-    professional_memberships = db.Column(db.Text)
+    areas_of_expertise = db.deferred(db.Column(db.Text), group="expertise")
+    awards_recognitions = db.deferred(db.Column(db.Text), group="expertise")
+    research_publications = db.deferred(db.Column(db.Text), group="expertise")
+    professional_memberships = db.deferred(db.Column(db.Text), group="expertise")
+    # Review totals, kept in step with Review by app/reviews.py; average = rating_sum / review_count
+    review_count = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    user = db.relationship("User", back_populates="doctor_profile", uselist=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    # Many-to-one: usually an identity-map hit; list views join it via app.loading
+    user = db.relationship("User", back_populates="doctor_profile", uselist=False, lazy="select")
 
 
 ### Availability ###
 class Availability(db.Model):
+    __table_args__ = (
+        db.Index("ix_availability_doctor_type_date", "doctor_id", "type", "date"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'))
     type = db.Column(db.String(20))  # weekly / override
@@ -100,11 +114,21 @@ class Availability(db.Model):
     end_time = db.Column(db.String(10))
     date = db.Column(db.String(20))  # YYYY-MM-DD
     label = db.Column(db.String(50)) # Holiday / Vacation
-    doctor = db.relationship("DoctorProfile", backref="availability")
+    doctor = db.relationship("DoctorProfile", backref=db.backref("availability", lazy="select"), lazy="select")
     is_booked = db.Column(db.Boolean, default=False)
 
 
 class Appointment(db.Model):
+    # Match the filters in patient.py/doctor.py; see app/queryplans.py
+    __table_args__ = (
+        db.Index("ix_appointment_doctor_status", "doctor_id", "status"),
+        db.Index("ix_appointment_doctor_date_time", "doctor_id", "date", "time"),
+        db.Index("ix_appointment_doctor_patient", "doctor_id", "patient_id", "date"),
+        db.Index("ix_appointment_patient_status", "patient_id", "status"),
+        # Rollup watermark scans (app/rollups.py)
+        db.Index("ix_appointment_updated_at", "updated_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'))
     patient_id = db.Column(db.Integer, db.ForeignKey('patient_profile.id'))
@@ -113,39 +137,162 @@ class Appointment(db.Model):
     time = db.Column(db.String(50))
     consultation_type = db.Column(db.String(50), default="Chat Consultation")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    doctor = db.relationship("DoctorProfile", backref="appointments")
-    patient = db.relationship("PatientProfile", backref="appointments")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Row version, bumped in SQL on every UPDATE; used for API ETags
+    version = db.Column(db.Integer, default=1, onupdate=db.literal_column("version + 1"))
+    # Unbounded collections are dynamic so they are filtered in SQL, never loaded whole
+    doctor = db.relationship("DoctorProfile", backref=db.backref("appointments", lazy="dynamic"), lazy="select")
+    patient = db.relationship("PatientProfile", backref=db.backref("appointments", lazy="dynamic"), lazy="select")
+
+
+### Doctor-patient registry, maintained from appointments by app/registry.py ###
+# One row per doctor and patient who share an appointment; visits exclude cancelled ones
+class DoctorPatient(db.Model):
+    __table_args__ = (
+        # "My patients", most recent first
+        db.Index("ix_doctor_patient_doctor_last_visit", "doctor_id", "last_visit"),
+    )
+
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient_profile.id'), primary_key=True)
+    first_visit = db.Column(db.String(50))  # Appointment.date values
+    last_visit = db.Column(db.String(50))
+    visit_count = db.Column(db.Integer, default=0)
+    # Latest non-cancelled appointment, or the latest one if all were cancelled
+    last_appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
+    last_status = db.Column(db.String(20))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    patient = db.relationship("PatientProfile", lazy="select")
 
 
 ### Payment ###
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), index=True)
     amount = db.Column(db.Integer)
     status = db.Column(db.String(20))  # paid / failed / pending
+    provider_payment_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
 ### Review ###
 class Review(db.Model):
+    __table_args__ = (
+        db.Index("ix_review_doctor_created", "doctor_id", "created_at"),
+        db.Index("ix_review_created_at", "created_at"),
+        # Per-patient rate limit (app/reviews.py)
+        db.Index("ix_review_patient_created", "patient_id", "created_at"),
+        # One review per appointment; older reviews have none
+        db.UniqueConstraint("appointment_id", name="uq_review_appointment"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'))
     patient_id = db.Column(db.Integer, db.ForeignKey('patient_profile.id'))
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
     rating = db.Column(db.Integer)  # 1-5
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    doctor = db.relationship("DoctorProfile", backref="reviews")
-    patient = db.relationship("PatientProfile", backref="reviews")
+    doctor = db.relationship("DoctorProfile", backref=db.backref("reviews", lazy="dynamic"), lazy="select")
+    patient = db.relationship("PatientProfile", backref=db.backref("reviews", lazy="dynamic"), lazy="select")
 
 
 ### Message ###
 class Message(db.Model):
+    __table_args__ = (
+        db.Index("ix_message_appointment_timestamp", "appointment_id", "timestamp"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     content = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    appointment = db.relationship("Appointment", backref="messages")
-    sender = db.relationship("User", backref="messages")
+    appointment = db.relationship("Appointment", backref=db.backref("messages", lazy="dynamic"), lazy="select")
+    sender = db.relationship("User", backref=db.backref("messages", lazy="dynamic"), lazy="select")
+
+
+### Archived messages: one zlib-compressed segment per archiving run of an appointment ###
+class MessageArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), index=True)
+    message_count = db.Column(db.Integer)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    raw_bytes = db.Column(db.Integer)
+    data = db.Column(db.LargeBinary(length=2**24))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+### Daily rollups, maintained incrementally by app/rollups.py ###
+# Bookings by status and revenue, per doctor, consultation day and consultation type
+class DoctorDailyStats(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint("doctor_id", "day", "consultation_type", name="uq_doctor_daily_stats"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'))
+    day = db.Column(db.Date)
+    consultation_type = db.Column(db.String(50))
+    bookings = db.Column(db.Integer, default=0)
+    pending = db.Column(db.Integer, default=0)
+    accepted = db.Column(db.Integer, default=0)
+    paid = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Integer, default=0)
+    cancelled = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Integer, default=0)  # Paid payments, in the units of DoctorProfile.fees
+
+
+# Reviews per doctor and review day; average = rating_sum / reviews over any range
+class DoctorDailyRating(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint("doctor_id", "day", name="uq_doctor_daily_rating"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'))
+    day = db.Column(db.Date)
+    reviews = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0)
+
+
+# Precomputed "similar doctors" by profile text, maintained by app/similar.py; rank 1 is the closest
+class SimilarDoctor(db.Model):
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # Indexed for finding the lists a changed doctor appears in
+    similar_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'), index=True)
+    score = db.Column(db.Float)
+
+
+### Waitlist for fully booked days, served by app/waitlist.py ###
+# Entries queue per doctor and day in joining order; a cancelled slot is offered
+# to the head of the queue and held for it until offer_expires_at
+class WaitlistEntry(db.Model):
+    __table_args__ = (
+        db.Index("ix_waitlist_entry_queue", "doctor_id", "date", "status", "created_at"),
+        db.Index("ix_waitlist_entry_patient_status", "patient_id", "status"),
+        db.Index("ix_waitlist_entry_status_expires", "status", "offer_expires_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profile.id'))
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient_profile.id'))
+    date = db.Column(db.String(50))
+    # waiting, offered, booked, declined, expired or left
+    status = db.Column(db.String(20), default="waiting")
+    slot_time = db.Column(db.String(50))
+    offer_expires_at = db.Column(db.DateTime)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    doctor = db.relationship("DoctorProfile", lazy="select")
+
+
+# How far each incremental job has processed its source rows
+class RollupWatermark(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime)
 
 
 @login_manager.user_loader
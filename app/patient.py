@@ -1,93 +1,60 @@
-from flask import Blueprint, render_template, request, redirect, current_app, abort, flash, url_for
+from flask import Blueprint, Response, render_template, request, redirect, current_app, abort, flash, session, url_for, stream_with_context
 from flask_login import login_required, current_user
-from .models import DoctorProfile, Appointment, PatientProfile, Availability, User, Review, Message
+from .models import DoctorProfile, Appointment, PatientProfile, Availability, User, Review, Payment
+from .appcache import cached
 from .extensions import db
-from werkzeug.utils import secure_filename
-import os
-import razorpay
+from .fhir import bundle_chunks
+from .loading import APPOINTMENT_WITH_DOCTOR, DOCTOR_JOINED_USER, PATIENT_RECORD, planned
+from .messages import message_history
+from .metrics import timed_call
+from .payments import payment_gateway
+from .replicas import read_only
+from .reviews import ReviewError, average_rating, review_page, submit_review
+from .similar import similar_doctors
+from .waitlist import WaitlistError, accept_offer, held_slots, join_waitlist, leave_waitlist, slot_held, waitlist_entries
+from .uploads import save_image
 
 
 patient = Blueprint("patient", __name__, url_prefix="/patient")
 
-@patient.route("/dashboard")
-@login_required
-def dashboard():
-
-    # Fetch upcoming appointments
-    upcoming = Appointment.query.filter(
-        Appointment.patient_id == current_user.patient_profile.id,
-        Appointment.status.in_(['pending', 'confirmed', 'paid'])
-    ).order_by(Appointment.date).limit(5).all()
-
-    # Count values
-    upcoming_count = len(upcoming)
-    total_doctors = DoctorProfile.query.count()
-
-    total_consultations = Appointment.query.filter_by(
-        patient_id=current_user.patient_profile.id,
-        status="completed"
-    ).count()
-
-    return render_template(
-        "patient/dashboard.html",
-        upcoming=upcoming,
-        upcoming_count=upcoming_count,
-        total_doctors=total_doctors,
-        total_consultations=total_consultations
+def build_slots(doctor_id, days=7):
+    """Hourly slots for the next `days` days, keyed by weekday name."""
+    from datetime import date
+    return cached(
+        f"slots:{doctor_id}:{date.today()}:{days}",
+        lambda: _build_slots(doctor_id, days),
+        tags=[f"doctor:{doctor_id}:availability", f"doctor:{doctor_id}:appointments", f"doctor:{doctor_id}:holds"],
     )
 
 
-@patient.route("/find-doctor")
-def find_doctor():
-    search = request.args.get("search")
-
-    query = DoctorProfile.query.join(DoctorProfile.user)
-
-    if search:
-        query = query.filter(
-            (DoctorProfile.specialization.ilike(f"%{search}%")) |
-            (User.name.ilike(f"%{search}%"))
-        )
-
-    doctors = query.all()
-    return render_template(
-        "patient/find_doctor.html",
-        doctors=doctors,
-        search=search
-    )
-
-
-@patient.route("/doctor/<int:id>")
-@login_required
-def doctor_preview(id):
-
-    doctor = DoctorProfile.query.get_or_404(id)
-
+def _build_slots(doctor_id, days):
     # Get weekly availability
     weekly_avail = Availability.query.filter_by(
-        doctor_id=id,
+        doctor_id=doctor_id,
         type="weekly"
     ).all()
 
     # Get overrides
     overrides = Availability.query.filter_by(
-        doctor_id=id,
+        doctor_id=doctor_id,
         type="override"
     ).all()
 
     # Get booked appointments
     booked_slots = Appointment.query.filter_by(
-        doctor_id=id,
+        doctor_id=doctor_id,
         status="accepted"
     ).with_entities(Appointment.date, Appointment.time).all()
     booked_set = set((a.date, a.time) for a in booked_slots)
+    # Slots held for a waitlisted patient's open offer
+    booked_set |= held_slots(doctor_id)
 
-    # Generate slots for next 7 days
+    # Generate slots for the coming days
     from datetime import datetime, timedelta
     today = datetime.now().date()
     slots_by_day = {}
 
-    for i in range(7):
+    for i in range(days):
         current_date = today + timedelta(days=i)
         day_name = current_date.strftime("%A")  # Monday, Tuesday, etc.
 
@@ -119,22 +86,80 @@ def doctor_preview(id):
                 'slots': slots
             }
 
-    # Fetch reviews
-    reviews = Review.query.filter_by(doctor_id=id).order_by(Review.created_at.desc()).all()
+    return slots_by_day
 
-    # Calculate average rating
-    if reviews:
-        avg_rating = sum(r.rating for r in reviews) / len(reviews)
-        avg_rating = round(avg_rating, 1)
-    else:
-        avg_rating = 0
+
+@patient.route("/dashboard")
+@read_only
+@login_required
+def dashboard():
+
+    # Fetch upcoming appointments
+    upcoming = Appointment.query.options(*planned(APPOINTMENT_WITH_DOCTOR)).filter(
+        Appointment.patient_id == current_user.patient_profile.id,
+        Appointment.status.in_(['pending', 'confirmed', 'paid'])
+    ).order_by(Appointment.date).limit(5).all()
+
+    # Count values
+    upcoming_count = len(upcoming)
+    total_doctors = cached("doctor-count", DoctorProfile.query.count, tags=["doctor-directory"])
+
+    total_consultations = Appointment.query.filter_by(
+        patient_id=current_user.patient_profile.id,
+        status="completed"
+    ).count()
+
+    return render_template(
+        "patient/dashboard.html",
+        upcoming=upcoming,
+        upcoming_count=upcoming_count,
+        total_doctors=total_doctors,
+        total_consultations=total_consultations
+    )
+
+
+@patient.route("/find-doctor")
+@read_only
+def find_doctor():
+    search = request.args.get("search")
+
+    query = DoctorProfile.query.join(DoctorProfile.user).options(*planned(DOCTOR_JOINED_USER))
+
+    if search:
+        query = query.filter(
+            (DoctorProfile.specialization.ilike(f"%{search}%")) |
+            (User.name.ilike(f"%{search}%"))
+        )
+
+    doctors = query.all()
+    return render_template(
+        "patient/find_doctor.html",
+        doctors=doctors,
+        search=search
+    )
+
+
+@patient.route("/doctor/<int:id>")
+@read_only
+@login_required
+def doctor_preview(id):
+
+    # Credentials/expertise stay deferred: they are only read when the cached fragments miss
+    doctor = DoctorProfile.query.get_or_404(id)
+
+    slots_by_day = build_slots(id)
+
+    # One page of reviews; totals come from the doctor's counters
+    reviews, next_before = review_page(id, request.args.get("before", type=int))
 
     return render_template(
         "patient/doctor_preview.html",
         doctor=doctor,
         slots_by_day=slots_by_day,
         reviews=reviews,
-        avg_rating=avg_rating
+        next_before=next_before,
+        avg_rating=average_rating(doctor),
+        similar=similar_doctors(id, 5),
     )
 
 
@@ -156,6 +181,9 @@ def book(doctor_id):
     if existing:
         return "Slot already booked", 400
 
+    if slot_held(doctor_id, date, time, current_user.patient_profile.id):
+        return "Slot is held for a waitlisted patient", 400
+
     # Check override
     blocked = Availability.query.filter_by(
         doctor_id=doctor_id,
@@ -187,16 +215,12 @@ def payment(appointment_id):
         abort(403)
     
     # Create Razorpay order
-    client = razorpay.Client(auth=(current_app.config['RAZORPAY_KEY_ID'], current_app.config['RAZORPAY_KEY_SECRET']))
-    order_data = {
-        "amount": appt.doctor.fees * 100,
-        "currency": "INR",
-        "receipt": f"appointment_{appt.id}",
-        "notes": {
-            "appointment_id": appt.id
-        }
-    }
-    order = client.order.create(data=order_data)
+    with timed_call("payment", "create_order"):
+        order = payment_gateway().create_order(
+            amount=appt.doctor.fees * 100,
+            receipt=f"appointment_{appt.id}",
+            notes={"appointment_id": appt.id}
+        )
     
     return render_template("patient/payment.html", appointment=appt, razorpay_key=current_app.config['RAZORPAY_KEY_ID'], order_id=order['id'])
 
@@ -211,14 +235,20 @@ def payment_success(appointment_id):
     data = request.get_json()
     
     # Verify payment signature
-    client = razorpay.Client(auth=(current_app.config['RAZORPAY_KEY_ID'], current_app.config['RAZORPAY_KEY_SECRET']))
     try:
-        client.utility.verify_payment_signature({
-            'razorpay_order_id': data['razorpay_order_id'],
-            'razorpay_payment_id': data['razorpay_payment_id'],
-            'razorpay_signature': data['razorpay_signature']
-        })
+        with timed_call("payment", "verify"):
+            payment_gateway().verify(
+                data['razorpay_order_id'],
+                data['razorpay_payment_id'],
+                data['razorpay_signature']
+            )
         appt.status = "paid"
+        db.session.add(Payment(
+            appointment_id=appt.id,
+            amount=appt.doctor.fees,
+            status="paid",
+            provider_payment_id=data['razorpay_payment_id'],
+        ))
         db.session.commit()
     except:
         # Payment verification failed
@@ -227,16 +257,76 @@ def payment_success(appointment_id):
     return redirect("/patient/my-appointments")
 
 
+@patient.route("/appointment/<int:appointment_id>/review", methods=["POST"])
+@login_required
+def review_appointment(appointment_id):
+    profile = current_user.patient_profile
+    if profile is None:
+        abort(403)
+    try:
+        submit_review(profile.id, appointment_id, request.form.get("rating"), request.form.get("comment"))
+    except ReviewError as e:
+        if e.status == 404:
+            abort(404)
+        flash(str(e), "error")
+    else:
+        flash("Thank you for your review.", "success")
+    return redirect(url_for("patient.my_appointments"))
+
+
+@patient.route("/waitlist/<int:doctor_id>", methods=["POST"])
+@login_required
+def join_doctor_waitlist(doctor_id):
+    profile = current_user.patient_profile
+    if profile is None:
+        abort(403)
+    try:
+        entry = join_waitlist(profile.id, doctor_id, request.form.get("date"))
+    except WaitlistError as e:
+        if e.status == 404:
+            abort(404)
+        flash(str(e), "error")
+    else:
+        session["waitlisting"] = True
+        flash(f"You are on the waitlist for {entry.date}; we will offer you a slot if one opens.", "success")
+    return redirect(url_for("patient.my_appointments"))
+
+
+@patient.route("/waitlist/entry/<int:entry_id>/<any(accept, leave):action>", methods=["POST"])
+@login_required
+def waitlist_entry(entry_id, action):
+    profile = current_user.patient_profile
+    if profile is None:
+        abort(403)
+    try:
+        if action == "accept":
+            appt = accept_offer(profile.id, entry_id)
+        else:
+            leave_waitlist(profile.id, entry_id)
+    except WaitlistError as e:
+        if e.status == 404:
+            abort(404)
+        flash(str(e), "error")
+    else:
+        if action == "accept":
+            flash(f"Booked {appt.date} at {appt.time}; the doctor will confirm it.", "success")
+        else:
+            flash("You have left the waitlist.", "success")
+    return redirect(url_for("patient.my_appointments"))
+
+
 @patient.route("/my-appointments")
+@read_only
 @login_required
 def my_appointments():
     from datetime import datetime
-    upcoming = Appointment.query.filter(
+    appointments = Appointment.query.options(*planned(APPOINTMENT_WITH_DOCTOR))
+    upcoming = appointments.filter(
         Appointment.patient_id == current_user.patient_profile.id,
         Appointment.status.in_(['pending', 'confirmed', 'paid'])
     ).all()
-    past = Appointment.query.filter_by(patient_id=current_user.patient_profile.id, status="completed").all()
-    canceled = Appointment.query.filter_by(patient_id=current_user.patient_profile.id, status="canceled").all()
+    past = appointments.filter_by(patient_id=current_user.patient_profile.id, status="completed").all()
+    canceled = appointments.filter_by(patient_id=current_user.patient_profile.id, status="canceled").all()
     
     def format_date(appt):
         try:
@@ -251,8 +341,19 @@ def my_appointments():
     upcoming = [format_date(a) for a in upcoming]
     past = [format_date(a) for a in past]
     canceled = [format_date(a) for a in canceled]
+
+    reviewed = {appointment_id for (appointment_id,) in db.session.query(Review.appointment_id).filter(
+        Review.appointment_id.in_([a.id for a in past])
+    )} if past else set()
     
-    return render_template("patient/my_appointments.html", upcoming=upcoming, past=past, canceled=canceled)
+    waitlist = waitlist_entries(current_user.patient_profile.id)
+    # Lets base.html listen for offers while the patient is on a waitlist
+    session["waitlisting"] = bool(waitlist)
+
+    return render_template(
+        "patient/my_appointments.html", upcoming=upcoming, past=past, canceled=canceled, reviewed=reviewed,
+        waitlist=waitlist,
+    )
 
 
 @patient.route("/profile", methods=["GET", "POST"])
@@ -284,27 +385,39 @@ def profile():
         profile.country = request.form.get("country")
 
         # Handle file upload for patient profile picture
-        print(f"Patient profile file: {request.files.get('patient_profile')}")
-        upload_dir = os.path.join(current_app.static_folder, 'uploads')
-        print(f"Upload dir: {upload_dir}")
         if 'patient_profile' in request.files:
             file = request.files['patient_profile']
             if file and file.filename:
-                filename = f"{current_user.id}_{secure_filename(file.filename)}"
-                os.makedirs(upload_dir, exist_ok=True)
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                profile.profile_pic = filename
-                print(f"Saved patient profile_pic: {profile.profile_pic}")
-            else:
-                print("No file or empty filename")
+                filename = save_image(file)
+                if filename:
+                    profile.profile_pic = filename
+                    current_app.logger.debug("Saved patient profile_pic: %s", profile.profile_pic)
+                else:
+                    flash("Profile picture must be an image.", "error")
 
         db.session.commit()
         return redirect("/patient/profile")
 
+    # Load the deferred medical/insurance/address groups in one query instead of one per group
+    PatientProfile.query.options(*PATIENT_RECORD).filter_by(id=profile.id).one()
     return render_template("patient/profile.html")
 
 
+@patient.route("/records/fhir")
+@login_required
+def records_fhir():
+    """The signed-in patient's whole record as a FHIR R4 Bundle, streamed as it is serialized."""
+    profile = current_user.patient_profile
+    if profile is None:
+        abort(403)
+    chunks = bundle_chunks(profile.id)
+    return Response(
+        stream_with_context(chunks),
+        mimetype="application/fhir+json",
+        headers={"Content-Disposition": 'attachment; filename="health-record.fhir.json"'},
+    )
+
+
 @patient.route("/consultations")
 @login_required
 def consultations():
@@ -322,6 +435,7 @@ def consultations():
 
 
 @patient.route("/consultation/<int:appointment_id>")
+@read_only
 @login_required
 def consultation(appointment_id):
     appointment = Appointment.query.filter_by(id=appointment_id, patient_id=current_user.patient_profile.id).first_or_404()
@@ -338,12 +452,12 @@ def consultation(appointment_id):
         Appointment.patient_id == current_user.patient_profile.id
     ).subquery()
     
-    recent_appointments = Appointment.query.join(
+    recent_appointments = Appointment.query.options(*planned(APPOINTMENT_WITH_DOCTOR)).join(
         doctor_appointments,
         (Appointment.id == doctor_appointments.c.id) & (doctor_appointments.c.row_num == 1)
     ).order_by(Appointment.date.desc()).all()
     
-    messages = Message.query.filter_by(appointment_id=appointment_id).order_by(Message.timestamp).all()
+    messages = message_history(appointment_id)
     
     return render_template("patient/consultation.html", appointment=appointment, doctor_appointments=recent_appointments, messages=messages)
 
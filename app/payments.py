@@ -0,0 +1,65 @@
+import hashlib
+import hmac
+import os
+
+from flask import current_app
+
+
+class PaymentError(Exception):
+    pass
+
+
+class RazorpayGateway:
+    def __init__(self, key_id, key_secret):
+        import razorpay
+        self.client = razorpay.Client(auth=(key_id, key_secret))
+
+    def create_order(self, amount, receipt, notes=None):
+        return self.client.order.create(data={
+            "amount": amount,
+            "currency": "INR",
+            "receipt": receipt,
+            "notes": notes or {},
+        })
+
+    def verify(self, order_id, payment_id, signature):
+        import razorpay
+        try:
+            self.client.utility.verify_payment_signature({
+                "razorpay_order_id": order_id,
+                "razorpay_payment_id": payment_id,
+                "razorpay_signature": signature,
+            })
+        except razorpay.errors.SignatureVerificationError as e:
+            raise PaymentError(str(e))
+
+
+class StubGateway:
+    """Offline stand-in for load tests and local runs.
+
+    Orders never leave the process; signatures use Razorpay's scheme
+    (HMAC-SHA256 of "order_id|payment_id" with the key secret), so the
+    verification path is still exercised.
+    """
+
+    def __init__(self, key_secret):
+        self.key_secret = key_secret
+
+    def create_order(self, amount, receipt, notes=None):
+        return {"id": "order_stub_" + os.urandom(7).hex(), "amount": amount, "currency": "INR", "receipt": receipt}
+
+    def sign(self, order_id, payment_id):
+        message = f"{order_id}|{payment_id}".encode()
+        return hmac.new(self.key_secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def verify(self, order_id, payment_id, signature):
+        if not hmac.compare_digest(self.sign(order_id, payment_id), signature or ""):
+            raise PaymentError("Signature mismatch")
+
+
+def payment_gateway():
+    """The gateway selected by PAYMENT_GATEWAY ("razorpay" or "stub")."""
+    config = current_app.config
+    if config.get("PAYMENT_GATEWAY") == "stub":
+        return StubGateway(config["RAZORPAY_KEY_SECRET"])
+    return RazorpayGateway(config["RAZORPAY_KEY_ID"], config["RAZORPAY_KEY_SECRET"])
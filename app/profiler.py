@@ -0,0 +1,198 @@
+import functools
+import hmac
+import json
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+
+from .sqlstats import RequestQueryStats
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread.
+
+    The profiled code runs untouched; the cost is the sampler waking up,
+    which at the default 5ms is negligible next to a slow page.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            # Root first, ending in the frame that was running
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format, one `a;b;c count` line per stack."""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats_data(self):
+        """The samples as the marshalled dict pstats.Stats() loads.
+
+        Each sample charges `interval` seconds of own time to the running
+        frame and cumulative time to every distinct frame on its stack.
+        """
+        stats = {}
+        for stack, count in self.stacks.items():
+            seconds = count * self.interval
+            seen = set()
+            for depth, func in enumerate(stack):
+                cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+                if depth == len(stack) - 1:
+                    tt += seconds
+                if func not in seen:
+                    ct += seconds
+                    seen.add(func)
+                    nc += count
+                    cc += count
+                if depth:
+                    caller = stack[depth - 1]
+                    c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (c_cc + count, c_nc + count, c_tt, c_ct + seconds)
+                stats[func] = (cc, nc, tt, ct, callers)
+        return stats
+
+
+def should_profile():
+    """Profile when the X-Profile header carries PROFILER_TOKEN, or by PROFILE_SAMPLE_RATE."""
+    config = current_app.config
+    token = config.get("PROFILER_TOKEN")
+    header = request.headers.get("X-Profile") if has_request_context() else None
+    if token and header and hmac.compare_digest(header, token):
+        return True
+    rate = config.get("PROFILE_SAMPLE_RATE", 0)
+    return rate > 0 and random.random() < rate
+
+
+def profile_dir():
+    return current_app.config.get("PROFILE_DIR") or os.path.join(current_app.instance_path, "profiles")
+
+
+def save_profile(profiler, name, meta):
+    """Write <stamp>-<name>.pstats/.collapsed/.json and drop the oldest profiles past PROFILE_MAX_FILES."""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}-{name.replace('/', '_')}")
+    with open(base + ".pstats", "wb") as f:
+        marshal.dump(profiler.pstats_data(), f)
+    with open(base + ".collapsed", "w") as f:
+        f.write(profiler.collapsed())
+    meta.update({
+        "duration_ms": round(profiler.elapsed * 1000, 2),
+        "samples": profiler.samples,
+        "interval_ms": profiler.interval * 1000,
+    })
+    with open(base + ".json", "w") as f:
+        json.dump(meta, f, indent=2, default=str)
+    rotate(directory, current_app.config.get("PROFILE_MAX_FILES", 200))
+    return base
+
+
+def rotate(directory, keep):
+    profiles = sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+    for stale in profiles[:-max(keep, 1)]:
+        for ext in (".pstats", ".collapsed", ".json"):
+            try:
+                os.remove(os.path.join(directory, stale + ext))
+            except FileNotFoundError:
+                pass
+
+
+def _user_role():
+    return current_user.role if current_user.is_authenticated else "anonymous"
+
+
+def _start_request_profile():
+    if should_profile():
+        g.profiler = SamplingProfiler(threading.get_ident(), current_app.config.get("PROFILE_INTERVAL", 0.005)).start()
+
+
+def _finish_request_profile(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.stop()
+    meta = {
+        "kind": "request",
+        "endpoint": request.endpoint,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "user_role": _user_role(),
+    }
+    # Registered after init_sql_stats, so this runs before its summary is popped
+    stats = g.get("sql_stats")
+    if stats is not None:
+        meta["sql"] = stats.summary(current_app.config.get("SQL_STATS_N_PLUS_ONE_THRESHOLD", 3))
+    path = save_profile(profiler, request.endpoint or "unmatched", meta)
+    response.headers["X-Profile-Id"] = os.path.basename(path)
+    return response
+
+
+def profiled_event(name):
+    """Profile a SocketIO handler under the same header/sampling rules; apply below @socketio.on."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not should_profile():
+                return handler(*args, **kwargs)
+            # The engine hooks in sqlstats record into g.sql_stats, as they do for requests
+            outer = g.pop("sql_stats", None)
+            stats = g.sql_stats = RequestQueryStats()
+            profiler = SamplingProfiler(threading.get_ident(), current_app.config.get("PROFILE_INTERVAL", 0.005)).start()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                profiler.stop()
+                g.pop("sql_stats", None)
+                if outer is not None:
+                    g.sql_stats = outer
+                save_profile(profiler, f"socket-{name}", {
+                    "kind": "socketio",
+                    "event": name,
+                    "user_role": _user_role(),
+                    "sql": stats.summary(current_app.config.get("SQL_STATS_N_PLUS_ONE_THRESHOLD", 3)),
+                })
+        return wrapper
+    return decorator
+
+
+def init_profiler(app):
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
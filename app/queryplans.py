@@ -0,0 +1,158 @@
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, text
+
+from .extensions import db
+from .models import (
+    Appointment, Availability, DoctorDailyRating, DoctorDailyStats, DoctorPatient, DoctorProfile, Message, PatientProfile,
+    Review, SimilarDoctor, WaitlistEntry,
+)
+
+
+# The filter shapes of the hot views in patient.py and doctor.py. Each entry
+# builds the same WHERE/ORDER BY as its view, with placeholder ids.
+HOT_QUERIES = {
+    "patient.dashboard upcoming": lambda: db.select(Appointment).where(
+        Appointment.patient_id == 1, Appointment.status.in_(["pending", "confirmed", "paid"])
+    ).order_by(Appointment.date).limit(5),
+    "patient.dashboard completed count": lambda: db.select(func.count()).select_from(Appointment).where(
+        Appointment.patient_id == 1, Appointment.status == "completed"
+    ),
+    "doctor_preview weekly availability": lambda: db.select(Availability).where(
+        Availability.doctor_id == 1, Availability.type == "weekly"
+    ),
+    "doctor_preview booked slots": lambda: db.select(Appointment.date, Appointment.time).where(
+        Appointment.doctor_id == 1, Appointment.status == "accepted"
+    ),
+    "book slot taken": lambda: db.select(Appointment).where(
+        Appointment.doctor_id == 1, Appointment.date == "2026-01-01",
+        Appointment.time == "10:00", Appointment.status == "accepted"
+    ).limit(1),
+    "book override": lambda: db.select(Availability).where(
+        Availability.doctor_id == 1, Availability.type == "override", Availability.date == "2026-01-01"
+    ).limit(1),
+    "doctor.dashboard appointments": lambda: db.select(Appointment).where(
+        Appointment.doctor_id == 1
+    ).order_by(Appointment.date),
+    "doctor.dashboard pending count": lambda: db.select(func.count()).select_from(Appointment).where(
+        Appointment.doctor_id == 1, Appointment.status == "pending"
+    ),
+    "doctor.patient_preview access": lambda: db.select(DoctorPatient).where(
+        DoctorPatient.doctor_id == 1, DoctorPatient.patient_id == 1
+    ),
+    "doctor.patients": lambda: db.select(DoctorPatient).where(
+        DoctorPatient.doctor_id == 1
+    ).order_by(DoctorPatient.last_visit.desc()).limit(20),
+    "doctor.consultations latest per patient": lambda: db.select(Appointment).join(
+        DoctorPatient, DoctorPatient.last_appointment_id == Appointment.id
+    ).where(DoctorPatient.doctor_id == 1, DoctorPatient.visit_count > 0),
+    "registry refresh": lambda: db.select(Appointment.id, Appointment.status).where(
+        Appointment.doctor_id == 1, Appointment.patient_id == 1
+    ).order_by(Appointment.date.desc()).limit(1),
+    "consultation messages": lambda: db.select(Message).where(
+        Message.appointment_id == 1
+    ).order_by(Message.timestamp),
+    "doctor reviews page": lambda: db.select(Review).where(
+        Review.doctor_id == 1, Review.created_at <= datetime(2026, 1, 1)
+    ).order_by(Review.created_at.desc(), Review.id.desc()).limit(11),
+    "review rate limit": lambda: db.select(func.count(Review.id)).where(
+        Review.patient_id == 1, Review.created_at > datetime(2026, 1, 1)
+    ),
+    "review per appointment": lambda: db.select(Review.id).where(Review.appointment_id == 1),
+    "doctor_preview similar doctors": lambda: db.select(SimilarDoctor).where(
+        SimilarDoctor.doctor_id == 1
+    ).order_by(SimilarDoctor.rank).limit(5),
+    "waitlist queue head": lambda: db.select(WaitlistEntry.id).where(
+        WaitlistEntry.doctor_id == 1, WaitlistEntry.date == "2026-01-01", WaitlistEntry.status == "waiting"
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).limit(1),
+    "waitlist held slots": lambda: db.select(WaitlistEntry.date, WaitlistEntry.slot_time).where(
+        WaitlistEntry.doctor_id == 1, WaitlistEntry.date >= "2026-01-01", WaitlistEntry.status == "offered",
+        WaitlistEntry.offer_expires_at > datetime(2026, 1, 1),
+    ),
+    "waitlist holds version": lambda: db.select(
+        func.count(WaitlistEntry.id), func.max(WaitlistEntry.id), func.max(WaitlistEntry.offer_expires_at)
+    ).where(
+        WaitlistEntry.doctor_id == 1, WaitlistEntry.date >= "2026-01-01", WaitlistEntry.status == "offered",
+        WaitlistEntry.offer_expires_at > datetime(2026, 1, 1),
+    ),
+    "waitlist patient entries": lambda: db.select(WaitlistEntry).where(
+        WaitlistEntry.patient_id == 1, WaitlistEntry.status.in_(["waiting", "offered"])
+    ),
+    "waitlist expired offers": lambda: db.select(WaitlistEntry.id).where(
+        WaitlistEntry.status == "offered", WaitlistEntry.offer_expires_at <= datetime(2026, 1, 1)
+    ),
+    "freed slot occupancy": lambda: db.select(Appointment.id).where(
+        Appointment.doctor_id == 1, Appointment.date == "2026-01-01", Appointment.time == "10:00",
+        Appointment.status.in_(["pending", "accepted", "confirmed", "paid"]),
+    ),
+    "similar doctors listing a changed doctor": lambda: db.select(SimilarDoctor.doctor_id).where(
+        SimilarDoctor.similar_id.in_([1, 2])
+    ).distinct(),
+    "analytics daily stats": lambda: db.select(DoctorDailyStats).where(
+        DoctorDailyStats.doctor_id == 1, DoctorDailyStats.day.between(date(2026, 1, 1), date(2026, 12, 31))
+    ),
+    "analytics daily ratings": lambda: db.select(DoctorDailyRating).where(
+        DoctorDailyRating.doctor_id == 1, DoctorDailyRating.day.between(date(2026, 1, 1), date(2026, 12, 31))
+    ),
+    "rollup changed appointments": lambda: db.select(Appointment.doctor_id, Appointment.date).where(
+        Appointment.updated_at > datetime(2026, 1, 1), Appointment.updated_at <= datetime(2026, 1, 2)
+    ).distinct(),
+    "rollup changed reviews": lambda: db.select(Review.doctor_id, Review.created_at).where(
+        Review.created_at > datetime(2026, 1, 1), Review.created_at <= datetime(2026, 1, 2)
+    ),
+    "current_user.patient_profile": lambda: db.select(PatientProfile).where(PatientProfile.user_id == 1),
+    "current_user.doctor_profile": lambda: db.select(DoctorProfile).where(DoctorProfile.user_id == 1),
+}
+
+
+def explain(statement):
+    """Return (plan lines, full-scan table names) for a statement on the current database."""
+    bind = db.session.get_bind()
+    sql = str(statement.compile(bind, compile_kwargs={"literal_binds": True}))
+    if bind.dialect.name == "sqlite":
+        rows = db.session.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+        lines = [row[-1] for row in rows]
+        # "SCAN appointment" is a full scan; "SCAN ... USING (COVERING) INDEX" is an index walk
+        scans = [line.split()[1] for line in lines if line.startswith("SCAN ") and "USING" not in line]
+    else:
+        rows = db.session.execute(text("EXPLAIN " + sql)).mappings().all()
+        lines = [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+        scans = [row["table"] for row in rows if row["type"] == "ALL"]
+    return lines, scans
+
+
+def check_plans():
+    """Map of query name -> full-scanned tables, for every hot query that falls back to a scan."""
+    failures = {}
+    for name, build in HOT_QUERIES.items():
+        _lines, scans = explain(build())
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+@click.command("explain-hot-queries")
+@click.option("--verbose", is_flag=True, help="Print every plan, not just the failures.")
+@with_appcontext
+def explain_command(verbose):
+    """EXPLAIN every hot query and exit non-zero if one does a full table scan.
+
+    Run against a database with realistic row counts:
+    MySQL may legitimately prefer a scan on near-empty tables.
+    """
+    failed = False
+    for name, build in HOT_QUERIES.items():
+        lines, scans = explain(build())
+        if scans:
+            failed = True
+            click.echo(f"FULL SCAN  {name}: {', '.join(scans)}")
+        elif verbose:
+            click.echo(f"ok         {name}")
+        if verbose or scans:
+            for line in lines:
+                click.echo(f"    {line}")
+    if failed:
+        raise SystemExit(1)
+    click.echo(f"All {len(HOT_QUERIES)} hot queries use an index.")
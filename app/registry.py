@@ -0,0 +1,149 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import Appointment, DoctorPatient, DoctorProfile
+from .replicas import RoutingSession
+
+
+# Appointment columns a registry row is derived from
+TRACKED = ("doctor_id", "patient_id", "status", "date", "time")
+# Doctors per grouped query in a rebuild
+DOCTOR_BATCH = 1000
+
+
+def is_patient_of(doctor_id, patient_id):
+    """True if the doctor and patient share an appointment; a primary-key lookup."""
+    return db.session.get(DoctorPatient, (doctor_id, patient_id)) is not None
+
+
+def _visits_query():
+    active = Appointment.status != "cancelled"
+    return select(
+        Appointment.doctor_id,
+        Appointment.patient_id,
+        func.sum(case((active, 1), else_=0)),
+        func.min(case((active, Appointment.date))),
+        func.max(case((active, Appointment.date))),
+    ).group_by(Appointment.doctor_id, Appointment.patient_id)
+
+
+def _latest_query(doctor_id, patient_id):
+    return select(Appointment.id, Appointment.status).where(
+        Appointment.doctor_id == doctor_id, Appointment.patient_id == patient_id
+    ).order_by(
+        case((Appointment.status == "cancelled", 1), else_=0),
+        Appointment.date.desc(), Appointment.time.desc(), Appointment.id.desc(),
+    ).limit(1)
+
+
+def refresh_pair(session, doctor_id, patient_id):
+    """Recompute one registry row from the pair's appointments (indexed on doctor_id, patient_id).
+
+    The row is rebuilt rather than adjusted, so any later write to the pair
+    repairs it and a status change needs no knowledge of the old value.
+    """
+    latest = session.execute(_latest_query(doctor_id, patient_id)).first()
+    if latest is None:
+        session.execute(delete(DoctorPatient).where(
+            DoctorPatient.doctor_id == doctor_id, DoctorPatient.patient_id == patient_id
+        ))
+        return
+    _doctor, _patient, visits, first, last = session.execute(_visits_query().where(
+        Appointment.doctor_id == doctor_id, Appointment.patient_id == patient_id
+    )).one()
+    values = {"visit_count": visits or 0, "first_visit": first, "last_visit": last,
+              "last_appointment_id": latest.id, "last_status": latest.status}
+    changed = session.execute(update(DoctorPatient).where(
+        DoctorPatient.doctor_id == doctor_id, DoctorPatient.patient_id == patient_id
+    ).values(values)).rowcount
+    if not changed:
+        connection = session.connection()
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(DoctorPatient).values(doctor_id=doctor_id, patient_id=patient_id, **values))
+        except IntegrityError:
+            # A concurrent booking for the same pair inserted it first
+            session.execute(update(DoctorPatient).where(
+                DoctorPatient.doctor_id == doctor_id, DoctorPatient.patient_id == patient_id
+            ).values(values))
+
+
+def _changed_pairs(session):
+    pairs = set()
+    for obj in session.new:
+        if isinstance(obj, Appointment):
+            pairs.add((obj.doctor_id, obj.patient_id))
+    for obj in session.deleted:
+        if isinstance(obj, Appointment):
+            pairs.add((obj.doctor_id, obj.patient_id))
+    for obj in session.dirty:
+        if not isinstance(obj, Appointment):
+            continue
+        attrs = inspect(obj).attrs
+        if not any(attrs[name].history.has_changes() for name in TRACKED):
+            continue
+        pairs.add((obj.doctor_id, obj.patient_id))
+        # Moved to another doctor or patient: the old pair changes too
+        old_doctor = attrs.doctor_id.history.deleted or [obj.doctor_id]
+        old_patient = attrs.patient_id.history.deleted or [obj.patient_id]
+        pairs.add((old_doctor[0], old_patient[0]))
+    return {pair for pair in pairs if None not in pair}
+
+
+def _refresh_changed(session, flush_context):
+    for doctor_id, patient_id in sorted(_changed_pairs(session)):
+        refresh_pair(session, doctor_id, patient_id)
+
+
+def rebuild_registry(batch_size=DOCTOR_BATCH):
+    """Recompute every registry row, `batch_size` doctor ids per grouped query.
+
+    For writes the flush hook cannot see, such as bulk inserts.
+    """
+    db.session.execute(delete(DoctorPatient))
+    last_id = db.session.query(func.max(DoctorProfile.id)).scalar() or 0
+    total = 0
+    for low in range(0, last_id + 1, batch_size):
+        high = low + batch_size
+        in_batch = (Appointment.doctor_id >= low, Appointment.doctor_id < high)
+        # Latest appointment per pair, in the same order as _latest_query
+        ranked = select(
+            Appointment.doctor_id, Appointment.patient_id, Appointment.id, Appointment.status,
+        ).where(*in_batch).order_by(
+            Appointment.doctor_id, Appointment.patient_id,
+            case((Appointment.status == "cancelled", 1), else_=0),
+            Appointment.date.desc(), Appointment.time.desc(), Appointment.id.desc(),
+        )
+        latest = {}
+        for doctor_id, patient_id, id, status in db.session.execute(ranked):
+            latest.setdefault((doctor_id, patient_id), (id, status))
+        rows = [
+            {"doctor_id": doctor_id, "patient_id": patient_id, "visit_count": visits or 0,
+             "first_visit": first, "last_visit": last,
+             "last_appointment_id": latest[doctor_id, patient_id][0],
+             "last_status": latest[doctor_id, patient_id][1]}
+            for doctor_id, patient_id, visits, first, last in db.session.execute(_visits_query().where(*in_batch))
+            if doctor_id is not None and patient_id is not None
+        ]
+        if rows:
+            db.session.execute(insert(DoctorPatient.__table__), rows)
+        total += len(rows)
+    db.session.commit()
+    return total
+
+
+# Runs inside the flush, so the registry commits or rolls back with the appointment
+event.listen(RoutingSession, "after_flush", _refresh_changed)
+
+
+registry_cli = click.Group("registry", help="Doctor-patient registry behind \"My patients\".")
+
+
+@registry_cli.command("rebuild")
+@with_appcontext
+def rebuild_command():
+    """Recompute the registry from appointments, e.g. after bulk imports."""
+    click.echo(f"Rebuilt {rebuild_registry()} doctor-patient rows.")
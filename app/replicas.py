@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+
+
+# Seconds a replica's lag measurement is trusted before it is probed again
+LAG_CHECK_INTERVAL = 5
+
+_lag_checks = {}
+_lag_lock = threading.Lock()
+
+
+def read_only(view):
+    """Mark a view as safe to serve from a read replica."""
+    view.read_only = True
+    return view
+
+
+def use_primary():
+    """Route the rest of this request to the primary, e.g. before a read that must see a write."""
+    g.db_primary = True
+
+
+@contextmanager
+def primary_reads():
+    """Route reads inside the block to the primary, then restore the request's routing."""
+    routed = g.get("db_primary", False)
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = routed
+
+
+class RoutingSession(Session):
+    """Session that sends reads in read-only views to a replica.
+
+    Anything that writes (a flush or a DML statement) goes to the primary,
+    and once a request has written, its later reads stay on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, "is_dml", False):
+            replica = pick_replica()
+            if replica is not None and not _has_bind_key(mapper):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _has_bind_key(mapper):
+    # Models explicitly bound elsewhere keep their own engine
+    if mapper is None:
+        return False
+    return inspect(mapper).local_table.metadata.info.get("bind_key") is not None
+
+
+def pick_replica():
+    if not has_request_context():
+        return None
+    replicas = current_app.config.get("SQLALCHEMY_REPLICAS")
+    if not replicas or g.get("db_primary"):
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, "read_only", False):
+        return None
+    # Read-your-writes: a user who just wrote reads from the primary until replicas catch up
+    if cookie_session.get("_primary_until", 0) > time.time():
+        return None
+
+    from .extensions import db
+
+    healthy = [key for key in replicas if replica_lag(key, db.engines[key]) is not None]
+    if not healthy:
+        return None
+    return db.engines[random.choice(healthy)]
+
+
+def replica_lag(key, engine):
+    """Replication lag in seconds, or None if the replica is too far behind or unreachable."""
+    now = time.monotonic()
+    with _lag_lock:
+        checked = _lag_checks.get(key)
+        if checked and now - checked[0] < LAG_CHECK_INTERVAL:
+            return checked[1]
+
+    lag = measure_lag(engine)
+    if lag is not None and lag > current_app.config.get("REPLICA_MAX_LAG_SECONDS", 5):
+        lag = None
+    with _lag_lock:
+        _lag_checks[key] = (now, lag)
+    return lag
+
+
+def measure_lag(engine):
+    if engine.dialect.name != "mysql":
+        # SQLite files and other local stand-ins have no replication to measure
+        return 0
+    try:
+        with engine.connect() as conn:
+            try:
+                row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+            except Exception:
+                row = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+    except Exception as e:
+        current_app.logger.warning("Replica lag check failed: %s", e)
+        return None
+    if row is None:
+        # Not configured as a replica; treat as current
+        return 0
+    # NULL means the replication thread is not running
+    return row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+
+
+def _mark_written(session, flush_context):
+    if has_request_context():
+        g.db_primary = True
+        sticky = current_app.config.get("REPLICA_STICKY_SECONDS", 0)
+        if sticky and current_app.config.get("SQLALCHEMY_REPLICAS"):
+            cookie_session["_primary_until"] = time.time() + sticky
+
+
+event.listen(RoutingSession, "after_flush", _mark_written)
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .appcache import cached
+from .extensions import db
+from .models import Appointment, DoctorProfile, PatientProfile, Review, User
+
+
+REVIEWS_PER_PAGE = 10
+MAX_COMMENT_LENGTH = 2000
+
+
+class ReviewError(Exception):
+    """A rejected submission; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def submit_review(patient_id, appointment_id, rating, comment=None):
+    """Record a patient's review of a completed appointment and add it to the doctor's totals.
+
+    Raises ReviewError if the appointment is not the patient's, is not
+    completed or already has a review, or the patient has reached
+    REVIEW_RATE_LIMIT reviews in the last REVIEW_RATE_WINDOW_SECONDS.
+    """
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        raise ReviewError("Rating must be a number from 1 to 5.")
+    if not 1 <= rating <= 5:
+        raise ReviewError("Rating must be a number from 1 to 5.")
+    comment = (comment or "").strip()
+    if len(comment) > MAX_COMMENT_LENGTH:
+        raise ReviewError(f"Reviews are limited to {MAX_COMMENT_LENGTH} characters.")
+
+    appt = Appointment.query.filter_by(id=appointment_id, patient_id=patient_id).first()
+    if appt is None:
+        raise ReviewError("Appointment not found.", 404)
+    if appt.status != "completed":
+        raise ReviewError("Only completed appointments can be reviewed.", 409)
+    if db.session.query(Review.id).filter_by(appointment_id=appointment_id).first():
+        raise ReviewError("This appointment has already been reviewed.", 409)
+
+    window = current_app.config["REVIEW_RATE_WINDOW_SECONDS"]
+    recent = db.session.query(func.count(Review.id)).filter(
+        Review.patient_id == patient_id, Review.created_at > datetime.utcnow() - timedelta(seconds=window)
+    ).scalar()
+    if recent >= current_app.config["REVIEW_RATE_LIMIT"]:
+        raise ReviewError("Too many reviews; please try again later.", 429)
+
+    review = Review(doctor_id=appt.doctor_id, patient_id=patient_id, appointment_id=appointment_id,
+                    rating=rating, comment=comment or None)
+    db.session.add(review)
+    # Increments in SQL, so concurrent reviews of one doctor do not overwrite each other.
+    # updated_at is left alone: it keys the doctor's cached profile fragments, which show no rating.
+    db.session.execute(update(DoctorProfile).where(DoctorProfile.id == appt.doctor_id).values(
+        review_count=DoctorProfile.review_count + 1,
+        rating_sum=DoctorProfile.rating_sum + rating,
+        updated_at=DoctorProfile.updated_at,
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent submission for the same appointment won
+        db.session.rollback()
+        raise ReviewError("This appointment has already been reviewed.", 409)
+    return review
+
+
+def average_rating(doctor):
+    return round(doctor.rating_sum / doctor.review_count, 1) if doctor.review_count else 0
+
+
+def _reviewer(name):
+    """First name and last initial."""
+    parts = (name or "").split()
+    if not parts:
+        return "Patient"
+    return parts[0] + (f" {parts[1][0]}." if len(parts) > 1 else "")
+
+
+def _read_page(doctor_id, before, per_page):
+    query = db.session.query(
+        Review.id, Review.rating, Review.comment, Review.created_at, User.name,
+    ).outerjoin(PatientProfile, Review.patient_id == PatientProfile.id).outerjoin(
+        User, PatientProfile.user_id == User.id
+    ).filter(Review.doctor_id == doctor_id)
+    if before is not None:
+        anchor = db.session.query(Review.created_at).filter_by(id=before, doctor_id=doctor_id).scalar()
+        if anchor is None:
+            return [], None
+        # (created_at, id) < (anchor, before), written so the range on created_at uses the index
+        query = query.filter(Review.created_at <= anchor, or_(
+            Review.created_at < anchor, and_(Review.created_at == anchor, Review.id < before)
+        ))
+    rows = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(per_page + 1).all()
+    reviews = [
+        {"id": id, "rating": rating, "comment": comment, "created_at": created_at,
+         "reviewer": _reviewer(name)}
+        for id, rating, comment, created_at, name in rows[:per_page]
+    ]
+    return reviews, (reviews[-1]["id"] if len(rows) > per_page else None)
+
+
+def review_page(doctor_id, before=None, per_page=REVIEWS_PER_PAGE):
+    """A newest-first page of a doctor's reviews and the `before` id of the next page (None at the end).
+
+    Each page is one keyset read of per_page + 1 rows on ix_review_doctor_created,
+    however many reviews the doctor has. The first page, which every preview
+    shows, is cached until a review of the doctor commits.
+    """
+    if before is None:
+        return cached(
+            f"doctor:{doctor_id}:reviews:first:{per_page}",
+            lambda: _read_page(doctor_id, None, per_page),
+            tags=[f"doctor:{doctor_id}:reviews"],
+        )
+    return _read_page(doctor_id, before, per_page)
+
+
+def recount_reviews():
+    """Recompute every doctor's review totals from Review, e.g. after bulk inserts."""
+    reviews = Review.__table__
+    doctors = DoctorProfile.__table__
+    db.session.execute(update(doctors).values(
+        review_count=select(func.count(reviews.c.id)).where(reviews.c.doctor_id == doctors.c.id).scalar_subquery(),
+        rating_sum=select(func.coalesce(func.sum(reviews.c.rating), 0)).where(
+            reviews.c.doctor_id == doctors.c.id
+        ).scalar_subquery(),
+        updated_at=doctors.c.updated_at,
+    ))
+    db.session.commit()
@@ -0,0 +1,250 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func, insert
+
+from .extensions import db
+from .models import Appointment, DoctorDailyRating, DoctorDailyStats, DoctorProfile, Payment, Review, RollupWatermark
+
+
+WATERMARK = "doctor_daily"
+STATUSES = ("pending", "accepted", "paid", "completed", "cancelled")
+CHUNK = 10000
+# Doctors per grouped query in a full rebuild; bounds memory, and no cursor is left
+# streaming while the inserts run on the same connection
+DOCTOR_BATCH = 1000
+
+
+def _day(value):
+    """A date from Appointment.date strings and func.date() results; None if unparseable."""
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _stats_query():
+    return db.session.query(
+        Appointment.doctor_id, Appointment.date, Appointment.consultation_type,
+        func.count(Appointment.id),
+        *[func.sum(case((Appointment.status == status, 1), else_=0)) for status in STATUSES],
+    ).group_by(Appointment.doctor_id, Appointment.date, Appointment.consultation_type)
+
+
+def _revenue_query():
+    return db.session.query(
+        Appointment.doctor_id, Appointment.date, Appointment.consultation_type, func.sum(Payment.amount),
+    ).join(Payment, Payment.appointment_id == Appointment.id).filter(
+        Payment.status == "paid"
+    ).group_by(Appointment.doctor_id, Appointment.date, Appointment.consultation_type)
+
+
+def _rating_query():
+    review_day = func.date(Review.created_at)
+    return db.session.query(
+        Review.doctor_id, review_day, func.count(Review.id), func.sum(Review.rating),
+    ).group_by(Review.doctor_id, review_day)
+
+
+def _stats_rows(stats, revenue):
+    """DoctorDailyStats rows from _stats_query() and _revenue_query() results."""
+    revenue = {(doctor_id, d, kind): amount or 0 for doctor_id, d, kind, amount in revenue}
+    for doctor_id, d, kind, bookings, *counts in stats:
+        day = _day(d)
+        if day is None:
+            continue
+        row = {"doctor_id": doctor_id, "day": day, "consultation_type": kind, "bookings": bookings,
+               "revenue": revenue.get((doctor_id, d, kind), 0)}
+        row.update(zip(STATUSES, (c or 0 for c in counts)))
+        yield row
+
+
+def _rating_rows(ratings):
+    for doctor_id, d, reviews, rating_sum in ratings:
+        day = _day(d)
+        if day is not None:
+            yield {"doctor_id": doctor_id, "day": day, "reviews": reviews, "rating_sum": rating_sum or 0}
+
+
+def _insert(model, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            db.session.execute(insert(model.__table__), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model.__table__), chunk)
+
+
+def changed_days(since, until):
+    """(doctor_id -> appointment days, doctor_id -> review days) touched in (since, until]."""
+    stats, ratings = defaultdict(set), defaultdict(set)
+    appointments = db.session.query(Appointment.doctor_id, Appointment.date).filter(
+        Appointment.updated_at > since, Appointment.updated_at <= until
+    ).distinct()
+    # Recording a payment also updates its appointment; this catches payments written on their own
+    payments = db.session.query(Appointment.doctor_id, Appointment.date).join(
+        Payment, Payment.appointment_id == Appointment.id
+    ).filter(Payment.created_at > since, Payment.created_at <= until).distinct()
+    for doctor_id, d in appointments.union(payments):
+        stats[doctor_id].add(d)
+    reviews = db.session.query(Review.doctor_id, func.date(Review.created_at)).filter(
+        Review.created_at > since, Review.created_at <= until
+    ).distinct()
+    for doctor_id, d in reviews:
+        ratings[doctor_id].add(_day(d))
+    return stats, ratings
+
+
+def refresh_doctor(doctor_id, appointment_days, review_days):
+    """Recompute a doctor's rollups for the given days from the source rows.
+
+    Whole days are recomputed rather than adjusted, so a status change
+    (pending -> cancelled) needs no knowledge of the previous value and
+    re-running over the same window is harmless.
+    """
+    if appointment_days:
+        days = sorted(appointment_days)
+        stats = _stats_query().filter(Appointment.doctor_id == doctor_id, Appointment.date.in_(days))
+        revenue = _revenue_query().filter(Appointment.doctor_id == doctor_id, Appointment.date.in_(days))
+        parsed = [d for d in map(_day, days) if d is not None]
+        db.session.execute(delete(DoctorDailyStats).where(
+            DoctorDailyStats.doctor_id == doctor_id, DoctorDailyStats.day.in_(parsed)
+        ))
+        _insert(DoctorDailyStats, _stats_rows(stats.all(), revenue.all()))
+
+    review_days = sorted(d for d in review_days if d is not None)
+    if review_days:
+        wanted = set(review_days)
+        ratings = _rating_query().filter(
+            Review.doctor_id == doctor_id,
+            Review.created_at >= datetime.combine(review_days[0], datetime.min.time()),
+            Review.created_at < datetime.combine(review_days[-1] + timedelta(days=1), datetime.min.time()),
+        )
+        db.session.execute(delete(DoctorDailyRating).where(
+            DoctorDailyRating.doctor_id == doctor_id, DoctorDailyRating.day.in_(review_days)
+        ))
+        _insert(DoctorDailyRating, (row for row in _rating_rows(ratings) if row["day"] in wanted))
+
+
+def rebuild_rollups(batch_size=DOCTOR_BATCH):
+    """Recompute every rollup from the source tables, `batch_size` doctor ids per query."""
+    db.session.execute(delete(DoctorDailyStats))
+    db.session.execute(delete(DoctorDailyRating))
+    last_id = db.session.query(func.max(DoctorProfile.id)).scalar() or 0
+    for low in range(0, last_id + 1, batch_size):
+        high = low + batch_size
+        stats = _stats_query().filter(Appointment.doctor_id >= low, Appointment.doctor_id < high)
+        revenue = _revenue_query().filter(Appointment.doctor_id >= low, Appointment.doctor_id < high)
+        _insert(DoctorDailyStats, _stats_rows(stats.all(), revenue.all()))
+        ratings = _rating_query().filter(Review.doctor_id >= low, Review.doctor_id < high)
+        _insert(DoctorDailyRating, _rating_rows(ratings.all()))
+
+
+def update_rollups(full=False, lag_seconds=None):
+    """Bring the rollups up to `now - lag`, processing only rows changed since the watermark.
+
+    The lag leaves room for transactions that stamped updated_at before the
+    job started but had not committed yet. Without a watermark (first run)
+    or with `full`, everything is rebuilt. Returns (doctors refreshed, new
+    watermark); doctors is None after a full rebuild.
+    """
+    if lag_seconds is None:
+        lag_seconds = current_app.config["ROLLUP_LAG_SECONDS"]
+    until = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    mark = db.session.get(RollupWatermark, WATERMARK)
+
+    if mark is None or mark.value is None or full:
+        rebuild_rollups()
+        refreshed = None
+    else:
+        stats, ratings = changed_days(mark.value, until)
+        doctors = set(stats) | set(ratings)
+        for doctor_id in doctors:
+            refresh_doctor(doctor_id, stats.get(doctor_id, ()), ratings.get(doctor_id, ()))
+        refreshed = len(doctors)
+
+    if mark is None:
+        mark = RollupWatermark(name=WATERMARK)
+        db.session.add(mark)
+    mark.value = until
+    db.session.commit()
+    return refreshed, until
+
+
+def doctor_analytics(doctor_id, start, end, by="day"):
+    """Totals, per-type totals and a day/week/month series for a doctor, read from the rollups only."""
+    stats = DoctorDailyStats.query.filter(
+        DoctorDailyStats.doctor_id == doctor_id, DoctorDailyStats.day >= start, DoctorDailyStats.day <= end
+    ).all()
+    ratings = DoctorDailyRating.query.filter(
+        DoctorDailyRating.doctor_id == doctor_id, DoctorDailyRating.day >= start, DoctorDailyRating.day <= end
+    ).all()
+
+    def period(day):
+        if by == "month":
+            return day.strftime("%Y-%m")
+        if by == "week":
+            return str(day - timedelta(days=day.weekday()))
+        return str(day)
+
+    fields = ("bookings",) + STATUSES + ("revenue",)
+    totals, by_type, series = dict.fromkeys(fields, 0), {}, {}
+    for row in stats:
+        for bucket in (totals, by_type.setdefault(row.consultation_type, dict.fromkeys(fields, 0)),
+                       series.setdefault(period(row.day), dict.fromkeys(fields, 0))):
+            for field in fields:
+                bucket[field] += getattr(row, field) or 0
+
+    # [reviews, rating_sum]; reviews are not tied to a consultation type
+    total_rating, series_rating = [0, 0], {}
+    for row in ratings:
+        series.setdefault(period(row.day), dict.fromkeys(fields, 0))
+        for pair in (total_rating, series_rating.setdefault(period(row.day), [0, 0])):
+            pair[0] += row.reviews
+            pair[1] += row.rating_sum
+
+    def finish(bucket, rating=None):
+        bookings = bucket["bookings"]
+        bucket["cancellation_rate"] = round(bucket["cancelled"] / bookings, 4) if bookings else None
+        if rating is not None:
+            reviews, rating_sum = rating
+            bucket["reviews"] = reviews
+            bucket["average_rating"] = round(rating_sum / reviews, 2) if reviews else None
+        return bucket
+
+    return {
+        "totals": finish(totals, total_rating),
+        "by_consultation_type": {kind: finish(bucket) for kind, bucket in by_type.items()},
+        "series": [
+            dict(period=key, **finish(series[key], series_rating.get(key, [0, 0]))) for key in sorted(series)
+        ],
+    }
+
+
+def watermark():
+    mark = db.session.get(RollupWatermark, WATERMARK)
+    return mark.value if mark else None
+
+
+rollups_cli = click.Group("rollups", help="Daily per-doctor analytics rollups.")
+
+
+@rollups_cli.command("update")
+@click.option("--full", is_flag=True, help="Rebuild every rollup instead of only changed days.")
+@click.option("--lag", type=int, default=None, help="Seconds to stay behind now; defaults to ROLLUP_LAG_SECONDS.")
+@with_appcontext
+def update_command(full, lag):
+    """Fold appointments, payments and reviews changed since the last run into the rollups.
+
+    Run it every few minutes from cron; the first run builds everything.
+    """
+    refreshed, until = update_rollups(full, lag)
+    if refreshed is None:
+        click.echo(f"Rebuilt all rollups up to {until:%Y-%m-%d %H:%M:%S}.")
+    else:
+        click.echo(f"Refreshed {refreshed} doctors up to {until:%Y-%m-%d %H:%M:%S}.")
@@ -0,0 +1,225 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert
+from werkzeug.security import generate_password_hash
+
+from .extensions import db
+from .models import Appointment, Availability, DoctorProfile, Message, PatientProfile, Payment, Review, User
+from .registry import rebuild_registry
+from .reviews import recount_reviews
+
+
+# Every seeded account logs in with this password
+SEED_PASSWORD = "password"
+
+CHUNK = 10000
+
+SPECIALIZATIONS = [
+    "Cardiology", "Dermatology", "Neurology", "Pediatrics", "Orthopedics", "Psychiatry",
+    "General Medicine", "Gynecology", "Ophthalmology", "ENT", "Oncology", "Endocrinology",
+]
+CITIES = ["Mumbai", "Delhi", "Bengaluru", "Hyderabad", "Chennai", "Kolkata", "Pune", "Ahmedabad", "Jaipur", "Lucknow"]
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Ananya", "Diya", "Isha", "Kabir", "Meera", "Rohan", "Saanvi", "Arjun", "Zara"]
+LAST_NAMES = ["Sharma", "Verma", "Iyer", "Reddy", "Khan", "Patel", "Gupta", "Nair", "Singh", "Das", "Mehta", "Rao"]
+# Profile text per specialization, so doctors are not all alike to app/similar.py
+EXPERTISE = {
+    "Cardiology": ["heart failure", "arrhythmia", "hypertension", "angioplasty", "echocardiography", "lipid disorders"],
+    "Dermatology": ["acne", "psoriasis", "eczema", "hair loss", "cosmetic dermatology", "skin allergy"],
+    "Neurology": ["epilepsy", "stroke", "migraine", "parkinson disease", "multiple sclerosis", "neuropathy"],
+    "Pediatrics": ["neonatal care", "vaccination", "child nutrition", "asthma", "growth disorders", "adolescent health"],
+    "Orthopedics": ["joint replacement", "sports injury", "spine surgery", "fracture care", "arthritis", "arthroscopy"],
+    "Psychiatry": ["depression", "anxiety", "addiction", "bipolar disorder", "sleep disorders", "child psychiatry"],
+    "General Medicine": ["diabetes", "hypertension", "fever", "infectious disease", "preventive health", "thyroid"],
+    "Gynecology": ["pregnancy", "infertility", "pcos", "menopause", "laparoscopy", "high risk pregnancy"],
+    "Ophthalmology": ["cataract", "glaucoma", "retina", "lasik", "squint", "diabetic retinopathy"],
+    "ENT": ["sinusitis", "hearing loss", "tonsillitis", "vertigo", "sleep apnea", "voice disorders"],
+    "Oncology": ["breast cancer", "chemotherapy", "lung cancer", "immunotherapy", "lymphoma", "palliative care"],
+    "Endocrinology": ["diabetes", "thyroid", "obesity", "pcos", "osteoporosis", "adrenal disorders"],
+}
+BOARDS = ["MD", "DNB", "MRCP", "FRCS", "DM", "MCh", "MS", "FACC", "DGO", "DCH"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+PHRASES = [
+    "Good morning doctor", "I have had a headache since yesterday", "Please share your recent reports",
+    "Take the medicine twice a day after meals", "The fever has gone down", "Any allergies I should know about?",
+    "Let's schedule a follow-up next week", "Thank you so much", "Drink plenty of water and rest",
+    "The pain is worse in the evening", "I have uploaded the blood test results", "That looks normal",
+]
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows):
+    if rows:
+        db.session.execute(insert(model.__table__), rows)
+        db.session.commit()
+
+
+def _chunks(rows, size=CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _popular(rng, first_id, count):
+    """A profile id skewed towards low ids, so a few doctors are much busier than the rest."""
+    return first_id + min(int(rng.paretovariate(1.2)) - 1, count - 1)
+
+
+def seed(doctors, patients, appointments, messages, seed_value=0, echo=print):
+    """Bulk-insert synthetic rows after whatever the database already holds.
+
+    Rows go in through Core executemany in chunks of CHUNK, bypassing the
+    ORM so the cache invalidation and stats hooks are not involved.
+    Returns the first id of each table that was seeded.
+    """
+    rng = random.Random(seed_value)
+    password = generate_password_hash(SEED_PASSWORD)
+    today = date.today()
+    first = {model: _next_id(model) for model in (User, DoctorProfile, PatientProfile, Appointment, Message, Review, Payment)}
+    user_id, doctor_id, patient_id = first[User], first[DoctorProfile], first[PatientProfile]
+
+    def users():
+        for n in range(doctors):
+            yield {"id": user_id + n, "name": _name(rng), "email": f"doctor{user_id + n}@seed.test",
+                   "password": password, "role": "doctor"}
+        for n in range(patients):
+            yield {"id": user_id + doctors + n, "name": _name(rng), "email": f"patient{user_id + doctors + n}@seed.test",
+                   "password": password, "role": "patient"}
+
+    fees = {}
+
+    def doctor_profiles():
+        # Separate generator, so adding profile text left the rest of the data unchanged
+        text_rng = random.Random(seed_value + 1)
+        for n in range(doctors):
+            city = rng.choice(CITIES)
+            fees[doctor_id + n] = rng.randrange(200, 2500, 50)
+            specialization = rng.choice(SPECIALIZATIONS)
+            secondary = text_rng.choice(SPECIALIZATIONS) if text_rng.random() < 0.3 else None
+            areas = text_rng.sample(EXPERTISE[specialization], 3) + (
+                text_rng.sample(EXPERTISE[secondary], 1) if secondary else []
+            )
+            yield {"id": doctor_id + n, "user_id": user_id + n, "specialization": specialization,
+                   "secondary_specialization": secondary, "areas_of_expertise": ", ".join(areas),
+                   "board_certifications": ", ".join(text_rng.sample(BOARDS, 2)),
+                   "experience": rng.randint(1, 35), "fees": fees[doctor_id + n],
+                   "about": "Experienced practitioner focused on evidence-based care.",
+                   "clinic_name": f"{city} Care Clinic", "clinic_city": city, "clinic_country": "India"}
+
+    def patient_profiles():
+        for n in range(patients):
+            yield {"id": patient_id + n, "user_id": user_id + doctors + n, "age": rng.randint(1, 90),
+                   "gender": rng.choice(["Male", "Female"]), "city": rng.choice(CITIES)}
+
+    def weekly_hours():
+        for n in range(doctors):
+            for day in rng.sample(DAYS, 5):
+                start = rng.choice([8, 9, 10])
+                yield {"doctor_id": doctor_id + n, "type": "weekly", "day": day,
+                       "start_time": f"{start:02d}:00", "end_time": f"{start + 8:02d}:00"}
+
+    # Messages go to accepted/completed appointments, sized so the total lands near `messages`
+    per_chat = 2 * messages / max(appointments * 0.83, 1)
+    counts = {"messages": 0, "reviews": 0, "payments": 0}
+
+    def appointment_rows():
+        message_id, review_id, payment_id = first[Message], first[Review], first[Payment]
+        for n in range(appointments):
+            appt_id = first[Appointment] + n
+            day = today + timedelta(days=rng.randint(-730, 30))
+            if day < today:
+                status = rng.choices(["completed", "cancelled"], [85, 15])[0]
+            else:
+                status = rng.choices(["pending", "accepted", "paid"], [40, 40, 20])[0]
+            doc = _popular(rng, doctor_id, doctors)
+            pat = patient_id + rng.randrange(patients)
+            yield Appointment, {"id": appt_id, "doctor_id": doc, "patient_id": pat, "status": status,
+                                "date": str(day), "time": f"{rng.randint(9, 16):02d}:00",
+                                "consultation_type": "Chat Consultation", "version": 1,
+                                "created_at": datetime.combine(day, datetime.min.time()) - timedelta(days=3)}
+            if status in ("paid", "completed"):
+                yield Payment, {"id": payment_id, "appointment_id": appt_id, "amount": fees[doc], "status": "paid",
+                                "provider_payment_id": f"pay_seed_{payment_id}",
+                                "created_at": datetime.combine(day, datetime.min.time()) - timedelta(days=1)}
+                payment_id += 1
+                counts["payments"] += 1
+            if status not in ("completed", "accepted"):
+                continue
+            start = datetime.combine(day, datetime.min.time()) + timedelta(hours=10)
+            for i in range(rng.randint(0, round(per_chat))):
+                sender = user_id + (doc - doctor_id) if i % 2 else user_id + doctors + (pat - patient_id)
+                yield Message, {"id": message_id, "appointment_id": appt_id, "sender_id": sender,
+                                "content": rng.choice(PHRASES), "timestamp": start + timedelta(minutes=i)}
+                message_id += 1
+                counts["messages"] += 1
+            if status == "completed" and rng.random() < 0.3:
+                yield Review, {"id": review_id, "doctor_id": doc, "patient_id": pat, "appointment_id": appt_id,
+                               "rating": rng.choices([1, 2, 3, 4, 5], [5, 5, 15, 35, 40])[0],
+                               "comment": "Helpful consultation.", "created_at": start}
+                review_id += 1
+                counts["reviews"] += 1
+
+    started = time.perf_counter()
+    for label, model, rows in [
+        ("users", User, users()),
+        ("doctor profiles", DoctorProfile, doctor_profiles()),
+        ("patient profiles", PatientProfile, patient_profiles()),
+        ("availability", Availability, weekly_hours()),
+    ]:
+        total = 0
+        for chunk in _chunks(rows):
+            _insert(model, chunk)
+            total += len(chunk)
+        echo(f"{label}: {total} rows ({time.perf_counter() - started:.0f}s)")
+
+    # Appointments and their messages/reviews/payments are generated together, then flushed per table
+    pending = {Appointment: [], Message: [], Review: [], Payment: []}
+    for model, row in appointment_rows():
+        pending[model].append(row)
+        if len(pending[model]) >= CHUNK:
+            if model is not Appointment:
+                # Children reference appointments that may still be pending
+                _insert(Appointment, pending[Appointment])
+                pending[Appointment] = []
+            _insert(model, pending[model])
+            pending[model] = []
+    for model in (Appointment, Message, Review, Payment):
+        _insert(model, pending[model])
+    echo(f"appointments: {appointments}, messages: {counts['messages']}, reviews: {counts['reviews']}, "
+         f"payments: {counts['payments']} ({time.perf_counter() - started:.0f}s)")
+    # Bulk inserts bypass what keeps review totals and the registry current
+    recount_reviews()
+    echo(f"doctor-patient registry: {rebuild_registry()} rows ({time.perf_counter() - started:.0f}s)")
+    return first
+
+
+@click.command("seed")
+@click.option("--doctors", type=int, default=100_000, show_default=True)
+@click.option("--patients", type=int, default=1_000_000, show_default=True)
+@click.option("--appointments", type=int, default=10_000_000, show_default=True)
+@click.option("--messages", type=int, default=50_000_000, show_default=True)
+@click.option("--scale", type=float, default=1.0, show_default=True, help="Multiply every volume, e.g. 0.01 for a quick run.")
+@click.option("--seed", "seed_value", type=int, default=0, show_default=True, help="Random seed; same seed, same data.")
+@with_appcontext
+def seed_command(doctors, patients, appointments, messages, scale, seed_value):
+    """Fill the database with synthetic doctors, patients, appointments and messages.
+
+    Meant for a local benchmark database; every account's password is "password".
+    """
+    volumes = [max(1, int(n * scale)) for n in (doctors, patients, appointments, messages)]
+    seed(*volumes, seed_value=seed_value, echo=click.echo)
@@ -0,0 +1,218 @@
+import re
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select
+
+from .extensions import db
+from .models import DoctorProfile, RollupWatermark, SimilarDoctor, User
+
+
+# Doctor pages read SimilarDoctor with one indexed query; NumPy and SciPy are only
+# imported by the build below, which runs from `flask similar update`.
+
+WATERMARK = "similar_doctors"
+# Profiles stamped within this many seconds may belong to transactions still in flight
+LAG_SECONDS = 60
+# Term weight per field: the specialization matters most
+FIELDS = {
+    "specialization": 3.0,
+    "secondary_specialization": 2.0,
+    "areas_of_expertise": 1.0,
+    "board_certifications": 1.0,
+}
+STOPWORDS = frozenset(
+    "a an and as at by for from in of on or the to with dr doctor doctors medicine medical specialist "
+    "specialty care clinic board certified certification certificate".split()
+)
+# Similarity scores held in memory at once while ranking (float32 cells)
+MAX_DENSE_CELLS = 8_000_000
+
+
+def tokens(text):
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def similar_doctors(doctor_id, limit=None):
+    """(DoctorProfile, name, score) of the precomputed nearest doctors, closest first."""
+    query = db.session.query(DoctorProfile, User.name, SimilarDoctor.score).join(
+        SimilarDoctor, SimilarDoctor.similar_id == DoctorProfile.id
+    ).join(User, DoctorProfile.user_id == User.id).filter(
+        SimilarDoctor.doctor_id == doctor_id
+    ).order_by(SimilarDoctor.rank)
+    return query.limit(limit).all() if limit else query.all()
+
+
+def tfidf_matrix():
+    """(doctor ids, L2-normalized TF-IDF CSR matrix with one row per doctor) over FIELDS."""
+    import numpy as np
+    from scipy import sparse
+
+    columns = [getattr(DoctorProfile, field) for field in FIELDS]
+    weights = list(FIELDS.values())
+    vocabulary, ids, rows, cols, values = {}, [], [], [], []
+    for row, (doctor_id, *texts) in enumerate(db.session.execute(
+        select(DoctorProfile.id, *columns).order_by(DoctorProfile.id)
+    )):
+        ids.append(doctor_id)
+        counts = {}
+        for text, weight in zip(texts, weights):
+            for token in tokens(text):
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + weight
+        rows.extend([row] * len(counts))
+        cols.extend(counts)
+        values.extend(counts.values())
+
+    shape = (len(ids), max(len(vocabulary), 1))
+    # Sublinear term frequency and smoothed inverse document frequency
+    tf = sparse.csr_matrix((np.log1p(np.array(values, dtype=np.float32)), (rows, cols)), shape=shape)
+    df = np.bincount(np.array(cols, dtype=np.int64), minlength=shape[1])
+    idf = (np.log((1 + shape[0]) / (1 + df)) + 1).astype(np.float32)
+    matrix = tf @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return np.array(ids), sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32)
+
+
+def nearest(matrix, rows, k):
+    """Top-k neighbours of the given matrix rows by cosine similarity.
+
+    Yields (row, [(neighbour row, score), ...] best first); zero scores and the
+    row itself are left out. Rows are scored in chunks against every doctor,
+    with each chunk's scores held as one dense block.
+    """
+    import numpy as np
+
+    total = matrix.shape[0]
+    k = min(k, total - 1)
+    if k <= 0:
+        for row in rows:
+            yield row, []
+        return
+    chunk = max(1, MAX_DENSE_CELLS // total)
+    transposed = matrix.T
+    for start in range(0, len(rows), chunk):
+        block = np.asarray(rows[start:start + chunk])
+        scores = (matrix[block] @ transposed).toarray()
+        scores[np.arange(len(block)), block] = -1
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        for row, neighbours, values in zip(block.tolist(), top.tolist(), top_scores.tolist()):
+            yield row, [(n, round(v, 4)) for n, v in zip(neighbours, values) if v > 0]
+
+
+def _write(ids, results, replace=True):
+    """Store the lists in `results`, replacing the doctors' previous ones if `replace`."""
+    written = 0
+    batch = []
+
+    def flush():
+        if replace:
+            db.session.execute(delete(SimilarDoctor).where(
+                SimilarDoctor.doctor_id.in_([doctor_id for doctor_id, _neighbours in batch])
+            ))
+        rows = [
+            {"doctor_id": doctor_id, "rank": rank, "similar_id": int(ids[n]), "score": score}
+            for doctor_id, neighbours in batch for rank, (n, score) in enumerate(neighbours, 1)
+        ]
+        if rows:
+            db.session.execute(insert(SimilarDoctor.__table__), rows)
+
+    for row, neighbours in results:
+        batch.append((int(ids[row]), neighbours))
+        written += 1
+        if len(batch) >= 1000:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return written
+
+
+def affected_rows(ids, matrix, changed, k):
+    """Rows whose stored lists a change can alter: the changed doctors, and every
+    doctor whose list holds a changed doctor or whose k-th score one now beats.
+    """
+    import numpy as np
+
+    changed_ids = [int(ids[row]) for row in changed]
+    position = {int(doctor_id): row for row, doctor_id in enumerate(ids)}
+    affected = set(changed)
+    for start in range(0, len(changed_ids), 500):
+        for (doctor_id,) in db.session.execute(select(SimilarDoctor.doctor_id).where(
+            SimilarDoctor.similar_id.in_(changed_ids[start:start + 500])
+        ).distinct()):
+            if doctor_id in position:
+                affected.add(position[doctor_id])
+
+    # Lowest stored score per doctor; lists shorter than k accept any positive score
+    threshold = np.zeros(len(ids), dtype=np.float32)
+    for doctor_id, lowest, count in db.session.execute(
+        select(SimilarDoctor.doctor_id, func.min(SimilarDoctor.score), func.count()).group_by(SimilarDoctor.doctor_id)
+    ):
+        if doctor_id in position and count >= k:
+            threshold[position[doctor_id]] = lowest
+    transposed = matrix.T
+    chunk = max(1, MAX_DENSE_CELLS // len(ids))
+    for start in range(0, len(changed), chunk):
+        block = np.asarray(changed[start:start + chunk])
+        best = (matrix[block] @ transposed).toarray().max(axis=0)
+        affected.update(np.nonzero(best > threshold)[0].tolist())
+    return sorted(affected)
+
+
+def update_similar(full=False, k=None):
+    """Refresh SimilarDoctor for profiles changed since the watermark; everything when `full`.
+
+    Vectors are rebuilt from all profiles on every run (cheap next to
+    ranking), so IDF weights follow the corpus; lists that no change reaches
+    keep their scores until the next full run. Returns (doctors refreshed,
+    new watermark, seconds).
+    """
+    started = time.perf_counter()
+    k = k or current_app.config["SIMILAR_DOCTORS_K"]
+    until = datetime.utcnow() - timedelta(seconds=LAG_SECONDS)
+    mark = db.session.get(RollupWatermark, WATERMARK)
+
+    ids, matrix = tfidf_matrix()
+    rebuild = mark is None or mark.value is None or full
+    if rebuild:
+        db.session.execute(delete(SimilarDoctor))
+        rows = list(range(len(ids)))
+    else:
+        changed_ids = {doctor_id for (doctor_id,) in db.session.execute(select(DoctorProfile.id).where(
+            DoctorProfile.updated_at > mark.value, DoctorProfile.updated_at <= until
+        ))}
+        changed = [row for row, doctor_id in enumerate(ids.tolist()) if doctor_id in changed_ids]
+        rows = affected_rows(ids, matrix, changed, k) if changed else []
+    refreshed = _write(ids, nearest(matrix, rows, k), replace=not rebuild) if len(ids) else 0
+
+    if mark is None:
+        mark = RollupWatermark(name=WATERMARK)
+        db.session.add(mark)
+    mark.value = until
+    db.session.commit()
+    return refreshed, until, time.perf_counter() - started
+
+
+similar_cli = click.Group("similar", help="Precomputed similar-doctor recommendations.")
+
+
+@similar_cli.command("update")
+@click.option("--full", is_flag=True, help="Recompute every doctor's list instead of only those changes reach.")
+@click.option("--k", type=int, default=None, help="Neighbours per doctor; defaults to SIMILAR_DOCTORS_K.")
+@with_appcontext
+def update_command(full, k):
+    """Rank doctors by profile similarity (TF-IDF cosine) and store each one's nearest.
+
+    Run it every few minutes from cron, and with --full nightly; the first run
+    builds everything.
+    """
+    refreshed, until, seconds = update_similar(full, k)
+    click.echo(f"Refreshed {refreshed} doctors up to {until:%Y-%m-%d %H:%M:%S} in {seconds:.1f}s.")
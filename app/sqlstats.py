@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger("app.sqlstats")
+
+# Lists that collect the stats of every finished request; see query_budget()
+_watchers = []
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%s|:\w+)\s*,)+\s*(?:\?|%s|:\w+)\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Normalise a statement so the same query with different parameters compares equal."""
+    shape = _SPACE.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("(?)", shape)
+    return _NUMBER.sub("N", shape)
+
+
+def query_origin():
+    """Template line (or failing that, app source line) that triggered the current query."""
+    frame = sys._getframe(2)
+    app_frame = None
+    while frame is not None:
+        template = frame.f_globals.get("__jinja_template__")
+        if template is not None:
+            return f"{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}"
+        filename = frame.f_code.co_filename
+        if app_frame is None and filename.startswith(_APP_DIR) and filename != __file__:
+            app_frame = f"{os.path.relpath(filename, _APP_DIR)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return app_frame
+
+
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = {}
+        self.origins = {}
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        shape = statement_shape(statement)
+        seen = self.shapes.get(shape, 0) + 1
+        self.shapes[shape] = seen
+        # Only the first repeat is traced; repeats from a loop share an origin
+        if seen == 2:
+            self.origins[shape] = query_origin()
+
+    def duplicates(self, threshold):
+        return [
+            {"count": count, "statement": shape, "origin": self.origins.get(shape)}
+            for shape, count in sorted(self.shapes.items(), key=lambda item: -item[1])
+            if count >= threshold
+        ]
+
+    def summary(self, threshold):
+        return {
+            "queries": self.count,
+            "db_ms": round(self.total_time * 1000, 2),
+            "n_plus_one": self.duplicates(threshold),
+        }
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "sql_stats" in g:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if starts and has_request_context() and "sql_stats" in g:
+        g.sql_stats.record(statement, time.perf_counter() - starts.pop())
+
+
+def start_request_stats():
+    if current_app.config.get("SQL_STATS") or _watchers:
+        g.sql_stats = RequestQueryStats()
+
+
+def finish_request_stats(response):
+    stats = g.pop("sql_stats", None)
+    if stats is None:
+        return response
+
+    threshold = current_app.config.get("SQL_STATS_N_PLUS_ONE_THRESHOLD", 3)
+    summary = stats.summary(threshold)
+    summary.update({
+        "method": request.method,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+    })
+    if summary["n_plus_one"]:
+        logger.warning("sql_stats %s", json.dumps(summary))
+    else:
+        logger.info("sql_stats %s", json.dumps(summary))
+
+    if current_app.config.get("SQL_STATS_HEADER") or current_app.debug:
+        response.headers["X-SQL-Stats"] = (
+            f"queries={summary['queries']}; db_ms={summary['db_ms']}; "
+            f"n_plus_one={len(summary['n_plus_one'])}"
+        )
+
+    for watcher in _watchers:
+        watcher.append(summary)
+    return response
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail if the requests made inside the block issue more than `max_queries` queries.
+
+        with query_budget(10):
+            client.get("/patient/find-doctor")
+    """
+    seen = []
+    _watchers.append(seen)
+    try:
+        yield seen
+    finally:
+        _watchers.remove(seen)
+    for summary in seen:
+        if summary["queries"] > max_queries:
+            details = "\n".join(
+                f"  {d['count']}x at {d['origin']}: {d['statement'][:120]}" for d in summary["n_plus_one"]
+            )
+            raise AssertionError(
+                f"{summary['method']} {summary['endpoint']} issued {summary['queries']} queries "
+                f"(budget {max_queries})" + (f"\nRepeated statements:\n{details}" if details else "")
+            )
+
+
+def init_sql_stats(app):
+    app.before_request(start_request_stats)
+    app.after_request(finish_request_stats)
@@ -0,0 +1,101 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+# Runs in a fresh interpreter: import the app, build it, serve one request. Prints
+# wall-clock stamps so the parent can include interpreter startup in the total.
+PROBE = """
+import json, sys, time
+started = time.time()
+from app import create_app
+imported = time.time()
+app = create_app()
+created = time.time()
+status = app.test_client().get(sys.argv[1]).status_code
+print(json.dumps({"started": started, "imported": imported, "created": created,
+                  "responded": time.time(), "status": status}))
+"""
+
+
+def run_probe(path, importtime=False):
+    """Time one cold start in a subprocess; returns phase durations in ms (and the -X importtime log)."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE, path]
+    launched = time.time()
+    result = subprocess.run(
+        command, cwd=os.path.dirname(current_app.root_path), capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f"Startup probe failed:\n{result.stderr[-2000:]}")
+    stamps = json.loads(result.stdout.strip().splitlines()[-1])
+    phases = {
+        "interpreter": stamps["started"] - launched,
+        "imports": stamps["imported"] - stamps["started"],
+        "create_app": stamps["created"] - stamps["imported"],
+        "first_request": stamps["responded"] - stamps["created"],
+        "total": stamps["responded"] - launched,
+    }
+    return {name: round(seconds * 1000, 1) for name, seconds in phases.items()}, stamps["status"], result.stderr
+
+
+def import_costs(log):
+    """Self time in ms per top-level package from a -X importtime log, largest first."""
+    costs = {}
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        if package == "app":
+            # Our own modules are worth seeing one by one
+            package = name.strip()
+        costs[package] = costs.get(package, 0) + int(self_us) / 1000
+    return sorted(costs.items(), key=lambda item: item[1], reverse=True)
+
+
+@click.command("startup-report")
+@click.option("--path", default="/", show_default=True, help="Route for the first request.")
+@click.option("--runs", type=int, default=5, show_default=True, help="Cold starts to time; the median is reported.")
+@click.option("--top", type=int, default=20, show_default=True, help="Packages to list by import time.")
+@click.option("--budget-ms", type=float, help="Fail when the median total exceeds this (default: STARTUP_BUDGET_MS).")
+@with_appcontext
+def startup_command(path, runs, top, budget_ms):
+    """Time worker cold starts: interpreter, imports, create_app and first request.
+
+    Each run is a fresh interpreter configured like a web worker (the same
+    environment, no CLI-only extensions). Exits non-zero when the median
+    total, from process launch to the first response, exceeds the budget.
+    """
+    samples = []
+    for _ in range(max(runs, 1)):
+        phases, status, _log = run_probe(path)
+        samples.append(phases)
+    if status >= 500:
+        raise click.ClickException(f"{path} returned {status}")
+
+    click.echo(f"{'phase':16} {'median':>10} {'min':>10} {'max':>10}")
+    medians = {}
+    for phase in samples[0]:
+        values = [sample[phase] for sample in samples]
+        medians[phase] = statistics.median(values)
+        click.echo(f"{phase:16} {medians[phase]:>8.1f}ms {min(values):>8.1f}ms {max(values):>8.1f}ms")
+
+    # A separate run, since -X importtime slows the imports it measures
+    _phases, _status, log = run_probe(path, importtime=True)
+    click.echo(f"\n{'import (self time)':40} {'ms':>8}")
+    for package, ms in import_costs(log)[:top]:
+        click.echo(f"{package:40} {ms:>8.1f}")
+
+    budget = budget_ms if budget_ms is not None else current_app.config.get("STARTUP_BUDGET_MS")
+    if budget:
+        if medians["total"] > budget:
+            click.echo(f"\nOVER BUDGET: {medians['total']:.1f}ms to first response, budget {budget:.0f}ms")
+            raise SystemExit(1)
+        click.echo(f"\nWithin budget: {medians['total']:.1f}ms to first response, budget {budget:.0f}ms")
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request, current_app, request, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+IMAGE_TYPES = {"png", "jpg", "gif", "webp", "bmp"}
+LICENCE_TYPES = {"pdf", "png", "jpg"}
+THUMBNAIL_SIZES = (64, 128, 256)
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+# Content-addressed files are named "<sha256>.<ext>"; anything else is a legacy upload
+HASHED_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+HASHED_FILE = re.compile(r"^[0-9a-f]{64}(_\d+)?\.[a-z0-9]+$")
+
+# Thumbnails are rendered off the request thread
+_thumbnail_worker = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnails")
+
+
+def upload_dir():
+    return os.path.join(current_app.static_folder, "uploads")
+
+
+def staging_dir():
+    # Outside the static folder, so partial and rejected uploads are never served. Must be on
+    # the same filesystem as upload_dir() for the final rename to be atomic.
+    return current_app.config.get("UPLOAD_STAGING_DIR") or os.path.join(current_app.instance_path, "incoming")
+
+
+def sniff_type(head):
+    """Detect the file type from its leading bytes; the client's filename is not trusted."""
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return None
+
+
+class HashingUpload:
+    """Write target for one multipart file part.
+
+    Werkzeug streams the part into this object chunk by chunk: the bytes go
+    straight to a temp file in the staging directory while being hashed and
+    counted, so memory stays flat however large the upload is.
+    """
+
+    HEAD_SIZE = 16
+
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix=".incoming-", delete=False)
+        self.max_bytes = max_bytes
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.stored = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge()
+        if len(self.head) < self.HEAD_SIZE:
+            self.head += data[:self.HEAD_SIZE - len(self.head)]
+        self.sha.update(data)
+        return self.file.write(data)
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def store(self, directory, ext):
+        """Atomically move the finished upload to <directory>/<sha256>.<ext>."""
+        self.file.close()
+        filename = f"{self.sha.hexdigest()}.{ext}"
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            os.remove(self.file.name)
+        else:
+            os.replace(self.file.name, path)
+        self.stored = True
+        return filename
+
+    def discard(self):
+        if not self.stored:
+            self.file.close()
+            if os.path.exists(self.file.name):
+                os.remove(self.file.name)
+            self.stored = True
+
+    def close(self):
+        self.discard()
+
+
+class UploadRequest(Request):
+    """Request class that streams file uploads through HashingUpload."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            # Empty file inputs; the views skip parts without a filename
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = HashingUpload(
+            staging_dir(),
+            current_app.config.get("UPLOAD_MAX_BYTES", DEFAULT_MAX_BYTES),
+        )
+        self.__dict__.setdefault("_upload_streams", []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        # Also covers parts that never made it into request.files (e.g. a later part was too large)
+        for stream in self.__dict__.get("_upload_streams", ()):
+            stream.discard()
+
+
+def store_upload(file, allowed_types):
+    """Move a streamed upload into storage if its content matches `allowed_types`.
+
+    Returns the stored filename, or None when the file type is not allowed.
+    """
+    upload = file.stream
+    file_type = sniff_type(upload.head)
+    if file_type not in allowed_types:
+        upload.discard()
+        return None
+    return upload.store(upload_dir(), file_type)
+
+
+def save_image(file):
+    """Store an uploaded image under its content hash and queue its thumbnails.
+
+    Returns the stored filename, or None if the upload is not an image.
+    Identical uploads map to the same file, so re-uploading is free.
+    """
+    filename = store_upload(file, IMAGE_TYPES)
+    if filename:
+        _thumbnail_worker.submit(make_thumbnails, os.path.join(upload_dir(), filename), upload_dir())
+    return filename
+
+
+def save_licence(file):
+    """Store a medical licence scan (PDF, PNG or JPEG) under its content hash."""
+    return store_upload(file, LICENCE_TYPES)
+
+
+def thumbnail_name(filename, size):
+    digest = filename.rsplit(".", 1)[0]
+    return f"thumbs/{digest}_{size}.webp"
+
+
+def make_thumbnails(path, directory):
+    from PIL import Image, ImageOps
+
+    filename = os.path.basename(path)
+    os.makedirs(os.path.join(directory, "thumbs"), exist_ok=True)
+    try:
+        with Image.open(path) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ("RGB", "RGBA"):
+                original = original.convert("RGBA")
+            for size in THUMBNAIL_SIZES:
+                target = os.path.join(directory, thumbnail_name(filename, size))
+                if os.path.exists(target):
+                    continue
+                # Square crop, matching the object-fit: cover avatars in the templates
+                thumb = ImageOps.fit(original, (size, size), Image.LANCZOS)
+                thumb.save(target + ".tmp", "WEBP", quality=82, method=4)
+                os.replace(target + ".tmp", target)
+    except (OSError, ValueError) as e:
+        # Runs on the worker thread, outside any app context
+        logging.getLogger(__name__).warning("Thumbnail generation failed for %s: %s", filename, e)
+
+
+def avatar_url(filename, size=128):
+    """URL of the smallest thumbnail covering `size` px, falling back to the original."""
+    if HASHED_NAME.match(filename):
+        directory = upload_dir()
+        for thumb_size in THUMBNAIL_SIZES:
+            if thumb_size >= size:
+                thumb = thumbnail_name(filename, thumb_size)
+                if os.path.exists(os.path.join(directory, thumb)):
+                    return url_for("static", filename="uploads/" + thumb)
+                break
+    return url_for("static", filename="uploads/" + filename)
+
+
+def immutable_upload_headers(response):
+    # Hashed uploads and their thumbnails never change once written
+    if request.path.startswith("/static/uploads/") and response.status_code == 200:
+        if HASHED_FILE.match(request.path.rsplit("/", 1)[-1]):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+    return response
@@ -0,0 +1,351 @@
+import heapq
+import threading
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import and_, event, func, inspect, or_, select, update
+
+from .appcache import invalidate_on_commit
+from .extensions import db
+from .models import Appointment, DoctorProfile, PatientProfile, User, WaitlistEntry
+from .replicas import RoutingSession
+
+
+WAITING, OFFERED = "waiting", "offered"
+ACTIVE = (WAITING, OFFERED)
+# Appointment statuses that keep a slot taken; cancelling one frees it
+OCCUPYING = ("pending", "accepted", "confirmed", "paid")
+
+# Expiry times of the offers this process made, earliest first, and whether a sweeper is running
+_holds = []
+_holds_lock = threading.Lock()
+_sweeping = False
+
+
+class WaitlistError(Exception):
+    """A rejected waitlist action; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def join_waitlist(patient_id, doctor_id, day):
+    """Queue a patient for a cancelled slot with the doctor on `day` (YYYY-MM-DD).
+
+    Raises WaitlistError for a past or invalid day, an unknown doctor, a
+    repeat entry, or a patient already on WAITLIST_MAX_ENTRIES waitlists.
+    """
+    try:
+        day = date.fromisoformat(day)
+    except (TypeError, ValueError):
+        raise WaitlistError("Choose a valid date.")
+    if day < date.today():
+        raise WaitlistError("That date has passed.")
+    if db.session.get(DoctorProfile, doctor_id) is None:
+        raise WaitlistError("Doctor not found.", 404)
+
+    active = db.session.query(WaitlistEntry.doctor_id, WaitlistEntry.date).filter(
+        WaitlistEntry.patient_id == patient_id, WaitlistEntry.status.in_(ACTIVE)
+    ).all()
+    if (doctor_id, day.isoformat()) in active:
+        raise WaitlistError("You are already on this waitlist.", 409)
+    if len(active) >= current_app.config["WAITLIST_MAX_ENTRIES"]:
+        raise WaitlistError("You are on too many waitlists; leave one first.", 429)
+
+    entry = WaitlistEntry(doctor_id=doctor_id, patient_id=patient_id, date=day.isoformat())
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+def waitlist_entries(patient_id):
+    """A patient's active entries, with each waiting entry's place in its queue (1 = next)."""
+    entries = WaitlistEntry.query.filter(
+        WaitlistEntry.patient_id == patient_id, WaitlistEntry.status.in_(ACTIVE)
+    ).order_by(WaitlistEntry.date, WaitlistEntry.id).all()
+    for entry in entries:
+        entry.position = None
+        if entry.status == WAITING:
+            entry.position = 1 + db.session.query(func.count(WaitlistEntry.id)).filter(
+                WaitlistEntry.doctor_id == entry.doctor_id,
+                WaitlistEntry.date == entry.date,
+                WaitlistEntry.status == WAITING,
+                or_(WaitlistEntry.created_at < entry.created_at,
+                    and_(WaitlistEntry.created_at == entry.created_at, WaitlistEntry.id < entry.id)),
+            ).scalar()
+    return entries
+
+
+def held_slots(doctor_id):
+    """(date, time) of the doctor's slots held for an open offer."""
+    return set(db.session.query(WaitlistEntry.date, WaitlistEntry.slot_time).filter(
+        WaitlistEntry.doctor_id == doctor_id,
+        WaitlistEntry.date >= date.today().isoformat(),
+        WaitlistEntry.status == OFFERED,
+        WaitlistEntry.offer_expires_at > datetime.utcnow(),
+    ).all())
+
+
+def holds_version(doctor_id):
+    """Count, last id and latest expiry of the open offers behind `held_slots`, for cache validators."""
+    return db.session.query(
+        func.count(WaitlistEntry.id), func.max(WaitlistEntry.id), func.max(WaitlistEntry.offer_expires_at)
+    ).filter(
+        WaitlistEntry.doctor_id == doctor_id,
+        WaitlistEntry.date >= date.today().isoformat(),
+        WaitlistEntry.status == OFFERED,
+        WaitlistEntry.offer_expires_at > datetime.utcnow(),
+    ).one()
+
+
+def slot_held(doctor_id, day, time, patient_id=None):
+    """True if the slot is held for an open offer to a patient other than `patient_id`."""
+    query = db.session.query(WaitlistEntry.id).filter(
+        WaitlistEntry.doctor_id == doctor_id,
+        WaitlistEntry.date == day,
+        WaitlistEntry.status == OFFERED,
+        WaitlistEntry.slot_time == time,
+        WaitlistEntry.offer_expires_at > datetime.utcnow(),
+    )
+    if patient_id is not None:
+        query = query.filter(WaitlistEntry.patient_id != patient_id)
+    return query.first() is not None
+
+
+def _occupied(doctor_id, day, time):
+    return db.session.query(Appointment.id).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.date == day,
+        Appointment.time == time,
+        Appointment.status.in_(OCCUPYING),
+    ).first() is not None
+
+
+def _passed(day, time):
+    return f"{day} {time}" <= datetime.now().strftime("%Y-%m-%d %H:%M")
+
+
+def offer_slot(doctor_id, day, time):
+    """Offer a free slot to the first patient waiting for the doctor on `day`.
+
+    The offer holds the slot for WAITLIST_HOLD_SECONDS and is pushed to the
+    patient's SocketIO room. Returns the entry offered to, or None if the slot
+    is taken, has passed or nobody is waiting.
+    """
+    if _passed(day, time) or _occupied(doctor_id, day, time) or slot_held(doctor_id, day, time):
+        db.session.rollback()
+        return None
+    expires_at = datetime.utcnow() + timedelta(seconds=current_app.config["WAITLIST_HOLD_SECONDS"])
+    while True:
+        head = db.session.execute(select(WaitlistEntry.id).where(
+            WaitlistEntry.doctor_id == doctor_id, WaitlistEntry.date == day, WaitlistEntry.status == WAITING,
+        ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).limit(1)).scalar()
+        if head is None:
+            db.session.rollback()
+            return None
+        # Conditional, so concurrent matchers never offer one entry two slots
+        claimed = db.session.execute(update(WaitlistEntry).where(
+            WaitlistEntry.id == head, WaitlistEntry.status == WAITING
+        ).values(status=OFFERED, slot_time=time, offer_expires_at=expires_at)).rowcount
+        if claimed:
+            break
+    invalidate_on_commit(f"doctor:{doctor_id}:holds")
+    db.session.commit()
+    _notify(head)
+    _hold(head, expires_at)
+    return head
+
+
+def _notify(entry_id):
+    from . import socketio
+
+    entry, user_id, doctor_name = db.session.query(WaitlistEntry, PatientProfile.user_id, User.name).join(
+        PatientProfile, WaitlistEntry.patient_id == PatientProfile.id
+    ).join(DoctorProfile, WaitlistEntry.doctor_id == DoctorProfile.id).join(
+        User, DoctorProfile.user_id == User.id
+    ).filter(WaitlistEntry.id == entry_id).one()
+    socketio.emit("waitlist_offer", {
+        "entry_id": entry.id,
+        "doctor_id": entry.doctor_id,
+        "doctor_name": doctor_name,
+        "date": entry.date,
+        "time": entry.slot_time,
+        "expires_at": entry.offer_expires_at.isoformat() + "Z",
+    }, room=f"user:{user_id}")
+
+
+def _hold(entry_id, expires_at):
+    global _sweeping
+    from . import socketio
+
+    with _holds_lock:
+        heapq.heappush(_holds, (expires_at, entry_id))
+        if _sweeping:
+            return
+        _sweeping = True
+    socketio.start_background_task(_sweep, current_app._get_current_object())
+
+
+def _sweep(app):
+    """Expire this process's offers as their holds run out; exits once none are left."""
+    global _sweeping
+    from . import socketio
+
+    while True:
+        with _holds_lock:
+            if not _holds:
+                _sweeping = False
+                return
+            expires_at, entry_id = _holds[0]
+            wait = (expires_at - datetime.utcnow()).total_seconds()
+            if wait <= 0:
+                heapq.heappop(_holds)
+        if wait > 0:
+            socketio.sleep(wait)
+            continue
+        with app.app_context():
+            try:
+                expire_offer(entry_id)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Expiring waitlist offer %s failed", entry_id)
+
+
+def expire_offer(entry_id):
+    """Expire an unanswered offer whose hold has run out and pass its slot on; True if it did."""
+    now = datetime.utcnow()
+    entry = db.session.get(WaitlistEntry, entry_id)
+    if entry is None or entry.status != OFFERED or entry.offer_expires_at > now:
+        db.session.rollback()
+        return False
+    slot = (entry.doctor_id, entry.date, entry.slot_time)
+    expired = db.session.execute(update(WaitlistEntry).where(
+        WaitlistEntry.id == entry_id, WaitlistEntry.status == OFFERED, WaitlistEntry.offer_expires_at <= now
+    ).values(status="expired")).rowcount
+    invalidate_on_commit(f"doctor:{slot[0]}:holds")
+    db.session.commit()
+    if expired:
+        offer_slot(*slot)
+    return bool(expired)
+
+
+def expire_offers():
+    """Expire every offer past its hold; returns how many."""
+    due = db.session.execute(select(WaitlistEntry.id).where(
+        WaitlistEntry.status == OFFERED, WaitlistEntry.offer_expires_at <= datetime.utcnow()
+    ).order_by(WaitlistEntry.offer_expires_at)).scalars().all()
+    return sum(expire_offer(entry_id) for entry_id in due)
+
+
+def _own_entry(patient_id, entry_id):
+    entry = WaitlistEntry.query.filter_by(id=entry_id, patient_id=patient_id).first()
+    if entry is None:
+        raise WaitlistError("Waitlist entry not found.", 404)
+    return entry
+
+
+def accept_offer(patient_id, entry_id):
+    """Book the offered slot as a pending appointment, like a regular booking.
+
+    Raises WaitlistError if the offer is not open, or if the slot was booked
+    outside the waitlist meanwhile (the entry then goes back to waiting).
+    """
+    entry = _own_entry(patient_id, entry_id)
+    now = datetime.utcnow()
+    if entry.status != OFFERED:
+        raise WaitlistError("This offer is no longer open.", 409)
+    if entry.offer_expires_at <= now:
+        raise WaitlistError("This offer has expired.", 409)
+    doctor_id, day, time = entry.doctor_id, entry.date, entry.slot_time
+    if _occupied(doctor_id, day, time):
+        entry.status, entry.slot_time, entry.offer_expires_at = WAITING, None, None
+        invalidate_on_commit(f"doctor:{doctor_id}:holds")
+        db.session.commit()
+        raise WaitlistError("That slot has just been booked; you are still on the waitlist.", 409)
+
+    appt = Appointment(doctor_id=doctor_id, patient_id=patient_id, date=day, time=time, status="pending")
+    db.session.add(appt)
+    db.session.flush()
+    booked = db.session.execute(update(WaitlistEntry).where(
+        WaitlistEntry.id == entry_id, WaitlistEntry.status == OFFERED, WaitlistEntry.offer_expires_at > now
+    ).values(status="booked", appointment_id=appt.id)).rowcount
+    if not booked:
+        # Expired or withdrawn since it was read
+        db.session.rollback()
+        raise WaitlistError("This offer has expired.", 409)
+    invalidate_on_commit(f"doctor:{doctor_id}:holds")
+    db.session.commit()
+    return appt
+
+
+def leave_waitlist(patient_id, entry_id):
+    """Leave a waitlist, declining the open offer if there is one; the slot goes to the next patient."""
+    entry = _own_entry(patient_id, entry_id)
+    if entry.status not in ACTIVE:
+        raise WaitlistError("This waitlist entry is no longer active.", 409)
+    offered = entry.status == OFFERED
+    slot = (entry.doctor_id, entry.date, entry.slot_time)
+    left = db.session.execute(update(WaitlistEntry).where(
+        WaitlistEntry.id == entry_id, WaitlistEntry.status == entry.status
+    ).values(status="declined" if offered else "left")).rowcount
+    if not left:
+        db.session.rollback()
+        raise WaitlistError("This waitlist entry is no longer active.", 409)
+    if offered:
+        invalidate_on_commit(f"doctor:{slot[0]}:holds")
+    db.session.commit()
+    if offered:
+        offer_slot(*slot)
+
+
+def _collect_freed(session, flush_context):
+    for obj in session.dirty:
+        if not isinstance(obj, Appointment) or obj.status != "cancelled":
+            continue
+        previous = inspect(obj).attrs.status.history.deleted
+        if previous and previous[0] in OCCUPYING and None not in (obj.doctor_id, obj.date, obj.time):
+            session.info.setdefault("freed_slots", set()).add((obj.doctor_id, obj.date, obj.time))
+
+
+def _match_committed(session):
+    slots = session.info.pop("freed_slots", None)
+    if slots and has_app_context():
+        from . import socketio
+        socketio.start_background_task(_match, current_app._get_current_object(), sorted(slots))
+
+
+def _discard_freed(session):
+    session.info.pop("freed_slots", None)
+
+
+def _match(app, slots):
+    with app.app_context():
+        for doctor_id, day, time in slots:
+            try:
+                offer_slot(doctor_id, day, time)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Waitlist offer for doctor %s at %s %s failed", doctor_id, day, time)
+
+
+# Slots freed by a cancellation are matched right after it commits, off the request thread
+event.listen(RoutingSession, "after_flush", _collect_freed)
+event.listen(RoutingSession, "after_commit", _match_committed)
+event.listen(RoutingSession, "after_rollback", _discard_freed)
+
+
+waitlist_cli = click.Group("waitlist", help="Waitlist offers of cancelled slots.")
+
+
+@waitlist_cli.command("expire")
+@with_appcontext
+def expire_command():
+    """Expire offers past their hold and pass the slots on.
+
+    Web processes expire the offers they made on time; run this every minute
+    from cron to cover processes that restarted while holding some.
+    """
+    click.echo(f"Expired {expire_offers()} offers.")
@@ -0,0 +1,50 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Settings come from the environment so the same file serves every deploy:
+#   WEB_CONCURRENCY        worker processes (default: 1 per CPU with a message queue, else 1)
+#   GUNICORN_WORKER_CLASS  gthread (default), eventlet or gevent
+#   GUNICORN_THREADS       threads per gthread worker; an open websocket holds one
+#   WORKER_CONNECTIONS     concurrent clients per eventlet/gevent worker
+#   DB_MAX_CONNECTIONS     connections the database allows this instance in total
+#
+# Socket.IO room broadcasts (chat, waitlist offers) only reach clients of other workers
+# through EHEALTHCARE_SOCKETIO_MESSAGE_QUEUE, so without one a single worker is started.
+# Long-polling requests must keep hitting the worker that holds the session, so with more
+# than one worker clients default to websocket only; the app refuses to start with more
+# than one worker and either no queue or polling allowed. To keep polling, run one worker
+# per port behind a sticky (ip_hash) proxy instead.
+#
+# eventlet/gevent hold thousands of idle sockets per worker, but CPU work such as password
+# hashing, and database drivers written in C (sqlite3, mysqlclient), block the whole
+# worker. Pick them only with a pure-Python driver such as PyMySQL.
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+message_queue = os.environ.get("EHEALTHCARE_SOCKETIO_MESSAGE_QUEUE")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() if message_queue else 1))
+os.environ["EHEALTHCARE_WEB_WORKERS"] = str(workers)
+if workers > 1:
+    os.environ.setdefault("EHEALTHCARE_SOCKETIO_CLIENT_TRANSPORTS", '["websocket"]')
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", 1000))
+threads = int(os.environ.get("GUNICORN_THREADS", 64))
+
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+# Recycle workers now and then to bound slow leaks; the jitter avoids all restarting at once
+max_requests = 10000
+max_requests_jitter = 1000
+
+cooperative = worker_class in ("eventlet", "gevent")
+os.environ.setdefault("EHEALTHCARE_SOCKETIO_ASYNC_MODE", worker_class if cooperative else "threading")
+
+# One pooled connection per request that can run at once in a worker, but never more than
+# this worker's share of what the database allows; the overflow absorbs short bursts.
+concurrency = worker_connections if cooperative else threads
+share = max(1, int(os.environ.get("DB_MAX_CONNECTIONS", 100)) // workers)
+pool_size = max(1, min(concurrency, share * 3 // 4))
+os.environ.setdefault("EHEALTHCARE_DB_POOL_SIZE", str(pool_size))
+os.environ.setdefault("EHEALTHCARE_DB_MAX_OVERFLOW", str(max(0, share - pool_size)))
@@ -0,0 +1,30 @@
+"""Add updated_at and version to Appointment
+
+Revision ID: 4f1c2a9d7e30
+Revises: b6290d884138
+Create Date: 2026-10-19 10:12:31.514207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2a9d7e30'
+down_revision = 'b6290d884138'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=True))
+
+    op.execute("UPDATE appointment SET updated_at = created_at, version = 1")
+
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,40 @@
+"""Add message_archive for compacted consultation messages
+
+Revision ID: 6c3d8b2f1a57
+Revises: 9a7e5c3b1d42
+Create Date: 2026-10-19 13:02:18.640915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c3d8b2f1a57'
+down_revision = '9a7e5c3b1d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('appointment_id', sa.Integer(), nullable=True),
+    sa.Column('message_count', sa.Integer(), nullable=True),
+    sa.Column('first_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('last_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('raw_bytes', sa.Integer(), nullable=True),
+    sa.Column('data', sa.LargeBinary(length=16777216), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['appointment_id'], ['appointment.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_message_archive_appointment_id'), ['appointment_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_message_archive_appointment_id'))
+
+    op.drop_table('message_archive')
@@ -0,0 +1,74 @@
+"""Add daily doctor rollups, their watermark, payment timestamps and scan indexes
+
+Revision ID: 8e2f4a6c1b93
+Revises: 6c3d8b2f1a57
+Create Date: 2026-10-19 15:40:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f4a6c1b93'
+down_revision = '6c3d8b2f1a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('provider_payment_id', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_payment_created_at'), ['created_at'], unique=False)
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.create_index('ix_appointment_updated_at', ['updated_at'], unique=False)
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.create_index('ix_review_created_at', ['created_at'], unique=False)
+
+    op.create_table('doctor_daily_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=True),
+    sa.Column('day', sa.Date(), nullable=True),
+    sa.Column('consultation_type', sa.String(length=50), nullable=True),
+    sa.Column('bookings', sa.Integer(), nullable=True),
+    sa.Column('pending', sa.Integer(), nullable=True),
+    sa.Column('accepted', sa.Integer(), nullable=True),
+    sa.Column('paid', sa.Integer(), nullable=True),
+    sa.Column('completed', sa.Integer(), nullable=True),
+    sa.Column('cancelled', sa.Integer(), nullable=True),
+    sa.Column('revenue', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profile.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('doctor_id', 'day', 'consultation_type', name='uq_doctor_daily_stats')
+    )
+    op.create_table('doctor_daily_rating',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=True),
+    sa.Column('day', sa.Date(), nullable=True),
+    sa.Column('reviews', sa.Integer(), nullable=True),
+    sa.Column('rating_sum', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profile.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('doctor_id', 'day', name='uq_doctor_daily_rating')
+    )
+    op.create_table('rollup_watermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_watermark')
+    op.drop_table('doctor_daily_rating')
+    op.drop_table('doctor_daily_stats')
+
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.drop_index('ix_review_created_at')
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_updated_at')
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_created_at'))
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('provider_payment_id')
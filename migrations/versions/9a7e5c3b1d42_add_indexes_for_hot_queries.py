@@ -0,0 +1,68 @@
+"""Add indexes for hot queries
+
+Revision ID: 9a7e5c3b1d42
+Revises: 4f1c2a9d7e30
+Create Date: 2026-10-19 14:03:52.118930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7e5c3b1d42'
+down_revision = '4f1c2a9d7e30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.create_index('ix_appointment_doctor_status', ['doctor_id', 'status'], unique=False)
+        batch_op.create_index('ix_appointment_doctor_date_time', ['doctor_id', 'date', 'time'], unique=False)
+        batch_op.create_index('ix_appointment_doctor_patient', ['doctor_id', 'patient_id', 'date'], unique=False)
+        batch_op.create_index('ix_appointment_patient_status', ['patient_id', 'status'], unique=False)
+
+    with op.batch_alter_table('availability', schema=None) as batch_op:
+        batch_op.create_index('ix_availability_doctor_type_date', ['doctor_id', 'type', 'date'], unique=False)
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_appointment_timestamp', ['appointment_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.create_index('ix_review_doctor_created', ['doctor_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_appointment_id'), ['appointment_id'], unique=False)
+
+    with op.batch_alter_table('patient_profile', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_patient_profile_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('doctor_profile', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_doctor_profile_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('doctor_profile', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_doctor_profile_user_id'))
+
+    with op.batch_alter_table('patient_profile', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_patient_profile_user_id'))
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_appointment_id'))
+
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.drop_index('ix_review_doctor_created')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_appointment_timestamp')
+
+    with op.batch_alter_table('availability', schema=None) as batch_op:
+        batch_op.drop_index('ix_availability_doctor_type_date')
+
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_patient_status')
+        batch_op.drop_index('ix_appointment_doctor_patient')
+        batch_op.drop_index('ix_appointment_doctor_date_time')
+        batch_op.drop_index('ix_appointment_doctor_status')
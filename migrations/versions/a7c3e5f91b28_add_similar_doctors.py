@@ -0,0 +1,37 @@
+"""Add precomputed similar-doctor lists
+
+Revision ID: a7c3e5f91b28
+Revises: f2a8c6d4e719
+Create Date: 2026-10-19 20:41:53.108264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e5f91b28'
+down_revision = 'f2a8c6d4e719'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('similar_doctor',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('similar_id', sa.Integer(), nullable=True),
+    sa.Column('score', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profile.id'], ),
+    sa.ForeignKeyConstraint(['similar_id'], ['doctor_profile.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'rank')
+    )
+    with op.batch_alter_table('similar_doctor', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_similar_doctor_similar_id'), ['similar_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('similar_doctor', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_similar_doctor_similar_id'))
+
+    op.drop_table('similar_doctor')
@@ -0,0 +1,47 @@
+"""Add waitlist entries for cancelled slots
+
+Revision ID: c5e9a2d7f314
+Revises: a7c3e5f91b28
+Create Date: 2026-10-19 22:05:37.642811
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a2d7f314'
+down_revision = 'a7c3e5f91b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('waitlist_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=True),
+    sa.Column('patient_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.String(length=50), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('slot_time', sa.String(length=50), nullable=True),
+    sa.Column('offer_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('appointment_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['appointment_id'], ['appointment.id'], ),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profile.id'], ),
+    sa.ForeignKeyConstraint(['patient_id'], ['patient_profile.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('waitlist_entry', schema=None) as batch_op:
+        batch_op.create_index('ix_waitlist_entry_patient_status', ['patient_id', 'status'], unique=False)
+        batch_op.create_index('ix_waitlist_entry_queue', ['doctor_id', 'date', 'status', 'created_at'], unique=False)
+        batch_op.create_index('ix_waitlist_entry_status_expires', ['status', 'offer_expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('waitlist_entry', schema=None) as batch_op:
+        batch_op.drop_index('ix_waitlist_entry_status_expires')
+        batch_op.drop_index('ix_waitlist_entry_queue')
+        batch_op.drop_index('ix_waitlist_entry_patient_status')
+
+    op.drop_table('waitlist_entry')
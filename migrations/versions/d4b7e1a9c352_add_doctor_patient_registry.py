@@ -0,0 +1,64 @@
+"""Add the doctor-patient registry and fill it from existing appointments
+
+Revision ID: d4b7e1a9c352
+Revises: 8e2f4a6c1b93
+Create Date: 2026-10-19 17:05:41.902715
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b7e1a9c352'
+down_revision = '8e2f4a6c1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('doctor_patient',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('first_visit', sa.String(length=50), nullable=True),
+    sa.Column('last_visit', sa.String(length=50), nullable=True),
+    sa.Column('visit_count', sa.Integer(), nullable=True),
+    sa.Column('last_appointment_id', sa.Integer(), nullable=True),
+    sa.Column('last_status', sa.String(length=20), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profile.id'], ),
+    sa.ForeignKeyConstraint(['patient_id'], ['patient_profile.id'], ),
+    sa.ForeignKeyConstraint(['last_appointment_id'], ['appointment.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'patient_id')
+    )
+    with op.batch_alter_table('doctor_patient', schema=None) as batch_op:
+        batch_op.create_index('ix_doctor_patient_doctor_last_visit', ['doctor_id', 'last_visit'], unique=False)
+
+    # Same values as app.registry.refresh_pair; flask registry rebuild recomputes them
+    op.execute("""
+        INSERT INTO doctor_patient
+            (doctor_id, patient_id, visit_count, first_visit, last_visit, last_appointment_id, updated_at)
+        SELECT a.doctor_id, a.patient_id,
+               SUM(CASE WHEN a.status != 'cancelled' THEN 1 ELSE 0 END),
+               MIN(CASE WHEN a.status != 'cancelled' THEN a.date END),
+               MAX(CASE WHEN a.status != 'cancelled' THEN a.date END),
+               (SELECT l.id FROM appointment l
+                WHERE l.doctor_id = a.doctor_id AND l.patient_id = a.patient_id
+                ORDER BY CASE WHEN l.status = 'cancelled' THEN 1 ELSE 0 END, l.date DESC, l.time DESC, l.id DESC
+                LIMIT 1),
+               CURRENT_TIMESTAMP
+        FROM appointment a
+        WHERE a.doctor_id IS NOT NULL AND a.patient_id IS NOT NULL
+        GROUP BY a.doctor_id, a.patient_id
+    """)
+    op.execute("""
+        UPDATE doctor_patient SET last_status =
+            (SELECT status FROM appointment WHERE appointment.id = doctor_patient.last_appointment_id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('doctor_patient', schema=None) as batch_op:
+        batch_op.drop_index('ix_doctor_patient_doctor_last_visit')
+
+    op.drop_table('doctor_patient')
@@ -0,0 +1,48 @@
+"""Tie reviews to appointments and keep review totals on doctor_profile
+
+Revision ID: f2a8c6d4e719
+Revises: d4b7e1a9c352
+Create Date: 2026-10-19 18:22:06.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8c6d4e719'
+down_revision = 'd4b7e1a9c352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('appointment_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_review_appointment_id', 'appointment', ['appointment_id'], ['id'])
+        batch_op.create_unique_constraint('uq_review_appointment', ['appointment_id'])
+        batch_op.create_index('ix_review_patient_created', ['patient_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('doctor_profile', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('review_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), nullable=True))
+
+    # Same as app.reviews.recount_reviews; updated_at is kept so cached profile fragments stay valid
+    op.execute("""
+        UPDATE doctor_profile SET
+            review_count = (SELECT COUNT(review.id) FROM review WHERE review.doctor_id = doctor_profile.id),
+            rating_sum = (SELECT COALESCE(SUM(review.rating), 0) FROM review WHERE review.doctor_id = doctor_profile.id),
+            updated_at = updated_at
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('doctor_profile', schema=None) as batch_op:
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('review_count')
+
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.drop_index('ix_review_patient_created')
+        batch_op.drop_constraint('uq_review_appointment', type_='unique')
+        batch_op.drop_constraint('fk_review_appointment_id', type_='foreignkey')
+        batch_op.drop_column('appointment_id')